@@ -14,6 +14,10 @@ setup(
     entry_points={
         "console_scripts": [
             "run-agent=daemon:main",
+            "backfill-entry-prices=backfill_entry_prices:main",
+            "backfill-metrics=backfill_metrics:main",
+            "maintain-metrics=maintain_metrics:main",
+            "benchmark-db=benchmark_database:main",
             "clean-db=script_limpiar_recomendaciones:main",
         ],
     },
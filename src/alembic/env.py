@@ -15,6 +15,10 @@ from models.wallet import Wallet
 from models.position import Position
 from models.metric import PositionMetric
 from models.recommendation import Recommendation
+from models.block_timestamp import BlockTimestamp
+from models.backfill_checkpoint import BackfillCheckpoint
+from models.metric_rollup import PositionMetricHourly, PositionMetricDaily, PositionMetricWeekly
+from models.maintenance_marker import MaintenanceMarker
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,35 @@
+"""Add state fingerprint to recommendations
+
+Revision ID: 11c6bfdc2f5a
+Revises: e4fbcfccffb5
+Create Date: 2026-10-17 03:02:25.217178
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '11c6bfdc2f5a'
+down_revision: Union[str, Sequence[str], None] = 'e4fbcfccffb5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # SQLite no permite añadir claves foráneas con ALTER; se usa el modo batch.
+    with op.batch_alter_table('recommendations') as batch_op:
+        batch_op.add_column(sa.Column('state_fingerprint', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('reused_from_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_recommendations_reused_from_id', 'recommendations', ['reused_from_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('recommendations') as batch_op:
+        batch_op.drop_constraint('fk_recommendations_reused_from_id', type_='foreignkey')
+        batch_op.drop_column('reused_from_id')
+        batch_op.drop_column('state_fingerprint')
@@ -0,0 +1,50 @@
+"""Add latest metric pointer and composite indexes
+
+Revision ID: 37ad76e354e7
+Revises: 5e23b3ad14e4
+Create Date: 2026-10-17 03:20:33.389279
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '37ad76e354e7'
+down_revision: Union[str, Sequence[str], None] = '5e23b3ad14e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_position_metrics_position_id_snapshot_at', 'position_metrics', ['position_id', 'snapshot_at'], unique=False)
+    op.create_index('ix_position_metrics_snapshot_at', 'position_metrics', ['snapshot_at'], unique=False)
+    op.create_index('ix_positions_wallet_id_id', 'positions', ['wallet_id', 'id'], unique=False)
+    with op.batch_alter_table('positions') as batch_op:
+        batch_op.add_column(sa.Column('latest_metric_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_positions_latest_metric_id', 'position_metrics', ['latest_metric_id'], ['id'])
+
+    # Las posiciones existentes apuntan a su métrica más reciente.
+    op.execute(
+        """
+        UPDATE positions SET latest_metric_id = (
+            SELECT position_metrics.id FROM position_metrics
+            WHERE position_metrics.position_id = positions.id
+            ORDER BY position_metrics.snapshot_at DESC, position_metrics.id DESC
+            LIMIT 1
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('positions') as batch_op:
+        batch_op.drop_constraint('fk_positions_latest_metric_id', type_='foreignkey')
+        batch_op.drop_column('latest_metric_id')
+    op.drop_index('ix_positions_wallet_id_id', table_name='positions')
+    op.drop_index('ix_position_metrics_snapshot_at', table_name='position_metrics')
+    op.drop_index('ix_position_metrics_position_id_snapshot_at', table_name='position_metrics')
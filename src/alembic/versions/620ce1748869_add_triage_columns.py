@@ -0,0 +1,32 @@
+"""Add triage columns to wallets and recommendations
+
+Revision ID: 620ce1748869
+Revises: 11c6bfdc2f5a
+Create Date: 2026-10-17 05:12:40.381522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '620ce1748869'
+down_revision: Union[str, Sequence[str], None] = '11c6bfdc2f5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('wallets', sa.Column('il_alert_threshold_percent', sa.Float(), nullable=True))
+    op.add_column('recommendations', sa.Column('decision_source', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('recommendations') as batch_op:
+        batch_op.drop_column('decision_source')
+    with op.batch_alter_table('wallets') as batch_op:
+        batch_op.drop_column('il_alert_threshold_percent')
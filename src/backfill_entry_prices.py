@@ -0,0 +1,74 @@
+# src/backfill_entry_prices.py
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+import argparse
+import logging
+
+from core.database import SessionLocal, begin_write
+from models.position import Position
+from modules.subgraph_client import get_subgraph_client
+from modules.entry_prices import apply_entry_prices, lookup_entry_prices
+from modules.rate_limit import BACKGROUND, request_lane
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def backfill_entry_prices(batch_size: int = 200) -> int:
+    """
+    Rellena el precio, bloque y timestamp de entrada de las posiciones existentes
+    que se crearon antes de guardarlos. Procesa por lotes y confirma cada lote,
+    así que puede interrumpirse y relanzarse sin repetir trabajo.
+    """
+    db = SessionLocal()
+    last_id = 0
+    total_resolved = 0
+    try:
+        while True:
+            positions = (
+                db.query(Position)
+                .filter(Position.entry_price.is_(None), Position.id > last_id)
+                .order_by(Position.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not positions:
+                break
+            last_id = positions[-1].id
+
+            # Las consultas de red van antes de abrir la transacción de escritura del lote.
+            entry_timestamps = {pos.id: pos.entry_timestamp for pos in positions}
+            without_timestamp = [pos.token_id for pos in positions if not pos.entry_timestamp]
+            if without_timestamp:
+                creation_data = get_subgraph_client().get_positions_creation_data(without_timestamp)
+                for pos in positions:
+                    data = creation_data.get(pos.token_id)
+                    if not pos.entry_timestamp and data and data["timestamp"]:
+                        entry_timestamps[pos.id] = data["timestamp"]
+            entry_prices = lookup_entry_prices((pos.pool_address, entry_timestamps[pos.id]) for pos in positions)
+
+            begin_write(db)
+            for pos in positions:
+                pos.entry_timestamp = entry_timestamps[pos.id]
+            total_resolved += apply_entry_prices(positions, entry_prices)
+            db.commit()
+            logger.info(f"Lote hasta la posición {last_id} procesado. Resueltas hasta ahora: {total_resolved}")
+    except Exception as e:
+        logger.error(f"Error durante el backfill de precios de entrada: {e}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
+
+    logger.info(f"Backfill finalizado. Posiciones con precio de entrada nuevo: {total_resolved}")
+    return total_resolved
+
+def main():
+    parser = argparse.ArgumentParser(description="Rellena el precio de entrada de las posiciones existentes.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Posiciones procesadas por lote.")
+    args = parser.parse_args()
+    with request_lane(BACKGROUND):
+        backfill_entry_prices(batch_size=args.batch_size)
+
+if __name__ == "__main__":
+    main()
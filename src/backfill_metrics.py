@@ -0,0 +1,208 @@
+# src/backfill_metrics.py
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+import math
+import time
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert
+
+from core.config import settings
+from core.database import SessionLocal, begin_write
+from models import Wallet, Position, PositionMetric, BackfillCheckpoint
+from modules.subgraph_client import get_subgraph_client
+from modules.entry_prices import apply_entry_prices, lookup_entry_prices
+from modules.metric_replay import compute_replay_metrics, align_prices
+from modules.metric_rollups import update_rollups
+from modules.position_sync import update_latest_metrics
+from modules.rate_limit import BACKGROUND, current_lane, request_lane
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _first_live_snapshots(db_session, position_ids: List[int]) -> Dict[int, int]:
+    """Primer snapshot del daemon por posición (unix), para no solapar el replay con datos reales."""
+    rows = (
+        db_session.query(PositionMetric.position_id, func.min(PositionMetric.snapshot_at))
+        .filter(PositionMetric.position_id.in_(position_ids))
+        .group_by(PositionMetric.position_id)
+    )
+    first = {}
+    for position_id, snapshot_at in rows:
+        if isinstance(snapshot_at, str): # SQLite devuelve el agregado sin convertir.
+            snapshot_at = datetime.fromisoformat(snapshot_at)
+        if snapshot_at is not None:
+            if snapshot_at.tzinfo is None:
+                snapshot_at = snapshot_at.replace(tzinfo=timezone.utc)
+            first[position_id] = int(snapshot_at.timestamp())
+    return first
+
+def backfill_pool(pool_id: str, position_ids: List[int], granularity: str, page_size: Optional[int] = None) -> int:
+    """
+    Reconstruye el histórico de métricas de las posiciones de un pool. Recorre el
+    histórico del pool por páginas, inserta las métricas de cada página con un único
+    INSERT masivo (y sus agregados) y confirma junto con los checkpoints, así que una interrupción
+    solo repite la página en curso. Las consultas al Subgraph de cada página se hacen
+    antes de abrir su transacción de escritura. Devuelve el número de snapshots insertados.
+    """
+    db = SessionLocal()
+    subgraph_client = get_subgraph_client()
+    inserted = 0
+    try:
+        positions = db.query(Position).filter(Position.id.in_(position_ids)).order_by(Position.id).all()
+        checkpoints = {
+            checkpoint.position_id: checkpoint
+            for checkpoint in db.query(BackfillCheckpoint).filter(
+                BackfillCheckpoint.position_id.in_(position_ids), BackfillCheckpoint.granularity == granularity
+            )
+        }
+        first_live = _first_live_snapshots(db, [pos.id for pos in positions if pos.id not in checkpoints])
+        creation_data = subgraph_client.get_positions_creation_data(pos.token_id for pos in positions)
+        entry_timestamps = {
+            pos.id: pos.entry_timestamp or (creation_data.get(pos.token_id) or {}).get("timestamp") for pos in positions
+        }
+        entry_prices = lookup_entry_prices(
+            (pos.pool_address, entry_timestamps[pos.id]) for pos in positions if pos.entry_price is None
+        )
+
+        begin_write(db)
+        for pos in positions:
+            if not pos.entry_timestamp and entry_timestamps[pos.id]:
+                pos.entry_timestamp = entry_timestamps[pos.id]
+        apply_entry_prices(positions, entry_prices)
+        now = int(time.time())
+        replay = []
+        for pos in positions:
+            liquidity = (creation_data.get(pos.token_id) or {}).get("liquidity", 0)
+            if not pos.entry_timestamp or not liquidity:
+                logger.info(f"Posición {pos.token_id}: sin timestamp de creación o sin liquidez. Se omite.")
+                continue
+            checkpoint = checkpoints.get(pos.id)
+            if checkpoint is None:
+                checkpoint = BackfillCheckpoint(
+                    position_id=pos.id, granularity=granularity,
+                    replay_until=first_live.get(pos.id, now), last_period_start=0, fees_usd_accumulated=0.0
+                )
+                db.add(checkpoint)
+                checkpoints[pos.id] = checkpoint
+            if checkpoint.last_period_start >= checkpoint.replay_until:
+                continue
+            replay.append({
+                "position_id": pos.id,
+                "tick_lower": int(pos.tick_lower),
+                "tick_upper": int(pos.tick_upper),
+                "liquidity": liquidity,
+                "entry_price": pos.entry_price,
+                "creation_timestamp": pos.entry_timestamp,
+                "after": max(checkpoint.last_period_start, pos.entry_timestamp - 1),
+                "until": checkpoint.replay_until,
+                "fees_usd": checkpoint.fees_usd_accumulated,
+            })
+        db.commit()
+        if not replay:
+            return 0
+
+        pool = subgraph_client.get_pools_metadata([pool_id]).get(pool_id.lower())
+        if not pool:
+            logger.warning(f"Pool {pool_id} no encontrado en el Subgraph. Se omite.")
+            return 0
+        decimals0, decimals1 = int(pool["token0"]["decimals"]), int(pool["token1"]["decimals"])
+
+        start = min(p["after"] for p in replay)
+        end = max(p["until"] for p in replay)
+        last_token1_price = None
+        for page in subgraph_client.iter_pool_history(pool_id, start, end, granularity, page_size):
+            period_starts = [row["periodStart"] for row in page]
+            token1_prices = subgraph_client.get_token_price_history(
+                pool["token1"]["id"], period_starts[0] - 1, period_starts[-1], granularity
+            )
+            token1_prices_usd = align_prices(period_starts, token1_prices, last_token1_price)
+            if len(token1_prices_usd) and not math.isnan(token1_prices_usd[-1]):
+                last_token1_price = float(token1_prices_usd[-1])
+
+            rows, progress = compute_replay_metrics(replay, page, token1_prices_usd, decimals0, decimals1)
+            begin_write(db)
+            if rows:
+                returned = db.execute(
+                    insert(PositionMetric).returning(PositionMetric.id, PositionMetric.position_id, PositionMetric.snapshot_at),
+                    rows,
+                ).all()
+                update_latest_metrics(db, returned)
+                update_rollups(db, rows)
+            for p in replay:
+                if p["position_id"] in progress:
+                    last_period, fees_usd = progress[p["position_id"]]
+                    p["after"], p["fees_usd"] = last_period, fees_usd
+                    checkpoint = checkpoints[p["position_id"]]
+                    checkpoint.last_period_start, checkpoint.fees_usd_accumulated = last_period, fees_usd
+            db.commit()
+            inserted += len(rows)
+            logger.info(f"Pool {pool_id}: {len(rows)} snapshots insertados hasta {period_starts[-1]}.")
+
+        # El histórico disponible terminó: las posiciones quedan completas hasta su límite.
+        begin_write(db)
+        for p in replay:
+            checkpoints[p["position_id"]].last_period_start = p["until"]
+        db.commit()
+        return inserted
+    except Exception as e:
+        logger.error(f"Error en el backfill del pool {pool_id}: {e}", exc_info=True)
+        db.rollback()
+        return inserted
+    finally:
+        db.close()
+
+def backfill_metrics(
+    granularity: str = "hour", wallet_address: Optional[str] = None,
+    workers: Optional[int] = None, page_size: Optional[int] = None
+) -> int:
+    """Lanza el backfill de todas las posiciones (o de una wallet), en paralelo por pool."""
+    db = SessionLocal()
+    try:
+        query = db.query(Position.id, Position.pool_address)
+        if wallet_address:
+            query = query.join(Wallet, Position.wallet_id == Wallet.id).filter(Wallet.address.ilike(wallet_address))
+        positions_by_pool = defaultdict(list)
+        for position_id, pool_address in query:
+            positions_by_pool[pool_address].append(position_id)
+    finally:
+        db.close()
+
+    if not positions_by_pool:
+        logger.warning("No hay posiciones que reconstruir."); return 0
+
+    workers = max(1, min(workers or settings.BACKFILL_CONCURRENCY, len(positions_by_pool)))
+    logger.info(f"Backfill ({granularity}) de {sum(map(len, positions_by_pool.values()))} posiciones en {len(positions_by_pool)} pools, {workers} en paralelo.")
+    started_at = time.monotonic()
+    lane = current_lane() # Los hilos no heredan el carril de prioridad del llamador.
+
+    def run(item):
+        with request_lane(lane):
+            return backfill_pool(item[0], item[1], granularity, page_size)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+        results = list(executor.map(run, positions_by_pool.items()))
+    total = sum(results)
+    logger.info(f"Backfill finalizado en {time.monotonic() - started_at:.1f}s: {total} snapshots insertados.")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye el histórico de métricas de las posiciones desde su creación.")
+    parser.add_argument("--granularity", choices=["hour", "day"], default="hour", help="Resolución del histórico.")
+    parser.add_argument("--wallet", default=None, help="Limita el backfill a las posiciones de esta wallet.")
+    parser.add_argument("--workers", type=int, default=None, help="Pools procesados en paralelo.")
+    parser.add_argument("--page-size", type=int, default=None, help="Periodos por consulta al Subgraph.")
+    args = parser.parse_args()
+    # Carril de fondo: si comparte proceso o proveedor con el escaneo en vivo, le cede el paso.
+    with request_lane(BACKGROUND):
+        backfill_metrics(granularity=args.granularity, wallet_address=args.wallet, workers=args.workers, page_size=args.page_size)
+
+if __name__ == "__main__":
+    main()
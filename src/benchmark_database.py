@@ -0,0 +1,151 @@
+# src/benchmark_database.py
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+import time
+import random
+import argparse
+import logging
+import tempfile
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from core.database import begin_write, create_database_engine
+from models import Base, Wallet, Position, PositionMetric
+from modules.block_cache import BlockTimestampCache
+from modules.metric_rollups import update_rollups
+from modules.position_sync import update_latest_metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _seed(session_factory, writers: int, positions_per_writer: int):
+    """Crea una wallet sintética por escritor con sus posiciones; devuelve los ids de posición por escritor."""
+    db = session_factory()
+    try:
+        suffix = f"{time.time_ns():x}"
+        wallets = [Wallet(address=f"0xbench{suffix}{i:04x}", is_active=False) for i in range(writers)]
+        db.add_all(wallets)
+        db.flush()
+        position_ids = []
+        for index, wallet in enumerate(wallets):
+            rows = [
+                {
+                    "token_id": -(int(suffix, 16) % 10**9 * 10**6 + index * positions_per_writer + j + 1),
+                    "wallet_id": wallet.id, "pool_address": "0xbench",
+                    "token0_symbol": "USDC", "token1_symbol": "WETH", "tick_lower": "-200000", "tick_upper": "-190000",
+                }
+                for j in range(positions_per_writer)
+            ]
+            position_ids.append([position_id for (position_id,) in db.execute(insert(Position).returning(Position.id), rows)])
+        db.commit()
+        return position_ids
+    finally:
+        db.close()
+
+def _scan_cycle(session_factory, block_cache, timestamps, position_ids, latencies, errors, lock):
+    """
+    Un ciclo de escaneo sintético, en el mismo orden que `sync_positions_bulk`:
+    lectura previa, búsqueda de bloques de entrada en la caché (que escribe los
+    nuevos desde su propia sesión, como en el daemon), `begin_write`, INSERT masivo
+    de métricas, puntero de última métrica, agregados y commit.
+    """
+    db = session_factory()
+    try:
+        started_at = time.perf_counter()
+        db.query(Position.id).filter(Position.id.in_(position_ids)).all()
+        with lock:
+            new_timestamps = [next(timestamps) for _ in range(5)]
+        block_cache.get_many(new_timestamps)
+        begin_write(db)
+        snapshot_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "position_id": position_id, "snapshot_at": snapshot_at,
+                "current_price": 2000 + random.random(), "price_lower": 1800.0, "price_upper": 2200.0,
+                "is_in_range": True, "impermanent_loss_percent": -random.random(),
+                "unclaimed_fees_usd": random.random() * 100, "real_apr_percent": random.random() * 50,
+            }
+            for position_id in position_ids
+        ]
+        inserted = db.execute(insert(PositionMetric).returning(PositionMetric.id, PositionMetric.position_id), rows).all()
+        update_latest_metrics(db, [(metric_id, position_id, snapshot_at) for metric_id, position_id in inserted])
+        update_rollups(db, rows)
+        commit_started_at = time.perf_counter()
+        db.commit()
+        finished_at = time.perf_counter()
+        with lock:
+            latencies["commit"].append(finished_at - commit_started_at)
+            latencies["cycle"].append(finished_at - started_at)
+    except OperationalError as e:
+        db.rollback()
+        with lock:
+            errors.append(str(e.orig))
+    finally:
+        db.close()
+
+def _percentiles_ms(values) -> str:
+    if not values:
+        return "sin datos"
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms max={max(values) * 1000:.1f}ms"
+
+def run_benchmark(database_url: str, writers: int, cycles: int, positions_per_writer: int) -> dict:
+    """Lanza `writers` hilos que escriben `cycles` ciclos cada uno y resume la latencia de commit."""
+    engine = create_database_engine(database_url)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    position_ids = _seed(session_factory, writers, positions_per_writer)
+
+    latencies, errors, lock = {"commit": [], "cycle": []}, [], threading.Lock()
+    # Resolutor sintético: la caché persiste cada timestamp nuevo con un INSERT desde otra sesión.
+    block_cache = BlockTimestampCache(resolver=lambda ts: ts // 12, session_factory=session_factory)
+    timestamps = itertools.count(int(time.time()) * 1000)
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix="bench") as executor:
+        futures = [
+            executor.submit(
+                _scan_cycle, session_factory, block_cache, timestamps, position_ids[writer], latencies, errors, lock
+            )
+            for _ in range(cycles) for writer in range(writers)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started_at
+    engine.dispose()
+
+    logger.info(f"Backend: {engine.url.get_backend_name()} | {writers} escritores x {cycles} ciclos x {positions_per_writer} posiciones")
+    logger.info(f"Commit: {_percentiles_ms(latencies['commit'])}")
+    logger.info(f"Ciclo completo: {_percentiles_ms(latencies['cycle'])}")
+    logger.info(f"Ciclos confirmados: {len(latencies['commit'])}/{writers * cycles} en {elapsed:.2f}s, {len(errors)} errores.")
+    for message in sorted(set(errors)):
+        logger.warning(f"Error: {message}")
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide la latencia de commit de la base de datos bajo escaneos concurrentes.")
+    parser.add_argument(
+        "--database-url", default=None,
+        help="Base de datos de pruebas (escribe datos sintéticos). Por defecto, un SQLite temporal."
+    )
+    parser.add_argument("--writers", type=int, default=8, help="Hilos escribiendo a la vez (como SCAN_CONCURRENCY).")
+    parser.add_argument("--cycles", type=int, default=20, help="Ciclos por escritor.")
+    parser.add_argument("--positions", type=int, default=50, help="Posiciones por escritor y ciclo.")
+    args = parser.parse_args()
+
+    if args.database_url:
+        run_benchmark(args.database_url, args.writers, args.cycles, args.positions)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run_benchmark(f"sqlite:///{os.path.join(directory, 'benchmark.db')}", args.writers, args.cycles, args.positions)
+
+if __name__ == "__main__":
+    main()
@@ -12,12 +12,43 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 class Settings(BaseSettings):
     # --- Database ---
     DATABASE_URL: str = f"sqlite:///{os.path.join(PROJECT_ROOT, 'src/data/agent.db')}"
+    # Perfil SQLite
+    SQLITE_BUSY_TIMEOUT_MS: int = 30000 # Espera máxima por el bloqueo de escritura.
+    SQLITE_SYNCHRONOUS: str = "NORMAL" # Seguro con WAL; "FULL" hace fsync en cada commit.
+    SQLITE_MMAP_SIZE_BYTES: int = 268435456
+    SQLITE_BEGIN_IMMEDIATE: bool = True # Reserva el bloqueo de escritura al empezar cada transacción.
+    # Perfil PostgreSQL
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT_SECONDS: int = 30
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+    DATABASE_STATEMENT_TIMEOUT_MS: int = 60000
+    DATABASE_INSERT_PAGE_SIZE: int = 1000 # Filas por sentencia en los INSERT/UPDATE masivos.
 
     # --- Scheduler ---
     SCAN_INTERVAL_SECONDS: int = 3600
+    MONITOR_MODE: str = "interval" # "interval" = escaneo completo periódico; "stream" = además, sigue los bloques nuevos.
+    STREAM_BLOCK_SOURCE: Optional[str] = None # "subgraph", "rpc" o "fixture". None = "subgraph" ("fixture" en modo mock).
+    STREAM_POLL_SECONDS: int = 12 # Un bloque de Ethereum.
+    STREAM_MAX_BLOCK_RANGE: int = 500 # Bloques por consulta eth_getLogs.
+    STREAM_REEVALUATE_TICK_DELTA: int = 200 # Movimiento (en ticks, ~2%) que fuerza re-evaluar todo el pool.
+    STREAM_FIXTURE_PATH: Optional[str] = None # Logs grabados para la fuente "fixture". None = src/data/mock_swap_logs.json.
+    SCAN_CONCURRENCY: int = 8 # Wallets escaneadas en paralelo. 1 = modo secuencial.
+    BACKFILL_CONCURRENCY: int = 4 # Pools reconstruidos en paralelo por `backfill-metrics`.
+    # Retención de métricas: las antiguas quedan solo en los agregados por hora, día y semana.
+    METRICS_RAW_RETENTION_DAYS: int = 30
+    METRICS_HOURLY_RETENTION_DAYS: int = 180 # Los agregados diarios y semanales se conservan siempre.
+    METRICS_COMPACTION_HOUR: int = 3 # Hora (UTC) de la compactación diaria del daemon.
+    METRICS_COMPACTION_BATCH_SIZE: int = 5000 # Filas borradas por transacción.
+    COLLECTION_ONLY: bool = False # Solo recoge métricas; nunca carga el modelo LLM.
 
     # --- The Graph ---
     THEGRAPH_PROJECT_QUERY_URL: Optional[str] = None
+    THEGRAPH_MAX_REQUESTS_PER_SECOND: float = 10.0 # Ritmo máximo hacia el Subgraph (0 = sin límite).
+    SUBGRAPH_PAGE_SIZE: int = 1000 # Máximo permitido por The Graph para `first`.
+    SUBGRAPH_OWNERS_PER_QUERY: int = 50 # Wallets agrupadas en cada consulta `owner_in`.
+    SUBGRAPH_HISTORICAL_BATCH_SIZE: int = 50 # Pares (pool, bloque) por consulta histórica con alias.
+    POOL_METADATA_TTL_SECONDS: int = 86400 # Vigencia en memoria de símbolos, decimales y fee tier de cada pool.
 
     # --- Development ---
     DEV_MODE_MOCK_API: bool = False
@@ -25,15 +56,59 @@ class Settings(BaseSettings):
     # --- AI Agent ---
     MODEL_PATH: str = os.path.join(PROJECT_ROOT, "models/llm/qwen3-4b-q8_0.gguf")
     N_GPU_LAYERS: int = 0
+    INFERENCE_WORKERS: int = 0 # Procesos de inferencia en segundo plano. 0 = inferencia en línea.
+    INFERENCE_THREADS_PER_WORKER: int = 0 # 0 = repartir los núcleos disponibles entre los workers.
+    LLM_GENERATION_MODE: str = "grammar" # "grammar" = razonamiento acotado + JSON restringido; "free" = modo original.
+    LLM_THINKING_TOKEN_BUDGET: int = 256 # Tokens máximos de <thinking> en modo "grammar".
+    LLM_ANSWER_MAX_TOKENS: int = 256 # Tokens máximos del JSON final en modo "grammar".
+    PROMPT_CACHE_DIR: Optional[str] = None # Directorio para persistir el estado KV del prefijo. None = solo en memoria.
+    # Reutilización de recomendaciones cuando el estado de la posición no cambia.
+    RECOMMENDATION_PRICE_BUCKETS: int = 5 # Tramos de la posición del precio dentro del rango.
+    RECOMMENDATION_IL_BUCKET_PERCENT: float = 1.0
+    RECOMMENDATION_APR_BUCKET_PERCENT: float = 10.0
+    RECOMMENDATION_MAX_AGE_SECONDS: int = 86400 # Antigüedad máxima antes de forzar una nueva inferencia.
+    # Triaje por reglas antes del LLM: solo los casos ambiguos llegan al modelo.
+    TRIAGE_ENABLED: bool = True
+    TRIAGE_IN_RANGE_MARGIN: float = 0.2 # Fracción del rango a cada lado que no cuenta como "bien dentro".
+    TRIAGE_NEGLIGIBLE_IL_PERCENT: float = 0.5
+    TRIAGE_FAR_OUT_OF_RANGE_PERCENT: float = 5.0 # Distancia al límite más cercano, en % del precio.
+    TRIAGE_IL_ALERT_PERCENT: float = 5.0 # Umbral por defecto si la wallet no define el suyo.
     
     # --- Blockchain ---
     CHAIN: str = "eth"
+    ETH_RPC_URL: Optional[str] = None # Nodo JSON-RPC para la fuente de bloques "rpc".
+    ETH_RPC_MAX_REQUESTS_PER_SECOND: float = 20.0
+    MORALIS_API_KEY: Optional[str] = None
+    MORALIS_API_URL: str = "https://deep-index.moralis.io/api/v2.2"
+    MORALIS_MAX_REQUESTS_PER_SECOND: float = 20.0
+
+    # --- HTTP saliente (The Graph, Etherscan, Moralis, nodo RPC) ---
+    HTTP_POOL_MAXSIZE: int = 32 # Conexiones keep-alive por host; al menos SCAN_CONCURRENCY.
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0 # Corto: un host caído se detecta sin esperar el timeout de lectura.
+    HTTP_READ_TIMEOUT_SECONDS: float = 30.0
+    HTTP_MAX_RETRIES: int = 3 # Reintentos de errores de red, 429 y 5xx.
+    HTTP_BACKOFF_BASE_SECONDS: float = 0.5 # Espera máxima del primer reintento; se dobla en cada intento (con jitter).
+    HTTP_BACKOFF_MAX_SECONDS: float = 30.0
+    HTTP_CIRCUIT_FAILURE_THRESHOLD: int = 5 # Fallos seguidos que abren el circuito de un host.
+    HTTP_CIRCUIT_RESET_SECONDS: float = 60.0 # Tiempo con el circuito abierto antes de una petición de prueba.
+    # Limitador por proveedor (los ritmos máximos van en cada sección).
+    RATE_LIMIT_BURST_SECONDS: float = 1.0 # Ráfaga permitida, en segundos de ritmo máximo.
+    RATE_LIMIT_MIN_FRACTION: float = 0.1 # Ritmo mínimo tras varios 429, como fracción del máximo.
+    RATE_LIMIT_RECOVERY_SECONDS: float = 60.0 # Tiempo para volver del mínimo al máximo sin nuevos 429.
+    RATE_LIMIT_BACKGROUND_SHARE: float = 0.5 # Fracción del ritmo que puede usar el carril de fondo (backfill).
 
     # --- Notifications ---
     TELEGRAM_BOT_TOKEN: Optional[str] = None
     TELEGRAM_CHAT_ID: Optional[str] = None
+    TELEGRAM_GLOBAL_MESSAGES_PER_SECOND: float = 30.0 # Límite global de la API de bots.
+    TELEGRAM_CHAT_MESSAGES_PER_SECOND: float = 1.0 # Límite recomendado por chat.
+    TELEGRAM_MAX_RETRIES: int = 5
+    NOTIFIER_DIGEST_WINDOW_SECONDS: float = 10.0 # Las alertas de un chat se agrupan en un resumen durante esta ventana.
     
     ETHERSCAN_API_KEY: Optional[str] = None
+    ETHERSCAN_API_URL: str = "https://api.etherscan.io/api"
+    ETHERSCAN_MAX_REQUESTS_PER_SECOND: float = 4.0 # El límite del plan gratuito es 5 req/s.
+    BLOCK_CACHE_MAX_ENTRIES: int = 50000 # Tamaño del LRU en memoria timestamp→bloque.
 
 
     class Config:
@@ -1,6 +1,131 @@
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from core.config import settings
 
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+# Opción de ejecución que marca la conexión de una transacción de escritura (ver `begin_write`).
+WRITE_TRANSACTION_OPTION = "write_transaction"
+
+def _sqlite_engine_options(url) -> dict:
+    # El timeout del driver (segundos) coincide con el busy_timeout de SQLite.
+    return {"connect_args": {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}}
+
+def _configure_sqlite(engine):
+    """
+    Ajustes de SQLite para varios hilos escribiendo a la vez: WAL (los lectores no
+    bloquean al escritor), synchronous=NORMAL (seguro con WAL, sin fsync por commit),
+    busy_timeout y mmap. Con `SQLITE_BEGIN_IMMEDIATE` las transacciones abiertas con
+    `begin_write` reservan el bloqueo de escritura al empezar: una transacción que
+    lee y luego escribe ya no falla con "database is locked" al intentar promocionar
+    su bloqueo, sino que espera su turno dentro del busy_timeout. Las demás empiezan
+    con un BEGIN normal y, con WAL, no bloquean a nadie.
+    """
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        if settings.SQLITE_BEGIN_IMMEDIATE:
+            # pysqlite abre las transacciones por su cuenta; se desactiva para emitir BEGIN en `begin`.
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_BYTES)}")
+        cursor.close()
+
+    if settings.SQLITE_BEGIN_IMMEDIATE:
+        @event.listens_for(engine, "begin")
+        def _begin(connection):
+            options = connection.get_execution_options()
+            if options.get("isolation_level") == "AUTOCOMMIT": # p. ej. VACUUM
+                return
+            connection.exec_driver_sql("BEGIN IMMEDIATE" if options.get(WRITE_TRANSACTION_OPTION) else "BEGIN")
+
+def _postgresql_engine_options(url) -> dict:
+    options = {
+        "poolclass": QueuePool,
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+        # Los INSERT masivos (métricas, agregados) se agrupan en sentencias multi-VALUES.
+        "insertmanyvalues_page_size": settings.DATABASE_INSERT_PAGE_SIZE,
+        "connect_args": {"options": f"-c statement_timeout={int(settings.DATABASE_STATEMENT_TIMEOUT_MS)}"},
+    }
+    if url.get_driver_name() == "psycopg2":
+        # Los UPDATE tipo executemany (agregados, puntero de última métrica) van por lotes.
+        options["executemany_mode"] = "values_plus_batch"
+        options["executemany_batch_page_size"] = settings.DATABASE_INSERT_PAGE_SIZE
+    return options
+
+def create_database_engine(database_url: str):
+    """Crea el engine con el perfil del backend indicado por la URL (SQLite o PostgreSQL)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        engine = create_engine(url, **_sqlite_engine_options(url))
+        _configure_sqlite(engine)
+    elif backend == "postgresql":
+        engine = create_engine(url, **_postgresql_engine_options(url))
+    else:
+        logger.warning(f"Backend de base de datos sin perfil específico: {backend}. Se usan los valores por defecto.")
+        engine = create_engine(url)
+    return engine
+
+engine = create_database_engine(settings.DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def insert_ignore(model, bind=None):
+    """
+    Devuelve un INSERT que ignora las filas cuya clave ya existe
+    (`ON CONFLICT DO NOTHING`) en SQLite y PostgreSQL. Pensado para cachés y
+    escrituras masivas que pueden competir entre hilos de escaneo.
+    """
+    dialect = (bind or engine).dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing()
+
+
+def end_read_transaction(db_session):
+    """
+    Termina la transacción en curso de la sesión sin expirar los objetos cargados,
+    que siguen siendo utilizables sin volver a consultarlos. Se llama antes de una
+    espera larga (red, inferencia) para no retener una lectura abierta. Si la
+    transacción tenía cambios pendientes, se confirman.
+    """
+    if not db_session.in_transaction():
+        return
+    expire_on_commit = db_session.expire_on_commit
+    db_session.expire_on_commit = False
+    try:
+        db_session.commit()
+    finally:
+        db_session.expire_on_commit = expire_on_commit
+
+def begin_write(db_session):
+    """
+    Abre la transacción de escritura de la sesión; si ya hay una abierta, no hace
+    nada. Una transacción de lectura en curso se termina antes con
+    `end_read_transaction`. En SQLite empieza con BEGIN IMMEDIATE y retiene el
+    bloqueo de escritura hasta el commit, así que entre `begin_write` y el commit no
+    debe haber consultas de red, inferencia ni escrituras desde otra sesión: las
+    búsquedas que necesite la escritura se hacen antes.
+    """
+    if db_session.in_transaction():
+        if db_session.connection().get_execution_options().get(WRITE_TRANSACTION_OPTION):
+            return
+        end_read_transaction(db_session)
+    db_session.connection(execution_options={WRITE_TRANSACTION_OPTION: True})
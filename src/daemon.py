@@ -5,157 +5,535 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.'))
 
 import time
 import logging
-from apscheduler.schedulers.blocking import BlockingScheduler
+import argparse
+from collections import defaultdict
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from sqlalchemy.orm import joinedload
 
 from core.config import settings
-from core.database import SessionLocal
-from modules.subgraph_client import subgraph_client 
-from modules.qwen_agent import qwen_agent
-from modules.notifier import notifier, format_recommendation_for_telegram
-from models import Wallet, Position, PositionMetric, Recommendation
-from modules.calculations import (
-    calculate_impermanent_loss_simplified, 
-    calculate_unclaimed_fees_usd, 
-    calculate_real_apr
+from core.database import SessionLocal, end_read_transaction
+from modules.subgraph_client import get_subgraph_client
+from modules.position_sync import sync_positions_bulk, load_metrics, insert_recommendations, untrack_closed_positions
+from modules.qwen_agent import get_qwen_agent, build_prompt_context
+from modules.inference_service import create_inference_service
+from modules.recommendation_cache import (
+    compute_state_fingerprint,
+    find_reusable_recommendation,
+    load_last_recommendations,
+    load_origin_times
 )
+from modules.metric_rollups import compact_metrics
+from modules.range_index import get_range_index
+from modules.pool_cache import PoolStateCache
+from modules.http_transport import get_http_transport
+from modules.rate_limit import get_rate_limit_manager
+from modules.block_stream import create_block_source
+from modules.triage import ESCALATE_TO_LLM, load_wallet_il_thresholds, triage_metrics
+from modules.notifier import get_notifier, format_recommendation_for_telegram
+from models import Wallet, Position, PositionMetric, Recommendation
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def sync_position_from_subgraph(db_session, wallet: Wallet, api_position: dict):
+# Servicio de inferencia fuera de proceso (se crea en `main` si INFERENCE_WORKERS > 0).
+inference_service = None
+# Las recomendaciones generadas en segundo plano se guardan en un único hilo de persistencia.
+_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+_persist_closed = False # Se activa al detener el daemon; los resultados que lleguen después se descartan.
+_persist_lock = threading.Lock()
+_in_flight_positions = set()
+_in_flight_lock = threading.Lock()
+
+def persist_inference_result(metric_id: int, position_id: int, fingerprint: str, future: Future):
+    """Guarda y notifica una recomendación generada por el servicio de inferencia."""
+    db = SessionLocal()
+    try:
+        try:
+            ai_result = future.result()
+        except Exception as e:
+            logger.error(f"Error en el servicio de inferencia para la posición {position_id}: {e}")
+            ai_result = {"action": "GENERATION_ERROR", "justification": str(e), "raw_output": ""}
+
+        metric = load_metrics(db, [metric_id])[0]
+        recommendation = Recommendation(
+            metric=metric,
+            recommendation_action=ai_result["action"],
+            justification=ai_result["justification"],
+            raw_model_output=ai_result["raw_output"],
+            state_fingerprint=fingerprint,
+            decision_source="LLM"
+        )
+        message = None
+        if recommendation.recommendation_action != "MAINTAIN":
+            message = format_recommendation_for_telegram(recommendation)
+
+        insert_recommendations(db, [recommendation])
+        db.commit()
+        logger.info(f"Recomendación de la IA ('{ai_result['action']}') guardada para la posición {position_id}.")
+        if message:
+            get_notifier().send_telegram_message(message)
+    except Exception as e:
+        logger.error(f"No se pudo guardar la recomendación de la posición {position_id}: {e}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
+        with _in_flight_lock:
+            _in_flight_positions.discard(position_id)
+
+def schedule_persist(metric_id: int, position_id: int, fingerprint: str, future: Future):
+    """Callback del futuro de inferencia: encola el guardado salvo que el daemon se esté deteniendo."""
+    with _persist_lock:
+        if not _persist_closed:
+            _persist_executor.submit(persist_inference_result, metric_id, position_id, fingerprint, future)
+            return
+    logger.warning(f"Servicio detenido: se descarta la recomendación pendiente de la posición {position_id}.")
+    with _in_flight_lock:
+        _in_flight_positions.discard(position_id)
+
+def shutdown_persistence():
+    """Deja de aceptar resultados de inferencia y espera a que se guarden los ya encolados."""
+    global _persist_closed
+    with _persist_lock:
+        _persist_closed = True
+    _persist_executor.shutdown(wait=True)
+
+def submit_inference(metric: PositionMetric, fingerprint: str):
+    """Encola la métrica en el servicio de inferencia; el resultado se guarda al terminar."""
+    metric_id, position_id = metric.id, metric.position_id
+    with _in_flight_lock:
+        if position_id in _in_flight_positions:
+            logger.info(f"La posición {position_id} ya tiene una inferencia en curso. Se omite.")
+            return
+        _in_flight_positions.add(position_id)
+
+    future = inference_service.submit(build_prompt_context(metric))
+    future.add_done_callback(lambda f: schedule_persist(metric_id, position_id, fingerprint, f))
+
+def generate_recommendations(db_session, metrics: List[PositionMetric]) -> List[Recommendation]:
     """
-    Sincroniza una posición individual desde el Subgraph, calcula todas las métricas
-    financieras, genera una recomendación de IA y notifica si es necesario.
+    Genera una recomendación para cada métrica recién calculada. Si la huella de
+    estado coincide con la de la última recomendación de la posición y esta no es
+    demasiado antigua, se reutiliza sin invocar a la IA. Del resto, el triaje por
+    reglas decide los casos evidentes y solo los ambiguos van al modelo. Con el servicio de
+    inferencia activo, el resto se encola y se guarda en segundo plano, así que
+    solo se devuelven las recomendaciones disponibles de inmediato. La inferencia en
+    línea se hace con la transacción de la sesión ya cerrada.
     """
-    token_id = int(api_position.get('id'))
-        
-    db_position = db_session.query(Position).filter(Position.token_id == token_id).first()
-
-    if not db_position:
-        logger.info(f"Posición nueva encontrada (Token ID: {token_id}). Creando en la base de datos.")
-        db_position = Position(
-            token_id=token_id, wallet_id=wallet.id,
-            pool_address=api_position.get('pool', {}).get('id'),
-            token0_symbol=api_position.get('pool', {}).get('token0', {}).get('symbol'),
-            token1_symbol=api_position.get('pool', {}).get('token1', {}).get('symbol'),
-            tick_lower=api_position.get('tickLower', {}).get('tickIdx'),
-            tick_upper=api_position.get('tickUpper', {}).get('tickIdx'),
-        )
-        db_session.add(db_position)
-    
-    # --- 1. EXTRACCIÓN Y PREPARACIÓN DE DATOS ---
-    pool = api_position.get('pool', {})
-    token0 = pool.get('token0', {})
-    token1 = pool.get('token1', {})
-    eth_price_usd = api_position.get('ethPriceUSD', 0)
-
-    token0_price_usd = float(token0.get('derivedETH', 0)) * eth_price_usd
-    token1_price_usd = float(token1.get('derivedETH', 0)) * eth_price_usd
-    
-    current_price_ratio = float(pool.get('token0Price', 0))
-    price_lower = float(api_position.get('tickLower', {}).get('price0'))
-    price_upper = float(api_position.get('tickUpper', {}).get('price0'))
-    if price_lower > price_upper:
-        price_lower, price_upper = price_upper, price_lower
-    
-    # --- 2. CÁLCULOS FINANCIEROS AVANZADOS ---
-    
-    # Cálculo de Pérdida Impermanente (IL)
-    il_percent = 0.0
-    creation_timestamp = int(api_position.get("transaction", {}).get("timestamp", 0))
-    initial_price_ratio = subgraph_client.get_historical_pool_price(pool.get('id'), creation_timestamp)
-    if initial_price_ratio is not None:
-        il_percent = calculate_impermanent_loss_simplified(initial_price_ratio, current_price_ratio)
-
-    # Cálculo de Fees no Reclamados en USD
-    uncollected_fees_token0 = float(api_position.get('collectedFeesToken0', 0)) # Corregido
-    uncollected_fees_token1 = float(api_position.get('collectedFeesToken1', 0)) # Corregido
-    unclaimed_fees_usd = calculate_unclaimed_fees_usd(
-        uncollected_fees_token0, uncollected_fees_token1, token0_price_usd, token1_price_usd
-    )
-    
-    # Cálculo de APR Real (Fees vs IL)
-    deposited_token0 = float(api_position.get('depositedToken0', 0))
-    deposited_token1 = float(api_position.get('depositedToken1', 0))
-    total_liquidity_usd = (deposited_token0 * token0_price_usd) + (deposited_token1 * token1_price_usd)
-    real_apr = calculate_real_apr(
-        unclaimed_fees_usd, total_liquidity_usd, creation_timestamp, il_percent
-    )
-    
-    logger.info(
-        f"Métricas calculadas para {token_id}: IL={il_percent:.2f}%, "
-        f"Fees=${unclaimed_fees_usd:.2f}, APR={real_apr:.2f}%"
-    )
+    last_by_position = load_last_recommendations(db_session, (metric.position_id for metric in metrics))
+    origin_times = load_origin_times(db_session, last_by_position.values())
 
-    # --- 3. GUARDAR MÉTRICAS EN LA BASE DE DATOS ---
-    new_metric = PositionMetric(
-        position=db_position,
-        current_price=current_price_ratio,
-        price_lower=price_lower,
-        price_upper=price_upper,
-        is_in_range=(price_lower <= current_price_ratio <= price_upper),
-        impermanent_loss_percent=il_percent,
-        unclaimed_fees_usd=unclaimed_fees_usd,
-        real_apr_percent=real_apr
-    )
-    db_session.add(new_metric)
-    
-    # --- 4. GENERAR RECOMENDACIÓN DE IA Y NOTIFICAR ---
-    logger.info(f"Generando recomendación de IA para la posición {db_position.token_id}...")
-    ai_result = qwen_agent.generate_recommendation(new_metric) # Pasamos la métrica enriquecida
-    
-    new_recommendation = Recommendation(
-        metric=new_metric,
-        recommendation_action=ai_result["action"],
-        justification=ai_result["justification"],
-        raw_model_output=ai_result["raw_output"]
-    )
-    db_session.add(new_recommendation)
-    logger.info(f"Recomendación de la IA ('{ai_result['action']}') guardada.")
-    
-    # La lógica de notificación puede ser más inteligente en el futuro,
-    # pero por ahora se mantiene igual.
-    if new_recommendation.recommendation_action != "MAINTAIN":
-        message = format_recommendation_for_telegram(new_recommendation)
-        notifier.send_telegram_message(message)
+    recommendations = []
+    pending = [] # (métrica, huella) sin recomendación reutilizable.
+    for metric in metrics:
+        fingerprint = compute_state_fingerprint(metric)
+        cached = find_reusable_recommendation(last_by_position.get(metric.position_id), fingerprint, origin_times)
+        if cached is not None:
+            recommendations.append(Recommendation(
+                metric=metric,
+                recommendation_action=cached.recommendation_action,
+                justification=cached.justification,
+                raw_model_output=cached.raw_model_output,
+                state_fingerprint=fingerprint,
+                reused_from_id=cached.reused_from_id or cached.id,
+                decision_source="CACHE"
+            ))
+        else:
+            pending.append((metric, fingerprint))
+
+    # Los casos evidentes los decide el triaje por reglas; solo los ambiguos llegan al modelo.
+    if settings.TRIAGE_ENABLED and pending:
+        thresholds = load_wallet_il_thresholds(db_session, {metric.position.wallet_id for metric, _ in pending})
+        decisions = triage_metrics([metric for metric, _ in pending], thresholds)
     else:
-        logger.info(f"Acción 'MAINTAIN'. No se enviará notificación.")
+        decisions = [(ESCALATE_TO_LLM, None, None)] * len(pending)
+
+    to_infer = [] # (métrica, huella, contexto del prompt) para la inferencia en línea.
+    for (metric, fingerprint), (action, rule_name, rule_justification) in zip(pending, decisions):
+        if action != ESCALATE_TO_LLM:
+            recommendations.append(Recommendation(
+                metric=metric,
+                recommendation_action=action,
+                justification=rule_justification,
+                raw_model_output="",
+                state_fingerprint=fingerprint,
+                decision_source=f"RULE:{rule_name}"
+            ))
+            continue
+        if rule_name:
+            logger.info(f"La regla '{rule_name}' escala la posición {metric.position.token_id} al LLM: {rule_justification}")
+
+        if inference_service is not None:
+            submit_inference(metric, fingerprint)
+            continue
+
+        to_infer.append((metric, fingerprint, build_prompt_context(metric)))
+
+    if to_infer:
+        # El modelo tarda segundos por posición: no se retiene ninguna transacción mientras trabaja.
+        end_read_transaction(db_session)
+    for metric, fingerprint, context in to_infer:
+        logger.info(f"Generando recomendación de IA para la posición {metric.position.token_id}...")
+        ai_result = get_qwen_agent().generate_from_context(context)
+        recommendations.append(Recommendation(
+            metric=metric,
+            recommendation_action=ai_result["action"],
+            justification=ai_result["justification"],
+            raw_model_output=ai_result["raw_output"],
+            state_fingerprint=fingerprint,
+            decision_source="LLM"
+        ))
+
+    reused = sum(1 for rec in recommendations if rec.reused_from_id)
+    if reused:
+        logger.info(f"{reused}/{len(recommendations)} recomendaciones reutilizadas: el estado no cambió.")
+    by_rule = sum(1 for rec in recommendations if (rec.decision_source or "").startswith("RULE:"))
+    if by_rule:
+        logger.info(f"{by_rule}/{len(metrics)} posiciones decididas por el triaje de reglas sin invocar al LLM.")
+    return recommendations
+
+def persist_positions(db_session, wallets_by_owner: Dict[str, Wallet], api_positions: List[dict]) -> List[PositionMetric]:
+    """Guarda posiciones y métricas con la ruta masiva, confirma y devuelve las métricas cargadas."""
+    metric_ids = sync_positions_bulk(db_session, wallets_by_owner, api_positions)
+    db_session.commit()
+    return load_metrics(db_session, metric_ids)
+
+def recommend_and_notify(db_session, metrics: List[PositionMetric]):
+    """
+    Genera y guarda las recomendaciones de métricas ya confirmadas. Va en una
+    transacción aparte para no retener la escritura mientras trabaja el modelo.
+    """
+    if not metrics:
+        return
+    recommendations = generate_recommendations(db_session, metrics)
+    if not recommendations:
+        return
+
+    # Las recomendaciones reutilizadas ya se notificaron cuando se generaron.
+    # Los mensajes se preparan antes del commit, que expira los objetos cargados.
+    messages = []
+    for recommendation in recommendations:
+        if recommendation.reused_from_id:
+            continue
+        if recommendation.recommendation_action != "MAINTAIN":
+            messages.append(format_recommendation_for_telegram(recommendation))
+        else:
+            logger.info(f"Acción 'MAINTAIN' para la posición {recommendation.metric.position.token_id}. No se enviará notificación.")
+
+    insert_recommendations(db_session, recommendations)
+    db_session.commit()
+    logger.info(f"{len(recommendations)} recomendaciones guardadas.")
+    for message in messages:
+        get_notifier().send_telegram_message(message)
+
+def scan_wallet_batch(wallet_ids: List[int], pool_cache: PoolStateCache = None) -> int:
+    """
+    Unidad de trabajo de un ciclo: escanea un lote de wallets con una sola consulta
+    paginada al Subgraph y su propia sesión de base de datos. Cada página se guarda
+    de forma masiva; si falla, se repite wallet por wallet para que el error solo
+    afecte a la wallet que lo produce. Devuelve el número de wallets con errores.
+    `pool_cache` es la caché de pools del ciclo, compartida entre lotes.
+    """
+    db = SessionLocal()
+    failed = set()
+    try:
+        wallets = db.query(Wallet).filter(Wallet.id.in_(wallet_ids)).all()
+        wallets_by_owner = {wallet.address.lower(): wallet for wallet in wallets}
+        positions_found = dict.fromkeys(wallets_by_owner, 0)
+        seen_token_ids = set()
+        end_read_transaction(db) # La paginación del Subgraph no retiene una lectura abierta.
+        logger.info(f"Escaneando {len(wallets)} wallets en la cadena {settings.CHAIN}...")
+
+        # Las páginas se procesan según llegan; una wallet puede repartirse entre varias.
+        for page in get_subgraph_client().iter_positions_for_owners(wallets_by_owner.keys(), pool_cache=pool_cache):
+            positions_by_owner = defaultdict(list)
+            for api_pos in page:
+                owner = api_pos.get("owner", "").lower()
+                if owner in wallets_by_owner and owner not in failed:
+                    positions_by_owner[owner].append(api_pos)
+                    seen_token_ids.add(int(api_pos.get("id")))
+
+            try:
+                metrics = persist_positions(db, wallets_by_owner, [p for group in positions_by_owner.values() for p in group])
+            except Exception as e:
+                logger.warning(f"Falló la sincronización masiva de la página ({e}). Reintentando wallet por wallet.")
+                db.rollback()
+                metrics = []
+                for owner, api_positions in positions_by_owner.items():
+                    try:
+                        metrics.extend(persist_positions(db, {owner: wallets_by_owner[owner]}, api_positions))
+                    except Exception as e:
+                        logger.error(f"Error al escanear la wallet {owner}: {e}", exc_info=True)
+                        db.rollback()
+                        failed.add(owner)
+
+            try:
+                if not settings.COLLECTION_ONLY:
+                    recommend_and_notify(db, metrics)
+            except Exception as e:
+                logger.error(f"Error al generar las recomendaciones de la página: {e}", exc_info=True)
+                db.rollback()
+
+            for owner, api_positions in positions_by_owner.items():
+                if owner not in failed:
+                    positions_found[owner] += len(api_positions)
+
+        # Con el escaneo completo, las posiciones que ya no aparecen se retiran del índice de rangos.
+        untrack_closed_positions(
+            db, [wallet.id for owner, wallet in wallets_by_owner.items() if owner not in failed], seen_token_ids
+        )
+        for owner, count in positions_found.items():
+            if owner in failed:
+                continue
+            if count:
+                logger.info(f"Escaneo completado para la wallet: {owner} ({count} posiciones)")
+            else:
+                logger.info(f"No se encontraron posiciones activas para {owner}.")
+        return len(failed)
+    except Exception as e:
+        logger.error(f"Error al escanear el lote de wallets {wallet_ids}: {e}", exc_info=True)
+        db.rollback()
+        return len(wallet_ids)
+    finally:
+        db.close()
 
 def scan_positions_task():
     """Tarea principal que se ejecutará periódicamente."""
     logger.info("Iniciando ciclo de escaneo de posiciones...")
+    started_at = time.monotonic()
     db = SessionLocal()
     try:
-        active_wallets = db.query(Wallet).filter(Wallet.is_active == True).all()
-        if not active_wallets:
-            logger.warning("No hay wallets activas para escanear."); return
+        wallet_ids = [wallet_id for (wallet_id,) in db.query(Wallet.id).filter(Wallet.is_active == True).all()]
+    except Exception as e:
+        logger.error(f"Error inesperado al cargar las wallets activas: {e}", exc_info=True)
+        return
+    finally:
+        db.close()
+
+    if not wallet_ids:
+        logger.warning("No hay wallets activas para escanear."); return
+
+    # Todo el ciclo lee el mismo bloque: cada pool se descarga una vez aunque lo compartan muchas wallets.
+    subgraph_client = get_subgraph_client()
+    try:
+        pool_cache = PoolStateCache(subgraph_client, subgraph_client.get_indexed_block())
+    except Exception as e:
+        logger.error(f"No se pudo obtener el último bloque indexado del Subgraph: {e}. Se omite el ciclo.")
+        return
+
+    batch_size = max(1, settings.SUBGRAPH_OWNERS_PER_QUERY)
+    batches = [wallet_ids[i:i + batch_size] for i in range(0, len(wallet_ids), batch_size)]
+
+    # Las esperas de red de cada lote se solapan; el ciclo dura lo que tarde el lote más lento.
+    max_workers = max(1, min(settings.SCAN_CONCURRENCY, len(batches)))
+    if max_workers == 1:
+        results = [scan_wallet_batch(batch, pool_cache) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan") as executor:
+            results = list(executor.map(lambda batch: scan_wallet_batch(batch, pool_cache), batches))
+
+    failed = sum(results)
+    # Las alertas del ciclo salen agrupadas por chat, sin esperar a la entrega.
+    get_notifier().flush()
+    elapsed = time.monotonic() - started_at
+    logger.info(
+        f"Ciclo de escaneo finalizado en {elapsed:.1f}s: {len(wallet_ids) - failed} wallets OK, "
+        f"{failed} con errores ({len(batches)} lotes, concurrencia={max_workers}). "
+        f"Esperando la próxima ejecución."
+    )
+    cache_stats = pool_cache.stats()
+    logger.info(
+        f"Caché de pools (bloque {cache_stats['block_number']}): {cache_stats['pools']} pools descargados "
+        f"en {cache_stats['requests']} consultas para {cache_stats['positions']} posiciones."
+    )
+    for host, counters in get_http_transport().stats(reset=True).items():
+        if counters["retries"] or counters["rejected"] or counters["circuit"] != "closed":
+            logger.warning(
+                f"HTTP {host}: {counters['requests']} peticiones, {counters['retries']} reintentos, "
+                f"{counters['rejected']} rechazadas con el circuito abierto (estado: {counters['circuit']})."
+            )
+    for provider, limits in get_rate_limit_manager().stats(reset=True).items():
+        live, background = limits["lanes"]["live"], limits["lanes"]["background"]
+        if not (live["requests"] or background["requests"] or limits["throttled"]):
+            continue
+        logger.info(
+            f"Límite {provider}: {limits['rate']:.1f}/{limits['max_rate']:.1f} req/s, {limits['throttled']} respuestas 429, "
+            f"en vivo {live['requests']} peticiones (espera media {live['mean_wait_seconds']}s), "
+            f"de fondo {background['requests']} (espera media {background['mean_wait_seconds']}s)."
+        )
+    if inference_service is not None:
+        stats = inference_service.stats()
+        logger.info(
+            f"Servicio de inferencia: {stats['queue_depth']} en cola, {stats['completed']} completadas, "
+            f"{stats['failed']} fallidas, latencia p50={stats['latency_p50_s']}s p95={stats['latency_p95_s']}s, "
+            f"inferencia p50={stats['inference_p50_s']}s."
+        )
+
+# --- Modo por bloques ---
+_block_source = None
+# Tick de cada pool en su última re-evaluación completa, para medir cuánto se movió desde entonces.
+_evaluated_ticks: Dict[str, int] = {}
+# Posiciones pendientes de re-evaluar -> bloque en el que se detectó el cambio. Se
+# sincronizan cuando el Subgraph ha indexado ese bloque: antes devolvería el estado previo.
+_pending_resync: Dict[int, int] = {}
+
+def resync_positions(position_ids: Iterable[int], pool_cache: PoolStateCache = None) -> int:
+    """
+    Sincroniza (y recomienda) solo las posiciones indicadas con la misma ruta que el
+    escaneo completo: una consulta `id_in` al Subgraph en lugar de una por wallet.
+    `pool_cache` fija el bloque de la lectura. Devuelve el número de posiciones sincronizadas.
+    """
+    db = SessionLocal()
+    try:
+        positions = (
+            db.query(Position).options(joinedload(Position.wallet))
+            .filter(Position.id.in_(sorted(position_ids)))
+            .all()
+        )
+        wallets_by_owner = {
+            pos.wallet.address.lower(): pos.wallet for pos in positions if pos.wallet and pos.wallet.is_active
+        }
+        if not wallets_by_owner:
+            return 0
+        api_positions = get_subgraph_client().get_positions_by_ids((pos.token_id for pos in positions), pool_cache=pool_cache)
+        # Una posición transferida a otra wallet deja de seguirse aquí; el escaneo completo la reconcilia.
+        api_positions = [p for p in api_positions if p.get("owner", "").lower() in wallets_by_owner]
+        # Las que no vuelven se cerraron (liquidez 0) o cambiaron de dueño: salen del índice de rangos.
+        returned = {int(p.get("id")) for p in api_positions}
+        get_range_index().remove(pos.id for pos in positions if pos.token_id not in returned)
+        metrics = persist_positions(db, wallets_by_owner, api_positions)
+        if not settings.COLLECTION_ONLY:
+            recommend_and_notify(db, metrics)
+        return len(api_positions)
+    except Exception as e:
+        logger.error(f"Error al re-evaluar posiciones afectadas por nuevos bloques: {e}", exc_info=True)
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def stream_poll_task():
+    """
+    Tarea del modo por bloques: consulta la fuente de bloques y re-evalúa solo las
+    posiciones cuyo estado de rango cambió (índice de rangos) y las de los pools
+    cuyo precio se movió al menos `STREAM_REEVALUATE_TICK_DELTA` ticks desde su
+    última evaluación. La re-evaluación espera a que el Subgraph indexe el bloque
+    del cambio, que con la fuente 'rpc' puede ir por delante.
+    """
+    range_index = get_range_index()
+    pools = range_index.pools()
+    if not pools:
+        return
+    try:
+        updates = _block_source.poll(pools)
+    except Exception as e:
+        logger.warning(f"Fuente de bloques '{_block_source.name}' no disponible: {e}")
+        updates = []
+    if not updates and not _pending_resync:
+        return
 
-        for wallet in active_wallets:
-            logger.info(f"Escaneando wallet: {wallet.address} en la cadena {settings.CHAIN}...")
-            positions_from_api = subgraph_client.get_positions_for_wallet(wallet.address)
-            
-            if not positions_from_api:
-                logger.info(f"No se encontraron posiciones activas para {wallet.address}."); continue
+    started_at = time.monotonic()
+    for update in updates:
+        pool = update.pool.lower()
+        previous = range_index.last_tick(pool)
+        flips = range_index.observe_tick(pool, update.tick, update.block_number)
+        affected = {flip.position_id for flip in flips}
+        evaluated = _evaluated_ticks.setdefault(pool, previous if previous is not None else update.tick)
+        delta = update.tick - evaluated
+        if flips or abs(delta) >= settings.STREAM_REEVALUATE_TICK_DELTA:
+            logger.info(
+                f"Pool {pool} en el bloque {update.block_number}: tick {update.tick} "
+                f"({(1.0001 ** delta - 1) * 100:+.2f}% desde la última evaluación), {len(flips)} cambios de rango."
+            )
+        if abs(delta) >= settings.STREAM_REEVALUATE_TICK_DELTA:
+            affected.update(range_index.position_ids(pool))
+            _evaluated_ticks[pool] = update.tick
+        for position_id in affected:
+            _pending_resync[position_id] = max(_pending_resync.get(position_id, 0), update.block_number or 0)
+    if not _pending_resync:
+        return
 
-            for api_pos in positions_from_api:
-                sync_position_from_subgraph(db, wallet, api_pos)
+    subgraph_client = get_subgraph_client()
+    try:
+        indexed_block = subgraph_client.get_indexed_block()
+    except Exception as e:
+        logger.warning(f"No se pudo obtener el último bloque indexado del Subgraph: {e}. Se reintentará.")
+        return
+    ready = [
+        position_id for position_id, block_number in _pending_resync.items()
+        if indexed_block is None or block_number <= indexed_block
+    ]
+    if len(ready) < len(_pending_resync):
+        logger.info(
+            f"Subgraph en el bloque {indexed_block}: {len(_pending_resync) - len(ready)} posiciones esperan "
+            f"a que indexe el bloque {max(_pending_resync.values())}."
+        )
+    if not ready:
+        return
+    for position_id in ready:
+        del _pending_resync[position_id]
 
-            db.commit()
-            logger.info(f"Escaneo completado para la wallet: {wallet.address}")
+    synced = resync_positions(ready, PoolStateCache(subgraph_client, indexed_block))
+    get_notifier().flush()
+    logger.info(
+        f"Bloques nuevos: {len(updates)} pools con cambios, {synced}/{len(ready)} posiciones re-evaluadas "
+        f"en {time.monotonic() - started_at:.1f}s."
+    )
 
+def compact_metrics_task():
+    """Tarea diaria de retención: las métricas antiguas quedan solo en los agregados."""
+    db = SessionLocal()
+    try:
+        compact_metrics(db)
     except Exception as e:
-        logger.error(f"Error inesperado en el ciclo de escaneo: {e}", exc_info=True)
+        logger.error(f"Error en la compactación de métricas: {e}", exc_info=True)
         db.rollback()
     finally:
         db.close()
-    
-    logger.info("Ciclo de escaneo finalizado. Esperando la próxima ejecución.")
 
 def main():
     """Punto de entrada principal para el daemon."""
+    global inference_service
+    parser = argparse.ArgumentParser(description="Agente de Monitoreo Uniswap V3.")
+    parser.add_argument(
+        "--collect-only", action="store_true",
+        help="Solo recoge posiciones y métricas; no carga el modelo ni genera recomendaciones."
+    )
+    parser.add_argument(
+        "--mode", choices=["interval", "stream"], default=None,
+        help="'stream' sigue los bloques nuevos y re-evalúa solo lo que cambia (por defecto MONITOR_MODE)."
+    )
+    args = parser.parse_args()
+    if args.collect_only:
+        settings.COLLECTION_ONLY = True
+    if args.mode:
+        settings.MONITOR_MODE = args.mode
+
+    from apscheduler.schedulers.blocking import BlockingScheduler
     logger.info("Iniciando el Agente de Monitoreo Uniswap V3...")
+    if settings.COLLECTION_ONLY:
+        logger.info("Modo solo recolección: el modelo LLM no se cargará.")
+    else:
+        inference_service = create_inference_service()
+    db = SessionLocal()
+    try:
+        get_range_index().rebuild(db)
+    finally:
+        db.close()
     scheduler = BlockingScheduler(timezone="UTC")
     scheduler.add_job(scan_positions_task, 'interval', seconds=settings.SCAN_INTERVAL_SECONDS, id='scan_job')
+    scheduler.add_job(compact_metrics_task, 'cron', hour=settings.METRICS_COMPACTION_HOUR, id='compaction_job')
+    if settings.MONITOR_MODE == "stream":
+        global _block_source
+        _block_source = create_block_source()
+        # El escaneo completo sigue como reconciliación; entre escaneos solo se sincroniza lo que cambia.
+        scheduler.add_job(
+            stream_poll_task, 'interval', seconds=settings.STREAM_POLL_SECONDS, id='stream_job',
+            max_instances=1, coalesce=True
+        )
+        logger.info(f"Modo por bloques: fuente '{_block_source.name}', consulta cada {settings.STREAM_POLL_SECONDS} segundos.")
     logger.info(f"Tarea programada para ejecutarse cada {settings.SCAN_INTERVAL_SECONDS} segundos.")
     logger.info("Presiona Ctrl+C para detener el servicio.")
     try:
@@ -163,6 +541,10 @@ def main():
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         logger.info("Deteniendo el servicio."); scheduler.shutdown()
+        if inference_service is not None:
+            inference_service.shutdown(wait=False)
+        shutdown_persistence()
+        get_notifier().shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
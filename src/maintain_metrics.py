@@ -0,0 +1,52 @@
+# src/maintain_metrics.py
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+import time
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from core.database import SessionLocal, engine
+from modules.metric_rollups import rebuild_rollups, compact_metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento del histórico de métricas: agregados y retención.")
+    parser.add_argument(
+        "--rebuild-rollups", action="store_true",
+        help="Reconstruye los agregados desde las métricas en bruto (p. ej. tras actualizar una base de datos existente)."
+    )
+    parser.add_argument(
+        "--since-days", type=int, default=None,
+        help="Días hacia atrás que se reconstruyen. Por defecto, la ventana de retención de métricas en bruto."
+    )
+    parser.add_argument("--skip-compaction", action="store_true", help="No aplica la retención.")
+    parser.add_argument("--vacuum", action="store_true", help="Ejecuta VACUUM al terminar para devolver el espacio libre (SQLite).")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.rebuild_rollups:
+            since = None
+            if args.since_days is not None:
+                since = int(time.time()) - args.since_days * 86400
+            rebuild_rollups(db, since=since)
+        if not args.skip_compaction:
+            compact_metrics(db)
+    finally:
+        db.close()
+
+    if args.vacuum:
+        if engine.dialect.name != "sqlite":
+            logger.warning("VACUUM solo se aplica a SQLite. Se omite."); return
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+        logger.info("VACUUM completado.")
+
+if __name__ == "__main__":
+    main()
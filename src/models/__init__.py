@@ -4,5 +4,10 @@ from .wallet import Wallet
 from .position import Position
 from .metric import PositionMetric
 from .recommendation import Recommendation
+from .block_timestamp import BlockTimestamp
+from .backfill_checkpoint import BackfillCheckpoint
+from .metric_rollup import PositionMetricHourly, PositionMetricDaily, PositionMetricWeekly
+from .maintenance_marker import MaintenanceMarker
 
-__all__ = ["Base", "Wallet", "Position", "PositionMetric", "Recommendation"]
\ No newline at end of file
+__all__ = ["Base", "Wallet", "Position", "PositionMetric", "Recommendation", "BlockTimestamp", "BackfillCheckpoint",
+           "PositionMetricHourly", "PositionMetricDaily", "PositionMetricWeekly", "MaintenanceMarker"]
\ No newline at end of file
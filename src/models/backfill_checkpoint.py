@@ -0,0 +1,23 @@
+# models/backfill_checkpoint.py
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime
+from sqlalchemy.sql import func
+from .base import Base
+
+class BackfillCheckpoint(Base):
+    """Progreso del backfill histórico de métricas de una posición; permite reanudarlo."""
+    __tablename__ = "backfill_checkpoints"
+
+    position_id = Column(Integer, ForeignKey("positions.id"), primary_key=True, autoincrement=False)
+    granularity = Column(String, primary_key=True) # "hour" o "day"
+    
+    # Límite superior del replay (unix), fijado en la primera ejecución: el primer
+    # snapshot del daemon, para no solapar el histórico reconstruido con el real.
+    replay_until = Column(Integer, nullable=False)
+    # Último periodo ya insertado (inicio del periodo, unix) y fees acumuladas hasta él.
+    last_period_start = Column(Integer, nullable=False)
+    fees_usd_accumulated = Column(Float, nullable=False, default=0.0)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BackfillCheckpoint(position_id={self.position_id}, granularity='{self.granularity}', last={self.last_period_start})>"
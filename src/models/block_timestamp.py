@@ -0,0 +1,16 @@
+# models/block_timestamp.py
+from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy.sql import func
+from .base import Base
+
+class BlockTimestamp(Base):
+    """Resolución timestamp→bloque ya obtenida de Etherscan. El resultado nunca cambia."""
+    __tablename__ = "block_timestamps"
+
+    timestamp = Column(Integer, primary_key=True, autoincrement=False)
+    block_number = Column(Integer, nullable=False)
+
+    resolved_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<BlockTimestamp(timestamp={self.timestamp}, block={self.block_number})>"
@@ -0,0 +1,14 @@
+# models/maintenance_marker.py
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from .base import Base
+
+class MaintenanceMarker(Base):
+    """Tarea de mantenimiento de una sola vez ya completada, p. ej. la reconstrucción inicial de agregados."""
+    __tablename__ = "maintenance_markers"
+
+    name = Column(String, primary_key=True)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<MaintenanceMarker(name='{self.name}', completed_at={self.completed_at})>"
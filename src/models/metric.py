@@ -1,11 +1,17 @@
 # src/models/metric.py
-from sqlalchemy import Column, Integer, ForeignKey, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, ForeignKey, Float, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
 
 class PositionMetric(Base):
     __tablename__ = "position_metrics"
+    __table_args__ = (
+        # Historial de una posición por ventana de tiempo y paginación por (snapshot_at, id).
+        Index("ix_position_metrics_position_id_snapshot_at", "position_id", "snapshot_at"),
+        # Retención: borrado de las métricas más antiguas.
+        Index("ix_position_metrics_snapshot_at", "snapshot_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     position_id = Column(Integer, ForeignKey("positions.id"), nullable=False)
@@ -22,4 +28,4 @@ class PositionMetric(Base):
     
     snapshot_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    position = relationship("Position", back_populates="metrics")
\ No newline at end of file
+    position = relationship("Position", back_populates="metrics", foreign_keys=[position_id])
\ No newline at end of file
@@ -0,0 +1,50 @@
+# models/metric_rollup.py
+from sqlalchemy import Column, Integer, Float, ForeignKey
+from sqlalchemy.orm import declared_attr
+from .base import Base
+
+class MetricRollupMixin:
+    """
+    Agregado de las métricas de una posición en un intervalo de tiempo. Se mantiene
+    de forma incremental después de cada ciclo, así que las series largas se leen
+    sin recorrer los snapshots en bruto.
+    """
+    @declared_attr
+    def position_id(cls):
+        return Column(Integer, ForeignKey("positions.id"), primary_key=True, autoincrement=False)
+
+    bucket_start = Column(Integer, primary_key=True, autoincrement=False) # Inicio del intervalo (unix, UTC)
+    samples = Column(Integer, nullable=False, default=0)
+    in_range_samples = Column(Integer, nullable=False, default=0)
+
+    first_snapshot_at = Column(Integer, nullable=False) # unix
+    last_snapshot_at = Column(Integer, nullable=False) # unix
+
+    price_min = Column(Float)
+    price_max = Column(Float)
+    price_last = Column(Float)
+
+    il_min = Column(Float)
+    il_max = Column(Float)
+    il_last = Column(Float)
+
+    # Fees no reclamadas al principio y al final del intervalo; la diferencia es lo generado.
+    fees_first = Column(Float)
+    fees_last = Column(Float)
+
+    @property
+    def fees_delta(self) -> float:
+        return (self.fees_last or 0.0) - (self.fees_first or 0.0)
+
+    @property
+    def in_range_ratio(self) -> float:
+        return self.in_range_samples / self.samples if self.samples else 0.0
+
+class PositionMetricHourly(MetricRollupMixin, Base):
+    __tablename__ = "position_metrics_hourly"
+
+class PositionMetricDaily(MetricRollupMixin, Base):
+    __tablename__ = "position_metrics_daily"
+
+class PositionMetricWeekly(MetricRollupMixin, Base):
+    __tablename__ = "position_metrics_weekly"
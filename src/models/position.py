@@ -1,11 +1,15 @@
 # models/position.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
 
 class Position(Base):
     __tablename__ = "positions"
+    __table_args__ = (
+        # Paginación por wallet en orden de id.
+        Index("ix_positions_wallet_id_id", "wallet_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     token_id = Column(Integer, unique=True, nullable=False, index=True) # NFT ID de la posición V3
@@ -20,10 +24,23 @@ class Position(Base):
     tick_lower = Column(String)
     tick_upper = Column(String)
     
+    # Precio de entrada (token0Price del pool al crear la posición). Se resuelve una sola vez.
+    entry_price = Column(Float, nullable=True)
+    entry_block = Column(Integer, nullable=True)
+    entry_timestamp = Column(Integer, nullable=True)
+
+    # Métrica más reciente (por `snapshot_at`), mantenida al escribir: el estado actual sin recorrer el histórico.
+    latest_metric_id = Column(
+        Integer, ForeignKey("position_metrics.id", use_alter=True, name="fk_positions_latest_metric_id"), nullable=True
+    )
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     wallet = relationship("Wallet")
-    metrics = relationship("PositionMetric", back_populates="position", cascade="all, delete-orphan")
+    metrics = relationship(
+        "PositionMetric", back_populates="position", foreign_keys="PositionMetric.position_id", cascade="all, delete-orphan"
+    )
+    latest_metric = relationship("PositionMetric", foreign_keys=[latest_metric_id], post_update=True)
 
     def __repr__(self):
         return f"<Position(token_id={self.token_id}, pool='{self.token0_symbol}/{self.token1_symbol}')>"
\ No newline at end of file
@@ -15,6 +15,13 @@ class Recommendation(Base):
     justification = Column(Text)
     raw_model_output = Column(Text) # Guardamos la respuesta completa del modelo para auditoría
     
+    # Huella del estado de la métrica (rango, posición en el rango, IL y APR por tramos).
+    state_fingerprint = Column(String, nullable=True)
+    # Si la recomendación se reutilizó sin inferencia, apunta a la original generada por la IA.
+    reused_from_id = Column(Integer, ForeignKey("recommendations.id"), nullable=True)
+    # Quién tomó la decisión: "LLM", "CACHE" o "RULE:<nombre de la regla>".
+    decision_source = Column(String, nullable=True)
+    
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
     
     metric = relationship("PositionMetric")
\ No newline at end of file
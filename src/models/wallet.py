@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float
 from sqlalchemy.sql import func
 from .base import Base
 
@@ -9,6 +9,8 @@ class Wallet(Base):
     address = Column(String, unique=True, index=True, nullable=False)
     notes = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    # Umbral de IL (%) a partir del cual las posiciones de la wallet siempre las analiza el LLM.
+    il_alert_threshold_percent = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
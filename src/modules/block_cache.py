@@ -0,0 +1,95 @@
+# src/modules/block_cache.py
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from core.config import settings
+from core.database import SessionLocal, begin_write, end_read_transaction, insert_ignore
+from models.block_timestamp import BlockTimestamp
+
+logger = logging.getLogger(__name__)
+
+class BlockTimestampCache:
+    """
+    Caché persistente de resoluciones timestamp→bloque con un LRU en memoria delante.
+    La respuesta para un timestamp nunca cambia, así que cada valor se pide a
+    Etherscan una sola vez en la vida de la base de datos. El ritmo de las
+    llamadas a Etherscan lo controla su limitador en `modules.rate_limit`.
+    """
+    def __init__(
+        self,
+        resolver: Callable[[int], Optional[int]],
+        session_factory=SessionLocal,
+        max_entries: Optional[int] = None,
+    ):
+        self.resolver = resolver
+        self.session_factory = session_factory
+        self.max_entries = max_entries or settings.BLOCK_CACHE_MAX_ENTRIES
+
+        self._lru: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, timestamp: int, block_number: int):
+        with self._lock:
+            self._lru[timestamp] = block_number
+            self._lru.move_to_end(timestamp)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get(self, timestamp: int) -> Optional[int]:
+        """Devuelve el bloque para un timestamp, consultando LRU, base de datos y Etherscan en ese orden."""
+        return self.get_many([timestamp]).get(timestamp)
+
+    def get_many(self, timestamps: Iterable[int]) -> Dict[int, int]:
+        """
+        Resuelve un lote de timestamps. Los que faltan en memoria se buscan con una
+        sola consulta `IN`; los que tampoco están en la base de datos se piden a
+        Etherscan y se guardan juntos con un único INSERT masivo. Usa su propia
+        sesión, así que no debe llamarse con una transacción de escritura abierta.
+        """
+        pending = {int(ts) for ts in timestamps if ts}
+        resolved: Dict[int, int] = {}
+
+        with self._lock:
+            for ts in pending:
+                if ts in self._lru:
+                    self._lru.move_to_end(ts)
+                    resolved[ts] = self._lru[ts]
+        pending -= resolved.keys()
+        if not pending:
+            return resolved
+
+        db = self.session_factory()
+        try:
+            rows = db.query(BlockTimestamp.timestamp, BlockTimestamp.block_number).filter(
+                BlockTimestamp.timestamp.in_(pending)
+            ).all()
+            for ts, block_number in rows:
+                resolved[ts] = block_number
+                self._remember(ts, block_number)
+            pending -= resolved.keys()
+            end_read_transaction(db) # Sin lectura abierta mientras se espera a Etherscan.
+
+            if pending:
+                logger.info(f"Resolviendo {len(pending)} timestamps nuevos vía Etherscan...")
+                new_rows = []
+                for ts in sorted(pending):
+                    block_number = self.resolver(ts)
+                    if block_number is None:
+                        continue
+                    resolved[ts] = block_number
+                    self._remember(ts, block_number)
+                    new_rows.append({"timestamp": ts, "block_number": block_number})
+
+                if new_rows:
+                    begin_write(db)
+                    db.execute(insert_ignore(BlockTimestamp, db.get_bind()), new_rows)
+                    db.commit()
+        except Exception as e:
+            logger.error(f"Error al acceder a la caché de bloques: {e}", exc_info=True)
+            db.rollback()
+        finally:
+            db.close()
+
+        return resolved
@@ -0,0 +1,168 @@
+# src/modules/block_stream.py
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from core.config import settings, PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+# keccak256("Swap(address,address,int256,int256,uint160,uint128,int24)") del pool de Uniswap V3.
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+
+class PoolTick(NamedTuple):
+    """Tick de un pool observado en un bloque."""
+    pool: str
+    tick: int
+    block_number: Optional[int]
+
+def _int256(word: str) -> int:
+    value = int(word, 16)
+    return value - (1 << 256) if value >= 1 << 255 else value
+
+def decode_swap_tick(log: Dict[str, Any]) -> int:
+    """Tick tras el swap. Los datos del evento son amount0, amount1, sqrtPriceX96, liquidity y tick (32 bytes cada uno)."""
+    data = log["data"][2:] if log["data"].startswith("0x") else log["data"]
+    return _int256(data[4 * 64:5 * 64])
+
+class BlockSource:
+    """
+    Fuente de nuevos bloques para el modo de monitorización por bloques. `poll`
+    devuelve, para los pools indicados, el último tick conocido de los que
+    cambiaron desde la consulta anterior.
+    """
+    name = "base"
+
+    def poll(self, pools: Iterable[str]) -> List[PoolTick]:
+        raise NotImplementedError
+
+class SubgraphMetaSource(BlockSource):
+    """
+    Sigue el bloque indexado por el Subgraph (`_meta`) y lee el tick de los pools
+    en la misma consulta. Si el bloque no avanzó, no hay nada nuevo.
+    """
+    name = "subgraph"
+
+    def __init__(self, subgraph_client=None):
+        if subgraph_client is None:
+            from modules.subgraph_client import get_subgraph_client
+            subgraph_client = get_subgraph_client()
+        self.subgraph_client = subgraph_client
+        self._last_block: Optional[int] = None
+        self._last_ticks: Dict[str, int] = {}
+
+    def poll(self, pools: Iterable[str]) -> List[PoolTick]:
+        block_number, ticks = self.subgraph_client.get_pool_ticks(pools)
+        if block_number is not None and block_number == self._last_block:
+            return []
+        self._last_block = block_number
+        changed = [
+            PoolTick(pool, tick, block_number) for pool, tick in ticks.items() if self._last_ticks.get(pool) != tick
+        ]
+        self._last_ticks.update(ticks)
+        return changed
+
+class RpcLogSource(BlockSource):
+    """
+    Sigue los eventos `Swap` de los pools seguidos con `eth_getLogs` sobre un nodo
+    JSON-RPC. La primera consulta solo fija el bloque de partida; después se piden
+    los logs de los bloques nuevos en tramos de `STREAM_MAX_BLOCK_RANGE` y se queda
+    el último swap de cada pool. Si un tramo falla, los swaps de los tramos ya leídos
+    se conservan y se devuelven en la siguiente consulta que termine.
+    """
+    name = "rpc"
+
+    def __init__(self, rpc_url: Optional[str] = None, max_block_range: Optional[int] = None):
+        self.rpc_url = rpc_url or settings.ETH_RPC_URL
+        if not self.rpc_url:
+            raise ValueError("Se requiere ETH_RPC_URL en el .env para la fuente de bloques 'rpc'.")
+        self.max_block_range = max_block_range or settings.STREAM_MAX_BLOCK_RANGE
+        self._last_block: Optional[int] = None
+        self._last_swaps: Dict[str, Tuple[int, int, int]] = {} # pool -> (bloque, índice del log, tick)
+        self._request_id = 0
+
+    def _rpc(self, method: str, params: list) -> Any:
+        from modules.http_transport import get_http_transport
+        self._request_id += 1
+        payload = {"jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params}
+        body = get_http_transport().request("POST", self.rpc_url, json=payload).json()
+        if body.get("error"):
+            raise RuntimeError(f"Error JSON-RPC en {method}: {body['error']}")
+        return body["result"]
+
+    def poll(self, pools: Iterable[str]) -> List[PoolTick]:
+        pools = sorted({pool.lower() for pool in pools})
+        latest = int(self._rpc("eth_blockNumber", []), 16)
+        if self._last_block is None or not pools:
+            self._last_block = latest
+            return []
+
+        last_swaps = self._last_swaps
+        from_block = self._last_block + 1
+        while from_block <= latest:
+            to_block = min(latest, from_block + self.max_block_range - 1)
+            logs = self._rpc("eth_getLogs", [{
+                "fromBlock": hex(from_block), "toBlock": hex(to_block),
+                "address": pools, "topics": [SWAP_TOPIC],
+            }])
+            for log in logs:
+                if log.get("removed"):
+                    continue
+                key = (int(log["blockNumber"], 16), int(log["logIndex"], 16))
+                pool = log["address"].lower()
+                if pool not in last_swaps or key > last_swaps[pool][:2]:
+                    last_swaps[pool] = (*key, decode_swap_tick(log))
+            # El bloque avanza tramo a tramo: si una consulta falla, se reintenta desde ahí
+            # y los swaps ya leídos siguen en `_last_swaps` hasta que la consulta termine.
+            self._last_block = to_block
+            from_block = to_block + 1
+        self._last_swaps = {}
+        return [PoolTick(pool, tick, block_number) for pool, (block_number, _, tick) in last_swaps.items()]
+
+class FixtureLogSource(RpcLogSource):
+    """
+    Nodo simulado que responde `eth_blockNumber` y `eth_getLogs` a partir de logs
+    grabados (JSON con la lista `logs` en el formato de `eth_getLogs`). Cada consulta
+    avanza un bloque, así que reproduce la secuencia grabada sin red. Se usa con
+    `DEV_MODE_MOCK_API` y para probar el modo por bloques.
+    """
+    name = "fixture"
+
+    def __init__(self, path: Optional[str] = None, max_block_range: Optional[int] = None):
+        self.path = path or settings.STREAM_FIXTURE_PATH or os.path.join(PROJECT_ROOT, "src/data/mock_swap_logs.json")
+        with open(self.path) as f:
+            self.logs = json.load(f)["logs"]
+        blocks = [int(log["blockNumber"], 16) for log in self.logs]
+        self._head = min(blocks) - 1 if blocks else 0
+        self._end = max(blocks) if blocks else 0
+        self.max_block_range = max_block_range or settings.STREAM_MAX_BLOCK_RANGE
+        self._last_block = None
+        self._last_swaps = {}
+        self._request_id = 0
+
+    def _rpc(self, method: str, params: list) -> Any:
+        if method == "eth_blockNumber":
+            self._head = min(self._head + 1, self._end)
+            return hex(self._head)
+        if method == "eth_getLogs":
+            query = params[0]
+            from_block, to_block = int(query["fromBlock"], 16), int(query["toBlock"], 16)
+            addresses = {address.lower() for address in query.get("address", [])}
+            return [
+                log for log in self.logs
+                if from_block <= int(log["blockNumber"], 16) <= to_block
+                and log["address"].lower() in addresses and log["topics"][0] == query["topics"][0]
+            ]
+        raise NotImplementedError(f"Método no soportado por el nodo simulado: {method}")
+
+def create_block_source(kind: Optional[str] = None) -> BlockSource:
+    """Fuente según `STREAM_BLOCK_SOURCE`; en `DEV_MODE_MOCK_API` se usa por defecto el fixture."""
+    kind = kind or settings.STREAM_BLOCK_SOURCE or ("fixture" if settings.DEV_MODE_MOCK_API else "subgraph")
+    if kind == "subgraph":
+        return SubgraphMetaSource()
+    if kind == "rpc":
+        return RpcLogSource()
+    if kind == "fixture":
+        return FixtureLogSource()
+    raise ValueError(f"Fuente de bloques desconocida: {kind}")
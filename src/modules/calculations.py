@@ -1,6 +1,11 @@
 # src/modules/calculations.py
 import math
 from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+SECONDS_PER_DAY = 60 * 60 * 24
 
 def calculate_impermanent_loss_simplified(
     initial_price_ratio: float, 
@@ -9,14 +14,14 @@ def calculate_impermanent_loss_simplified(
     """
     Calcula la pérdida impermanente porcentual usando la fórmula simplificada.
     IL = (2 * sqrt(price_ratio) / (1 + price_ratio)) - 1
-    donde price_ratio = current_price / initial_price.
+    donde price_ratio = current_price / initial_price. Sin precio inicial (0 o NaN) da 0.0.
     """
     if initial_price_ratio == 0:
         return 0.0
         
     price_ratio = current_price_ratio / initial_price_ratio
     
-    if price_ratio < 0: # Evitar errores de dominio matemático
+    if not math.isfinite(price_ratio) or price_ratio < 0: # Evitar errores de dominio matemático
         return 0.0
 
     il = (2 * math.sqrt(price_ratio)) / (1 + price_ratio) - 1
@@ -38,14 +43,19 @@ def calculate_real_apr(
     fees_usd: float,
     total_liquidity_usd: float,
     creation_timestamp: int,
-    il_percent: float
+    il_percent: float,
+    current_timestamp: Optional[int] = None
 ) -> float:
-    """Calcula una estimación del APR real (Fee APR + IL)."""
+    """
+    Calcula una estimación del APR real (Fee APR + IL). `current_timestamp` permite
+    fijar el instante de referencia; por defecto es el momento actual.
+    """
     if total_liquidity_usd == 0:
         return 0.0
 
     # Calcular la antigüedad de la posición en días
-    current_timestamp = int(datetime.now(timezone.utc).timestamp())
+    if current_timestamp is None:
+        current_timestamp = int(datetime.now(timezone.utc).timestamp())
     age_seconds = current_timestamp - creation_timestamp
     if age_seconds <= 0:
         return 0.0 # Evitar división por cero
@@ -61,4 +71,52 @@ def calculate_real_apr(
     il_annualized = (il_percent / age_days) * 365
     
     real_apr = fee_apr + il_annualized
-    return real_apr
\ No newline at end of file
+    return real_apr
+
+# --- Versiones vectorizadas ---
+# Equivalentes a las funciones escalares, pero sobre columnas de NumPy: calculan toda
+# la cartera de una pasada. Los casos límite (división por cero, dominio negativo)
+# se resuelven con máscaras y devuelven 0.0, igual que las versiones escalares.
+
+def batch_impermanent_loss(initial_price_ratios, current_price_ratios) -> np.ndarray:
+    """IL porcentual por fila. Un precio inicial nulo, 0 o NaN da 0.0."""
+    initial = np.asarray(initial_price_ratios, dtype=float)
+    current = np.asarray(current_price_ratios, dtype=float)
+    valid = initial != 0
+    with np.errstate(over="ignore", invalid="ignore"):
+        price_ratio = np.divide(current, initial, out=np.zeros_like(current), where=valid)
+    valid &= np.isfinite(price_ratio) & (price_ratio >= 0)
+    safe_ratio = np.where(valid, price_ratio, 0.0)
+    il = (2 * np.sqrt(safe_ratio)) / (1 + safe_ratio) - 1
+    return np.where(valid, il * 100, 0.0)
+
+def batch_unclaimed_fees_usd(
+    uncollected_fees_token0, uncollected_fees_token1, price_token0_usd, price_token1_usd
+) -> np.ndarray:
+    """Valor en USD de las comisiones no reclamadas, por fila."""
+    return (
+        np.asarray(uncollected_fees_token0, dtype=float) * np.asarray(price_token0_usd, dtype=float)
+        + np.asarray(uncollected_fees_token1, dtype=float) * np.asarray(price_token1_usd, dtype=float)
+    )
+
+def batch_real_apr(
+    fees_usd, total_liquidity_usd, creation_timestamps, il_percents, current_timestamp=None
+) -> np.ndarray:
+    """
+    APR real (Fee APR + IL anualizada) por fila, con un único instante de referencia
+    para toda la cartera (o un array de instantes, p. ej. en un replay histórico).
+    Liquidez 0 o antigüedad no positiva dan 0.0.
+    """
+    if current_timestamp is None:
+        current_timestamp = int(datetime.now(timezone.utc).timestamp())
+    fees = np.asarray(fees_usd, dtype=float)
+    liquidity = np.asarray(total_liquidity_usd, dtype=float)
+    age_days = (current_timestamp - np.asarray(creation_timestamps, dtype=float)) / SECONDS_PER_DAY
+    il = np.asarray(il_percents, dtype=float)
+
+    valid = (liquidity != 0) & ~(age_days <= 0) # Mismas condiciones que `calculate_real_apr`.
+    safe_days = np.where(valid, age_days, 1.0)
+    safe_liquidity = np.where(valid, liquidity, 1.0)
+    fee_apr = (fees / safe_days * 365 / safe_liquidity) * 100
+    il_annualized = (il / safe_days) * 365
+    return np.where(valid, fee_apr + il_annualized, 0.0)
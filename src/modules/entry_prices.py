@@ -0,0 +1,51 @@
+# src/modules/entry_prices.py
+import logging
+from typing import Dict, Iterable, Tuple
+
+from models.position import Position
+from modules.subgraph_client import get_subgraph_client
+
+logger = logging.getLogger(__name__)
+
+def lookup_entry_prices(entries: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], Tuple[int, float]]:
+    """
+    Devuelve `{(pool, entry_timestamp): (bloque, precio)}` para los pares indicados.
+    Bloques y precios se piden por lotes, de modo que un arranque en frío con muchas
+    posiciones nuevas cuesta unas pocas consultas. Solo consulta la red y la caché de
+    bloques, así que se llama antes de abrir la transacción de escritura.
+    """
+    entries = {(pool, int(timestamp)) for pool, timestamp in entries if pool and timestamp}
+    if not entries:
+        return {}
+
+    subgraph_client = get_subgraph_client()
+    blocks = subgraph_client.block_cache.get_many(timestamp for _, timestamp in entries)
+    prices = subgraph_client.get_pool_prices_at_blocks(
+        (pool, blocks[timestamp]) for pool, timestamp in entries if timestamp in blocks
+    )
+
+    found = {}
+    for pool, timestamp in entries:
+        block_number = blocks.get(timestamp)
+        price = prices.get((pool, block_number))
+        if price is not None:
+            found[(pool, timestamp)] = (block_number, price)
+    return found
+
+def apply_entry_prices(positions: Iterable[Position], entry_prices: Dict[Tuple[str, int], Tuple[int, float]]) -> int:
+    """
+    Completa `entry_block` y `entry_price` de las posiciones que aún no los tienen con
+    el resultado de `lookup_entry_prices`. Devuelve cuántas se resolvieron.
+    """
+    pending = [pos for pos in positions if pos.entry_price is None and pos.entry_timestamp]
+    resolved = 0
+    for pos in pending:
+        entry = entry_prices.get((pos.pool_address, int(pos.entry_timestamp)))
+        if entry is None:
+            continue
+        pos.entry_block, pos.entry_price = entry
+        resolved += 1
+
+    if resolved < len(pending):
+        logger.warning(f"No se pudo resolver el precio de entrada de {len(pending) - resolved} posiciones.")
+    return resolved
@@ -0,0 +1,230 @@
+# src/modules/http_transport.py
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from core.config import settings
+from modules.rate_limit import get_rate_limit_manager, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Respuestas que indican un problema transitorio del servidor y merecen reintento.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """El host tiene el circuito abierto: se falla en el acto en lugar de esperar otro timeout."""
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuito abierto para {host}; próximo intento en {retry_in:.0f}s.")
+        self.host = host
+        self.retry_in = retry_in
+
+class GraphQLQueryError(Exception):
+    """El servidor GraphQL respondió con `errors` (consulta inválida, bloque no indexado...)."""
+    def __init__(self, errors):
+        messages = "; ".join(str(error.get("message", error)) if isinstance(error, dict) else str(error) for error in errors)
+        super().__init__(messages)
+        self.errors = errors
+
+class CircuitBreaker:
+    """
+    Disyuntor por host. Tras `failure_threshold` fallos seguidos (errores de red,
+    timeouts o 5xx) se abre durante `reset_seconds`: las peticiones fallan sin
+    tocar la red. Pasado ese tiempo se deja pasar una sola petición de prueba;
+    si sale bien se cierra y si falla vuelve a abrirse.
+    """
+    def __init__(self, host: str, failure_threshold: Optional[int] = None, reset_seconds: Optional[float] = None):
+        self.host = host
+        self.failure_threshold = failure_threshold or settings.HTTP_CIRCUIT_FAILURE_THRESHOLD
+        self.reset_seconds = reset_seconds if reset_seconds is not None else settings.HTTP_CIRCUIT_RESET_SECONDS
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            retry_in = self._opened_at + self.reset_seconds - time.monotonic()
+            if retry_in > 0 or self._probing:
+                raise CircuitOpenError(self.host, max(retry_in, 0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuito cerrado para {self.host}: el servicio vuelve a responder.")
+            self._failures, self._opened_at, self._probing = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"Circuito abierto para {self.host} tras {self._failures} fallos seguidos ({self.reset_seconds:.0f}s).")
+                self._opened_at, self._probing = time.monotonic(), False
+
+class HttpTransport:
+    """
+    Transporte HTTP compartido por los clientes salientes (The Graph, Etherscan,
+    Moralis, nodo JSON-RPC): una `requests.Session` con conexiones keep-alive por
+    host, timeouts de conexión cortos, reintentos con backoff exponencial y jitter
+    para errores transitorios y un disyuntor por host. Cada intento pasa antes
+    por el limitador del proveedor (`modules.rate_limit`), que también recibe
+    los 429 y `Retry-After` para ajustar su ritmo.
+    """
+    def __init__(
+        self,
+        max_retries: Optional[int] = None,
+        backoff_base_seconds: Optional[float] = None,
+        backoff_max_seconds: Optional[float] = None,
+        timeout: Optional[tuple] = None,
+    ):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.max_retries = max_retries if max_retries is not None else settings.HTTP_MAX_RETRIES
+        self.backoff_base_seconds = backoff_base_seconds if backoff_base_seconds is not None else settings.HTTP_BACKOFF_BASE_SECONDS
+        self.backoff_max_seconds = backoff_max_seconds if backoff_max_seconds is not None else settings.HTTP_BACKOFF_MAX_SECONDS
+        self.timeout = timeout or (settings.HTTP_CONNECT_TIMEOUT_SECONDS, settings.HTTP_READ_TIMEOUT_SECONDS)
+
+        self.session = requests.Session()
+        # Los reintentos los gestiona `request`; el adaptador solo mantiene el pool de conexiones.
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=settings.HTTP_POOL_MAXSIZE, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host)
+                self._stats[host] = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+            return self._breakers[host]
+
+    def _count(self, host: str, key: str):
+        with self._lock:
+            self._stats[host][key] += 1
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del reintento `attempt`: `Retry-After` si el servidor lo indica, si no full jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Envía la petición y devuelve la respuesta (ya comprobada con
+        `raise_for_status`). Reintenta errores de red, timeouts, 429 y 5xx; los
+        demás 4xx se devuelven como error sin reintentar. Lanza `CircuitOpenError`
+        si el host está caído.
+        """
+        import requests
+
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        limiter = get_rate_limit_manager().limiter_for(url)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                breaker.before_request()
+            except CircuitOpenError:
+                self._count(host, "rejected")
+                raise
+            sent_at = limiter.acquire() if limiter is not None else None
+            self._count(host, "requests")
+            retry_after = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                error = e
+            except requests.RequestException:
+                breaker.record_failure()
+                self._count(host, "failures")
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    # Un 4xx es un error de la petición, no del servicio.
+                    breaker.record_success()
+                    response.raise_for_status()
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    # Limitado pero vivo: no cuenta como fallo del servicio.
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+                if limiter is not None and (response.status_code == 429 or retry_after is not None):
+                    limiter.throttle(retry_after, sent_at)
+                error = requests.HTTPError(f"{response.status_code} {response.reason} en {host}", response=response)
+            self._count(host, "failures")
+
+            if attempt >= self.max_retries:
+                raise error
+            # Con `Retry-After` la pausa ya la aplica el limitador a todas las peticiones del proveedor.
+            wait = 0.0 if limiter is not None and retry_after is not None else self._backoff(attempt, retry_after)
+            attempt += 1
+            self._count(host, "retries")
+            logger.warning(f"{method} {host} falló ({error}). Reintento {attempt}/{self.max_retries} en {wait:.1f}s.")
+            time.sleep(wait)
+
+    def stats(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Contadores por host y estado de su disyuntor. Con `reset`, los contadores vuelven a cero."""
+        with self._lock:
+            snapshot = {host: dict(counters) for host, counters in self._stats.items()}
+            breakers = dict(self._breakers)
+            if reset:
+                for counters in self._stats.values():
+                    counters.update(dict.fromkeys(counters, 0))
+        for host, counters in snapshot.items():
+            counters["circuit"] = breakers[host].state
+        return snapshot
+
+class GraphQLDocument(NamedTuple):
+    """Documento GraphQL ya validado sintácticamente, listo para enviar."""
+    text: str
+
+def parse_graphql(source: str) -> GraphQLDocument:
+    """Analiza un documento una sola vez (los errores de sintaxis saltan aquí) y lo normaliza."""
+    from graphql import parse, print_ast
+    return GraphQLDocument(print_ast(parse(source)))
+
+class GraphQLClient:
+    """Cliente GraphQL mínimo sobre `HttpTransport`, con la misma forma de `execute` que `gql.Client`."""
+    def __init__(self, url: str, transport: Optional[HttpTransport] = None):
+        self.url = url
+        self.transport = transport or get_http_transport()
+
+    def execute(self, document: GraphQLDocument, variable_values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload = {"query": document.text, "variables": variable_values or {}}
+        body = self.transport.request("POST", self.url, json=payload).json()
+        if body.get("errors"):
+            raise GraphQLQueryError(body["errors"])
+        return body.get("data") or {}
+
+# Instancia global, construida en el primer uso.
+_http_transport: Optional[HttpTransport] = None
+_http_transport_lock = threading.Lock()
+
+def get_http_transport() -> HttpTransport:
+    global _http_transport
+    if _http_transport is None:
+        with _http_transport_lock:
+            if _http_transport is None:
+                _http_transport = HttpTransport()
+    return _http_transport
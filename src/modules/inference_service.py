@@ -0,0 +1,109 @@
+# src/modules/inference_service.py
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# --- Estado del proceso worker ---
+# Cada worker carga su propia instancia de Llama una sola vez, en el inicializador.
+_worker_agent = None
+
+def _init_worker(model_path: str, n_gpu_layers: int, n_threads: int):
+    global _worker_agent
+    from modules.qwen_agent import QwenAgent
+    logger.info(f"Worker de inferencia {os.getpid()} cargando el modelo con {n_threads} hilos...")
+    _worker_agent = QwenAgent(model_path=model_path, n_gpu_layers=n_gpu_layers, n_threads=n_threads)
+
+def _run_inference(context: dict) -> dict:
+    started_at = time.monotonic()
+    result = _worker_agent.generate_from_context(context)
+    result["inference_seconds"] = time.monotonic() - started_at
+    return result
+
+def _percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class InferenceService:
+    """
+    Cola de inferencia delante de uno o varios procesos worker. El daemon envía
+    contextos de métricas y recibe futures; la generación no bloquea el escaneo.
+    Expone la profundidad de la cola y la latencia por petición.
+    """
+    def __init__(self, workers: int, threads_per_worker: int, model_path: str, n_gpu_layers: int):
+        if threads_per_worker <= 0:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+
+        # `spawn` evita heredar por fork el estado de hilos y de llama.cpp del proceso padre.
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, n_gpu_layers, threads_per_worker),
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._latencies = deque(maxlen=1000) # Desde el envío hasta el resultado (cola + inferencia).
+        self._inference_times = deque(maxlen=1000)
+        logger.info(f"Servicio de inferencia iniciado: {workers} workers x {threads_per_worker} hilos.")
+
+    def submit(self, context: dict) -> Future:
+        """Encola una generación y devuelve un future con el dict de resultado del agente."""
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(_run_inference, context)
+        future.add_done_callback(lambda f: self._on_done(f, submitted_at))
+        return future
+
+    def _on_done(self, future: Future, submitted_at: float):
+        with self._lock:
+            self._pending -= 1
+            self._latencies.append(time.monotonic() - submitted_at)
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._inference_times.append(future.result().get("inference_seconds", 0.0))
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies, inference_times = list(self._latencies), list(self._inference_times)
+            stats = {"queue_depth": self._pending, "completed": self._completed, "failed": self._failed}
+        stats["latency_p50_s"] = _percentile(latencies, 0.50)
+        stats["latency_p95_s"] = _percentile(latencies, 0.95)
+        stats["inference_p50_s"] = _percentile(inference_times, 0.50)
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+def create_inference_service() -> Optional[InferenceService]:
+    """Crea el servicio si `INFERENCE_WORKERS` > 0; con 0 la inferencia sigue en línea."""
+    if settings.INFERENCE_WORKERS <= 0:
+        return None
+    return InferenceService(
+        workers=settings.INFERENCE_WORKERS,
+        threads_per_worker=settings.INFERENCE_THREADS_PER_WORKER,
+        model_path=settings.MODEL_PATH,
+        n_gpu_layers=settings.N_GPU_LAYERS,
+    )
@@ -0,0 +1,117 @@
+# src/modules/metric_replay.py
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from modules.calculations import batch_real_apr
+from modules.uniswap_math import (
+    Q96,
+    batch_amounts_for_liquidity,
+    batch_concentrated_impermanent_loss,
+    batch_tick_to_price
+)
+
+logger = logging.getLogger(__name__)
+
+def compute_replay_metrics(
+    positions: List[Dict[str, Any]],
+    periods: List[Dict[str, Any]],
+    token1_prices_usd: np.ndarray,
+    decimals0: int,
+    decimals1: int,
+) -> Tuple[List[Dict[str, Any]], Dict[int, Tuple[int, float]]]:
+    """
+    Reconstruye las métricas de un pool para una página de su histórico. Trabaja
+    sobre una matriz periodos x posiciones, así que cada página cuesta unas pocas
+    operaciones de NumPy con independencia del número de posiciones.
+
+    `positions` trae por posición: position_id, tick_lower, tick_upper, liquidity,
+    entry_price, creation_timestamp, after (último periodo ya insertado), until
+    (límite del replay) y fees_usd (fees acumuladas hasta `after`).
+    `periods` son filas de `iter_pool_history` y `token1_prices_usd` el precio en USD
+    de token1 alineado con ellas.
+
+    Supuestos del replay: la liquidez de la posición es la actual durante toda su
+    vida, y las fees de cada periodo se reparten según la fracción de la liquidez
+    activa del pool cuando la posición está en rango.
+
+    Devuelve las filas para `position_metrics` (con `snapshot_at` explícito) y, por
+    posición con filas nuevas, `(último periodo, fees acumuladas)` para el checkpoint.
+    """
+    if not positions or not periods:
+        return [], {}
+
+    # --- Columnas por periodo (filas de la matriz) ---
+    period_start = np.array([row["periodStart"] for row in periods], dtype=np.int64)
+    token0_price = np.array([float(row["token0Price"]) for row in periods])
+    price = np.array([float(row["token1Price"]) for row in periods]) # token1 por token0
+    sqrt_price = np.array([int(row["sqrtPrice"]) / Q96 for row in periods])
+    pool_tick = np.array([int(row["tick"]) if row.get("tick") is not None else 0 for row in periods], dtype=np.int64)
+    pool_liquidity = np.array([float(row["liquidity"]) for row in periods])
+    fees_usd = np.array([float(row["feesUSD"]) for row in periods])
+
+    # --- Columnas por posición (columnas de la matriz) ---
+    tick_lower = np.array([p["tick_lower"] for p in positions], dtype=np.int64)
+    tick_upper = np.array([p["tick_upper"] for p in positions], dtype=np.int64)
+    liquidity = np.array([float(p["liquidity"]) for p in positions])
+    entry_price = np.array([np.nan if p["entry_price"] is None else p["entry_price"] for p in positions], dtype=float)
+    creation = np.array([p["creation_timestamp"] for p in positions], dtype=np.int64)
+    after = np.array([p["after"] for p in positions], dtype=np.int64)
+    until = np.array([p["until"] for p in positions], dtype=np.int64)
+    fees_before = np.array([p["fees_usd"] for p in positions], dtype=float)
+
+    rows_t = period_start[:, None]
+    valid = (rows_t > after) & (rows_t <= until) & (rows_t >= creation)
+    in_range = (tick_lower <= pool_tick[:, None]) & (pool_tick[:, None] < tick_upper)
+
+    # Fees: fracción de la liquidez activa mientras la posición está en rango.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(pool_liquidity[:, None] > 0, liquidity / pool_liquidity[:, None], 0.0)
+    period_fees = np.where(valid & in_range, fees_usd[:, None] * np.minimum(share, 1.0), 0.0)
+    fees_accumulated = fees_before + np.cumsum(period_fees, axis=0)
+
+    # Valor de la posición: cantidades desde la liquidez, valoradas en token1 y luego en USD.
+    sqrt_lower = np.power(1.0001, tick_lower / 2)
+    sqrt_upper = np.power(1.0001, tick_upper / 2)
+    amount0, amount1 = batch_amounts_for_liquidity(sqrt_price[:, None], sqrt_lower, sqrt_upper, liquidity)
+    value_token1 = amount0 / 10.0 ** decimals0 * price[:, None] + amount1 / 10.0 ** decimals1
+    value_usd = np.nan_to_num(value_token1 * token1_prices_usd[:, None])
+
+    # IL del rango concentrado; los precios de la posición van en orientación token0Price.
+    range_low = batch_tick_to_price(tick_lower, decimals0, decimals1)
+    range_high = batch_tick_to_price(tick_upper, decimals0, decimals1)
+    entry_token1 = np.divide(1.0, entry_price, out=np.full_like(entry_price, np.nan), where=entry_price > 0)
+    il_percent = batch_concentrated_impermanent_loss(entry_token1, price[:, None], range_low, range_high)
+    real_apr = batch_real_apr(fees_accumulated, value_usd, creation, il_percent, rows_t)
+
+    rows = []
+    for period_index, position_index in zip(*np.nonzero(valid)):
+        rows.append({
+            "position_id": positions[position_index]["position_id"],
+            "current_price": float(token0_price[period_index]),
+            "price_lower": float(1.0 / range_high[position_index]),
+            "price_upper": float(1.0 / range_low[position_index]),
+            "is_in_range": bool(in_range[period_index, position_index]),
+            "impermanent_loss_percent": float(il_percent[period_index, position_index]),
+            "unclaimed_fees_usd": float(fees_accumulated[period_index, position_index]),
+            "real_apr_percent": float(real_apr[period_index, position_index]),
+            "snapshot_at": datetime.fromtimestamp(int(period_start[period_index]), tz=timezone.utc),
+        })
+
+    progress = {}
+    for position_index in np.nonzero(valid.any(axis=0))[0]:
+        last_period = np.nonzero(valid[:, position_index])[0][-1]
+        progress[positions[position_index]["position_id"]] = (
+            int(period_start[last_period]), float(fees_accumulated[last_period, position_index])
+        )
+    return rows, progress
+
+def align_prices(period_starts: List[int], prices_by_period: Dict[int, float], last_known: Optional[float]) -> np.ndarray:
+    """Alinea una serie de precios con los periodos, arrastrando el último valor conocido."""
+    aligned = []
+    for period in period_starts:
+        last_known = prices_by_period.get(period, last_known)
+        aligned.append(np.nan if last_known is None else last_known)
+    return np.array(aligned, dtype=float)
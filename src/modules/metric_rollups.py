@@ -0,0 +1,292 @@
+# src/modules/metric_rollups.py
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+
+from core.config import settings
+from core.database import begin_write, insert_ignore
+from models import (
+    Position, PositionMetric, Recommendation, PositionMetricHourly, PositionMetricDaily, PositionMetricWeekly, MaintenanceMarker
+)
+
+logger = logging.getLogger(__name__)
+
+# SQLite limita el número de parámetros por sentencia; las consultas `IN` se trocean.
+IN_QUERY_CHUNK_SIZE = 500
+
+# Marca de la primera reconstrucción completa: hasta tenerla, la retención no borra métricas en bruto.
+ROLLUP_REBUILD_MARKER = "rollups_full_rebuild"
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+BUCKET_SECONDS = {"hour": SECONDS_PER_HOUR, "day": SECONDS_PER_DAY, "week": 7 * SECONDS_PER_DAY}
+
+ROLLUP_MODELS = {
+    "hour": PositionMetricHourly,
+    "day": PositionMetricDaily,
+    "week": PositionMetricWeekly,
+}
+
+_AGGREGATE_FIELDS = (
+    "samples", "in_range_samples", "first_snapshot_at", "last_snapshot_at",
+    "price_min", "price_max", "price_last", "il_min", "il_max", "il_last", "fees_first", "fees_last",
+)
+
+def bucket_start(timestamp: int, granularity: str) -> int:
+    """Inicio (unix, UTC) del intervalo que contiene `timestamp`. Las semanas empiezan en lunes."""
+    if granularity == "hour":
+        return timestamp - timestamp % SECONDS_PER_HOUR
+    day_start = timestamp - timestamp % SECONDS_PER_DAY
+    if granularity == "day":
+        return day_start
+    if granularity == "week":
+        # El 1 de enero de 1970 fue jueves: (días + 3) % 7 es el día de la semana con lunes = 0.
+        return day_start - ((timestamp // SECONDS_PER_DAY + 3) % 7) * SECONDS_PER_DAY
+    raise ValueError(f"Granularidad desconocida: {granularity}")
+
+def to_unix(value) -> Optional[int]:
+    """Convierte un `snapshot_at` a unix; las fechas sin zona se interpretan como UTC."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str): # SQLite devuelve algunos valores sin convertir.
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def _nan_to_none(value) -> Optional[float]:
+    return None if value is None or value != value else float(value)
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+def _sample_aggregate(timestamp: int, row: Dict[str, Any]) -> Dict[str, Any]:
+    price = _nan_to_none(row.get("current_price"))
+    il = _nan_to_none(row.get("impermanent_loss_percent"))
+    fees = _nan_to_none(row.get("unclaimed_fees_usd"))
+    return {
+        "samples": 1, "in_range_samples": 1 if row.get("is_in_range") else 0,
+        "first_snapshot_at": timestamp, "last_snapshot_at": timestamp,
+        "price_min": price, "price_max": price, "price_last": price,
+        "il_min": il, "il_max": il, "il_last": il,
+        "fees_first": fees, "fees_last": fees,
+    }
+
+def _merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combina dos agregados del mismo intervalo. No depende del orden de llegada:
+    el primero y el último valor se eligen por `snapshot_at`, así que el backfill
+    puede añadir muestras antiguas a intervalos ya existentes.
+    """
+    first = a if a["first_snapshot_at"] <= b["first_snapshot_at"] else b
+    latest = b if b["last_snapshot_at"] >= a["last_snapshot_at"] else a
+    return {
+        "samples": a["samples"] + b["samples"],
+        "in_range_samples": a["in_range_samples"] + b["in_range_samples"],
+        "first_snapshot_at": first["first_snapshot_at"],
+        "last_snapshot_at": latest["last_snapshot_at"],
+        "price_min": _min(a["price_min"], b["price_min"]),
+        "price_max": _max(a["price_max"], b["price_max"]),
+        "price_last": latest["price_last"],
+        "il_min": _min(a["il_min"], b["il_min"]),
+        "il_max": _max(a["il_max"], b["il_max"]),
+        "il_last": latest["il_last"],
+        "fees_first": first["fees_first"],
+        "fees_last": latest["fees_last"],
+    }
+
+def update_rollups(
+    db_session, rows: Iterable[Dict[str, Any]], buckets_from: Optional[Dict[str, int]] = None
+) -> int:
+    """
+    Incorpora un lote de métricas (filas de `position_metrics` con `snapshot_at`) a los
+    agregados horarios, diarios y semanales. Por granularidad hace una precarga `IN`
+    de los intervalos afectados, un INSERT masivo para los nuevos y un UPDATE masivo
+    por clave primaria para los existentes. El llamador decide cuándo confirmar.
+    `buckets_from` limita, por granularidad, los intervalos que se actualizan.
+    Devuelve el número de muestras incorporadas.
+    """
+    samples = []
+    for row in rows:
+        timestamp = to_unix(row.get("snapshot_at"))
+        if timestamp is None:
+            continue
+        samples.append((row["position_id"], timestamp, _sample_aggregate(timestamp, row)))
+    if not samples:
+        return 0
+
+    for granularity, model in ROLLUP_MODELS.items():
+        pending: Dict[tuple, Dict[str, Any]] = {}
+        for position_id, timestamp, aggregate in samples:
+            key = (position_id, bucket_start(timestamp, granularity))
+            if buckets_from and key[1] < buckets_from.get(granularity, key[1]):
+                continue
+            pending[key] = _merge(pending[key], aggregate) if key in pending else aggregate
+
+        if not pending:
+            continue
+        position_ids = sorted({position_id for position_id, _ in pending})
+        buckets = sorted({bucket for _, bucket in pending})
+        existing = {}
+        for i in range(0, len(position_ids), IN_QUERY_CHUNK_SIZE):
+            chunk = position_ids[i:i + IN_QUERY_CHUNK_SIZE]
+            # Lectura por columnas: no deja objetos en la sesión que el UPDATE masivo dejaría obsoletos.
+            query = select(model.position_id, model.bucket_start, *(getattr(model, field) for field in _AGGREGATE_FIELDS)).where(
+                model.position_id.in_(chunk), model.bucket_start.in_(buckets)
+            )
+            for row in db_session.execute(query):
+                existing[(row.position_id, row.bucket_start)] = {field: getattr(row, field) for field in _AGGREGATE_FIELDS}
+
+        new_rows, changed_rows = [], []
+        for (position_id, bucket), aggregate in pending.items():
+            if (position_id, bucket) in existing:
+                aggregate = _merge(existing[(position_id, bucket)], aggregate)
+                changed_rows.append({"position_id": position_id, "bucket_start": bucket, **aggregate})
+            else:
+                new_rows.append({"position_id": position_id, "bucket_start": bucket, **aggregate})
+        if new_rows:
+            db_session.execute(insert(model), new_rows)
+        if changed_rows:
+            db_session.execute(update(model), changed_rows)
+    return len(samples)
+
+def load_rollup_series(
+    db_session, position_id: int, granularity: str = "day", since: Optional[int] = None, limit: Optional[int] = None
+) -> List[Any]:
+    """Serie agregada de una posición, ordenada por intervalo; `since` es unix."""
+    model = ROLLUP_MODELS[granularity]
+    query = db_session.query(model).filter(model.position_id == position_id)
+    if since is not None:
+        query = query.filter(model.bucket_start >= bucket_start(since, granularity))
+    query = query.order_by(model.bucket_start)
+    if limit:
+        # Los `limit` intervalos más recientes, devueltos en orden cronológico.
+        return list(reversed(query.order_by(None).order_by(model.bucket_start.desc()).limit(limit).all()))
+    return query.all()
+
+def rollups_fully_rebuilt(db_session) -> bool:
+    """Indica si ya se completó una reconstrucción completa de los agregados (`since=0`)."""
+    return db_session.get(MaintenanceMarker, ROLLUP_REBUILD_MARKER) is not None
+
+def rebuild_rollups(db_session, since: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Reconstruye los agregados desde `since` (unix) a partir de las métricas en bruto.
+    Solo se rehacen los intervalos que empiezan después de `since`, que las métricas
+    cubren por completo. Por defecto se reconstruye todo si nunca se completó una
+    reconstrucción completa (una base de datos anterior a los agregados, aunque el
+    daemon ya haya escrito algunos) y, si no, la ventana que conserva la retención
+    de métricas en bruto. Al terminar una reconstrucción completa se guarda su marca.
+    """
+    batch_size = batch_size or settings.METRICS_COMPACTION_BATCH_SIZE
+    if since is None:
+        now = int(datetime.now(timezone.utc).timestamp())
+        since = now - settings.METRICS_RAW_RETENTION_DAYS * SECONDS_PER_DAY if rollups_fully_rebuilt(db_session) else 0
+
+    begin_write(db_session)
+    rebuild_from = {}
+    for granularity, model in ROLLUP_MODELS.items():
+        start = bucket_start(since, granularity)
+        if start < since:
+            start += BUCKET_SECONDS[granularity]
+        rebuild_from[granularity] = start
+        db_session.execute(delete(model).where(model.bucket_start >= start).execution_options(synchronize_session=False))
+    # Las métricas posteriores ya las incorpora el escaneo que las escribe; contarlas aquí las duplicaría.
+    max_id = db_session.execute(select(func.max(PositionMetric.id))).scalar() or 0
+
+    columns = (
+        PositionMetric.id, PositionMetric.position_id, PositionMetric.snapshot_at, PositionMetric.current_price,
+        PositionMetric.impermanent_loss_percent, PositionMetric.unclaimed_fees_usd, PositionMetric.is_in_range,
+    )
+    first_snapshot = datetime.fromtimestamp(min(rebuild_from.values()), tz=timezone.utc)
+    last_id, total = 0, 0
+    while True:
+        begin_write(db_session)
+        batch = db_session.execute(
+            select(*columns).where(
+                PositionMetric.id > last_id, PositionMetric.id <= max_id, PositionMetric.snapshot_at >= first_snapshot
+            )
+            .order_by(PositionMetric.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        total += update_rollups(db_session, [dict(row._mapping) for row in batch], rebuild_from)
+        db_session.commit()
+    if since <= 0:
+        begin_write(db_session)
+        db_session.execute(insert_ignore(MaintenanceMarker, db_session.get_bind()), [{"name": ROLLUP_REBUILD_MARKER}])
+    db_session.commit()
+    logger.info(f"Agregados reconstruidos a partir de {total} métricas en bruto.")
+    return total
+
+def compact_metrics(db_session, now: Optional[int] = None, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    Tarea de retención: borra las métricas en bruto más antiguas que
+    `METRICS_RAW_RETENTION_DAYS` (junto con sus recomendaciones) y los agregados
+    horarios más antiguos que `METRICS_HOURLY_RETENTION_DAYS`. Los agregados diarios y
+    semanales se conservan siempre. La última métrica de cada posición
+    (`Position.latest_metric_id`) nunca se borra. Trabaja por lotes y
+    confirma cada uno, así que no bloquea la base de datos durante mucho tiempo.
+    """
+    now = int(now if now is not None else datetime.now(timezone.utc).timestamp())
+    batch_size = batch_size or settings.METRICS_COMPACTION_BATCH_SIZE
+
+    # Una base de datos anterior a los agregados los obtiene antes de perder histórico. No basta
+    # con mirar si hay agregados: el primer escaneo tras actualizar ya escribe los del ciclo actual.
+    if not rollups_fully_rebuilt(db_session):
+        rebuild_rollups(db_session, since=0, batch_size=batch_size)
+
+    raw_cutoff = datetime.fromtimestamp(now - settings.METRICS_RAW_RETENTION_DAYS * SECONDS_PER_DAY, tz=timezone.utc)
+    latest_ids = select(Position.latest_metric_id).where(Position.latest_metric_id.is_not(None))
+    deleted_metrics = deleted_recommendations = 0
+    while True:
+        begin_write(db_session)
+        metric_ids = db_session.execute(
+            select(PositionMetric.id)
+            .where(PositionMetric.snapshot_at < raw_cutoff, PositionMetric.id.not_in(latest_ids))
+            .order_by(PositionMetric.id).limit(batch_size)
+        ).scalars().all()
+        if not metric_ids:
+            break
+        for i in range(0, len(metric_ids), IN_QUERY_CHUNK_SIZE):
+            chunk = metric_ids[i:i + IN_QUERY_CHUNK_SIZE]
+            recommendation_ids = db_session.execute(
+                select(Recommendation.id).where(Recommendation.metric_id.in_(chunk))
+            ).scalars().all()
+            if recommendation_ids:
+                # Las reutilizaciones que apuntan a una recomendación borrada pierden la referencia.
+                db_session.execute(
+                    update(Recommendation).where(Recommendation.reused_from_id.in_(recommendation_ids))
+                    .values(reused_from_id=None).execution_options(synchronize_session=False)
+                )
+                db_session.execute(
+                    delete(Recommendation).where(Recommendation.id.in_(recommendation_ids))
+                    .execution_options(synchronize_session=False)
+                )
+            db_session.execute(
+                delete(PositionMetric).where(PositionMetric.id.in_(chunk)).execution_options(synchronize_session=False)
+            )
+            deleted_recommendations += len(recommendation_ids)
+        deleted_metrics += len(metric_ids)
+        db_session.commit()
+
+    hourly_cutoff = bucket_start(now - settings.METRICS_HOURLY_RETENTION_DAYS * SECONDS_PER_DAY, "hour")
+    begin_write(db_session)
+    deleted_hourly = db_session.execute(
+        delete(PositionMetricHourly).where(PositionMetricHourly.bucket_start < hourly_cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db_session.commit()
+
+    logger.info(
+        f"Compactación completada: {deleted_metrics} métricas en bruto, {deleted_recommendations} recomendaciones "
+        f"y {deleted_hourly} agregados horarios eliminados."
+    )
+    return {"metrics": deleted_metrics, "recommendations": deleted_recommendations, "hourly_rollups": deleted_hourly}
@@ -1,8 +1,10 @@
 # src/modules/moralis_client.py
 import logging
+import threading
 from typing import List, Dict, Any, Optional
-from moralis import evm_api
 from core.config import settings
+from modules.http_transport import get_http_transport
+from modules.tick_math import get_pool_tick_info, range_to_prices
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +44,33 @@ class MoralisClient:
         else:
             self.api_key = api_key
             logger.info("MoralisClient inicializado con API Key.")
+        self.http = get_http_transport()
+        # Decimales y símbolo por dirección de token; no cambian, se piden una sola vez.
+        self._token_metadata: Dict[str, Dict[str, Any]] = {}
+        self._token_metadata_lock = threading.Lock()
+
+    def _request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None, json: Any = None) -> Any:
+        """Llamada a la API REST de Moralis por el transporte HTTP compartido."""
+        response = self.http.request(
+            method, f"{settings.MORALIS_API_URL}{path}", params=params, json=json, headers={"X-API-Key": self.api_key}
+        )
+        return response.json()
+
+    def _get_token_metadata(self, addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve `{dirección: {"decimals", "symbol"}}`, pidiendo a Moralis solo las que faltan."""
+        addresses = [address.lower() for address in addresses]
+        with self._token_metadata_lock:
+            missing = [address for address in addresses if address not in self._token_metadata]
+        if missing:
+            params = {"chain": settings.CHAIN, **{f"addresses[{i}]": address for i, address in enumerate(missing)}}
+            for token in self._request("GET", "/erc20/metadata", params=params):
+                with self._token_metadata_lock:
+                    self._token_metadata[token["address"].lower()] = {
+                        "decimals": int(token["decimals"]),
+                        "symbol": token.get("symbol"),
+                    }
+        with self._token_metadata_lock:
+            return {address: self._token_metadata[address] for address in addresses if address in self._token_metadata}
             
     def _get_pool_details_from_nft_metadata(self, nft: Dict[str, Any]) -> Dict[str, Any]:
         """Extrae la información del pool del campo de metadatos del NFT."""
@@ -71,8 +100,8 @@ class MoralisClient:
 
         # --- Paso 1 y 2: Obtener y filtrar NFTs de Uniswap V3 ---
         try:
-            params = {"chain": settings.CHAIN, "format": "decimal", "media_items": False, "address": wallet_address}
-            nfts_result = evm_api.nft.get_wallet_nfts(api_key=self.api_key, params=params)
+            params = {"chain": settings.CHAIN, "format": "decimal", "media_items": "false"}
+            nfts_result = self._request("GET", f"/{wallet_address}/nft", params=params)
             
             uniswap_nfts = [nft for nft in nfts_result.get("result", []) if nft["token_address"].lower() == contract_address.lower()]
             logger.info(f"Se encontraron {len(uniswap_nfts)} NFTs de Uniswap V3.")
@@ -81,21 +110,16 @@ class MoralisClient:
             return []
 
         # --- Paso 3: Obtener detalles de cada posición y precio del pool ---
-        all_positions_data = []
+        pending_positions = [] # (info del pool, comisión, tick inferior, tick superior, posición)
         for nft in uniswap_nfts:
             try:
                 token_id = nft["token_id"]
                 logger.info(f"Procesando Token ID: {token_id}...")
 
                 # Obtener detalles de la posición (ticks)
-                params = {
-                    "chain": settings.CHAIN,
-                    "address": contract_address,
-                    "function_name": "positions",
-                    "abi": UNISWAP_V3_ABI,
-                    "params": {"tokenId": token_id}
-                }
-                position_details = evm_api.smart_contract.run_contract_function(api_key=self.api_key, params=params)
+                params = {"chain": settings.CHAIN, "function_name": "positions"}
+                body = {"abi": UNISWAP_V3_ABI, "params": {"tokenId": token_id}}
+                position_details = self._request("POST", f"/{contract_address}/function", params=params, json=body)
                 
                 token0_address = position_details.get("token0")
                 if not token0_address:
@@ -103,44 +127,65 @@ class MoralisClient:
                     continue
                 
                 # Obtener el precio actual del pool (usando el precio de token0)
-                price_params = {"chain": settings.CHAIN, "address": token0_address}
-                price_result = evm_api.token.get_token_price(api_key=self.api_key, params=price_params)
+                price_result = self._request("GET", f"/erc20/{token0_address}/price", params={"chain": settings.CHAIN})
                 
                 # Combinar todos los datos en el formato que nuestra aplicación espera
                 pool_details_from_meta = self._get_pool_details_from_nft_metadata(nft)
-                tick_lower = int(position_details["tickLower"])
-                tick_upper = int(position_details["tickUpper"])
-                
-                # Moralis no devuelve el precio del tick, solo el tick. 
-                # Calculamos el precio desde el tick. Es una fórmula estándar de Uniswap V3.
-                price_lower = 1.0001 ** tick_lower
-                price_upper = 1.0001 ** tick_upper
+                token1_address = position_details.get("token1")
+                tokens = self._get_token_metadata([token0_address, token1_address])
+                token0 = tokens[token0_address.lower()]
+                token1 = tokens[token1_address.lower()]
+                token0_symbol = pool_details_from_meta.get("token0_symbol") or token0["symbol"] or "TOKEN0"
+                token1_symbol = pool_details_from_meta.get("token1_symbol") or token1["symbol"] or "TOKEN1"
 
-                # Si token0 es WETH/ETH, los precios estarán invertidos (ej. USDC/WETH).
-                # La heurística es que si el precio es < 1, probablemente es un par invertido.
-                if price_upper < 1 and price_result["usd_price"] > 1:
-                     price_lower = 1 / (1.0001 ** tick_upper)
-                     price_upper = 1 / (1.0001 ** tick_lower)
-                
-                formatted_position = {
+                # Decimales y orientación salen de los metadatos del pool (cacheados por pool).
+                fee = int(position_details.get("fee", 0))
+                pool_info = get_pool_tick_info(
+                    f"{token0_address.lower()}:{token1_address.lower()}:{fee}",
+                    token0_symbol, token1_symbol, token0["decimals"], token1["decimals"], fee
+                )
+                pending_positions.append((pool_info, fee, int(position_details["tickLower"]), int(position_details["tickUpper"]), {
                     "id": token_id,
                     "pool": {
                         "id": "N/A - Se requiere llamada adicional a 'tokenURI'",
-                        "token0": {"symbol": pool_details_from_meta.get("token0_symbol", "TOKEN0")},
-                        "token1": {"symbol": pool_details_from_meta.get("token1_symbol", "TOKEN1")},
+                        "token0": {"symbol": token0_symbol, "decimals": str(token0["decimals"])},
+                        "token1": {"symbol": token1_symbol, "decimals": str(token1["decimals"])},
                         "token0Price": price_result.get("usd_price", 0)
                     },
-                    "tickLower": {"tickIdx": str(tick_lower), "price0": price_lower},
-                    "tickUpper": {"tickIdx": str(tick_upper), "price0": price_upper}
-                }
-                all_positions_data.append(formatted_position)
+                }))
 
             except Exception as e:
                 logger.error(f"Error al procesar el Token ID {nft.get('token_id')}: {e}", exc_info=True)
                 continue
         
+        # --- Paso 4: Convertir todos los rangos a precios de una sola vez ---
+        all_positions_data = []
+        if pending_positions:
+            infos = [item[0] for item in pending_positions]
+            price_lower, price_upper = range_to_prices(
+                [item[2] for item in pending_positions],
+                [item[3] for item in pending_positions],
+                [info.decimals0 for info in infos],
+                [info.decimals1 for info in infos],
+                [info.invert for info in infos],
+                fees=[item[1] for item in pending_positions],
+            )
+            for (_, _, tick_lower, tick_upper, position), lower, upper in zip(pending_positions, price_lower, price_upper):
+                position["tickLower"] = {"tickIdx": str(tick_lower), "price0": float(lower)}
+                position["tickUpper"] = {"tickIdx": str(tick_upper), "price0": float(upper)}
+                all_positions_data.append(position)
+
         logger.info(f"Proceso completado. Se han formateado {len(all_positions_data)} posiciones.")
         return all_positions_data
 
-# Instancia global
-moralis_client = MoralisClient(api_key=settings.MORALIS_API_KEY)
\ No newline at end of file
+# Instancia global, construida en el primer uso.
+_moralis_client: Optional[MoralisClient] = None
+_moralis_client_lock = threading.Lock()
+
+def get_moralis_client() -> MoralisClient:
+    global _moralis_client
+    if _moralis_client is None:
+        with _moralis_client_lock:
+            if _moralis_client is None:
+                _moralis_client = MoralisClient(api_key=settings.MORALIS_API_KEY)
+    return _moralis_client
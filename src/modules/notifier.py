@@ -1,20 +1,101 @@
 # src/modules/notifier.py
+import time
 import logging
 import asyncio
-from telegram import Bot
-from telegram.error import TelegramError
-# --- NUEVA IMPORTACIÓN ---
-from telegram.helpers import escape_markdown
+import threading
+from typing import Dict, List, Optional, Tuple
 
 from core.config import settings
 from models.recommendation import Recommendation
 
 logger = logging.getLogger(__name__)
 
+# Longitud máxima de un mensaje de Telegram.
+TELEGRAM_MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+TRUNCATION_MARKER = "\n\n_\\(alerta truncada\\)_"
+
+class _TokenBucket:
+    """Limitador de tipo token bucket. Solo se usa desde el hilo del loop, así que no necesita bloqueo."""
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Vacía el bucket durante `seconds`, p. ej. tras un `retry_after` de Telegram."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+def _truncate_alert(message: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> str:
+    """
+    Recorta una alerta más larga que `limit` sin romper el MarkdownV2: corta en un
+    salto de línea si puede (las entidades del formato son de una línea, salvo el
+    bloque de código), no deja un `\\` colgando, cierra el bloque de código abierto
+    y añade `TRUNCATION_MARKER`. Telegram rechaza siempre un mensaje demasiado largo.
+    """
+    if len(message) <= limit:
+        return message
+    budget = limit - len(TRUNCATION_MARKER) - len("\n```")
+    cut = message[:budget]
+    newline = cut.rfind("\n")
+    if newline > budget // 2:
+        cut = cut[:newline]
+    cut = cut.rstrip("\\")
+    if cut.count("```") % 2:
+        cut += "\n```"
+    return cut + TRUNCATION_MARKER
+
+def build_digests(messages: List[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[Tuple[str, int]]:
+    """
+    Agrupa las alertas pendientes de un chat en el menor número de mensajes que
+    caben en el límite de Telegram. Devuelve `(texto, número de alertas)`; una
+    alerta sola se envía tal cual, recortada con `_truncate_alert` si no cabe.
+    """
+    messages = [_truncate_alert(message, limit) for message in messages]
+    if len(messages) <= 1:
+        return [(message, 1) for message in messages]
+    digests, current = [], []
+    for message in messages:
+        candidate = current + [message]
+        header = f"📬 *Resumen: {len(candidate)} alertas*" + DIGEST_SEPARATOR
+        if current and len(header) + len(DIGEST_SEPARATOR.join(candidate)) > limit:
+            digests.append(current)
+            current = [message]
+        else:
+            current = candidate
+    digests.append(current)
+    return [
+        (group[0], 1) if len(group) == 1
+        else (f"📬 *Resumen: {len(group)} alertas*" + DIGEST_SEPARATOR + DIGEST_SEPARATOR.join(group), len(group))
+        for group in digests
+    ]
+
 class Notifier:
-    # ... (el __init__ y el _send_message_async se mantienen igual) ...
+    """
+    Despachador de alertas de Telegram. `send_telegram_message` solo encola y
+    vuelve al momento: los envíos se hacen en un único loop de asyncio que vive en
+    un hilo propio. Las alertas de un mismo chat se agrupan en un resumen hasta
+    `flush()` (fin de ciclo) o hasta que vence la ventana de agrupación, y cada
+    envío respeta los límites global y por chat, reintentando tras `retry_after`.
+    """
     def __init__(self, token: str | None, chat_id: str | None):
         if token and chat_id:
+            from telegram import Bot # Importación diferida: solo si hay credenciales.
             self.bot = Bot(token=token)
             self.chat_id = chat_id
             logger.info("El notificador de Telegram está configurado.")
@@ -22,32 +103,134 @@ class Notifier:
             self.bot = None
             self.chat_id = None
             logger.warning("El notificador de Telegram no está configurado. No se enviarán alertas.")
+        # Estado compartido con los hilos de escaneo.
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[str]] = {}
+        self._outstanding = 0 # Alertas encoladas y aún no entregadas (ni descartadas).
+        self._idle = threading.Condition(self._lock)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"sent_messages": 0, "delivered_alerts": 0, "failed_alerts": 0, "retries": 0}
+        # Estado del hilo del loop.
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._chat_locks: Dict[str, asyncio.Lock] = {}
+        self._chat_buckets: Dict[str, _TokenBucket] = {}
+        self._global_bucket = _TokenBucket(settings.TELEGRAM_GLOBAL_MESSAGES_PER_SECOND, settings.TELEGRAM_GLOBAL_MESSAGES_PER_SECOND)
+
+    # --- API pública (cualquier hilo) ---
 
-    def send_telegram_message(self, message: str):
+    def send_telegram_message(self, message: str, chat_id: Optional[str] = None):
+        """Encola una alerta; nunca espera a Telegram."""
         if not self.bot or not self.chat_id: return
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        task = loop.create_task(self._send_message_async(message))
-        loop.run_until_complete(task)
-
-    async def _send_message_async(self, message: str):
-        try:
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode='MarkdownV2'
+        chat_id = str(chat_id or self.chat_id)
+        with self._lock:
+            self._pending.setdefault(chat_id, []).append(message)
+            self._outstanding += 1
+        self._ensure_loop().call_soon_threadsafe(self._arm_timer, chat_id)
+
+    def flush(self):
+        """Envía ya los resúmenes pendientes de todos los chats (sin esperar a la entrega)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._flush_all)
+
+    def shutdown(self, timeout: float = 30.0) -> bool:
+        """Entrega lo pendiente (hasta `timeout` segundos) y detiene el loop. Devuelve True si no quedó nada."""
+        if self._loop is None:
+            return True
+        self.flush()
+        with self._idle:
+            drained = self._idle.wait_for(lambda: self._outstanding == 0, timeout=timeout)
+        if not drained:
+            logger.warning(f"{self._outstanding} alertas de Telegram sin entregar al detener el notificador.")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop, self._thread = None, None
+        return drained
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "pending_alerts": self._outstanding}
+
+    # --- Hilo del loop ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="telegram-notifier", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _arm_timer(self, chat_id: str):
+        if chat_id not in self._timers:
+            self._timers[chat_id] = self._loop.call_later(
+                settings.NOTIFIER_DIGEST_WINDOW_SECONDS, self._flush_chat, chat_id
             )
-            logger.info(f"Notificación enviada a Telegram Chat ID {self.chat_id}.")
-        except TelegramError as e:
-            logger.error(f"Error al enviar notificación a Telegram: {e}", exc_info=False)
+
+    def _flush_all(self):
+        with self._lock:
+            chat_ids = list(self._pending)
+        for chat_id in chat_ids:
+            self._flush_chat(chat_id)
+
+    def _flush_chat(self, chat_id: str):
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        with self._lock:
+            messages = self._pending.pop(chat_id, [])
+        for text, alerts in build_digests(messages):
+            self._loop.create_task(self._deliver(chat_id, text, alerts))
+
+    async def _deliver(self, chat_id: str, text: str, alerts: int):
+        from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+        # Un lock FIFO por chat mantiene el orden de los mensajes de cada chat.
+        chat_lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        chat_bucket = self._chat_buckets.setdefault(chat_id, _TokenBucket(settings.TELEGRAM_CHAT_MESSAGES_PER_SECOND))
+        delivered = False
+        try:
+            async with chat_lock:
+                for attempt in range(settings.TELEGRAM_MAX_RETRIES + 1):
+                    await chat_bucket.acquire()
+                    await self._global_bucket.acquire()
+                    try:
+                        await self.bot.send_message(chat_id=chat_id, text=text, parse_mode='MarkdownV2')
+                        delivered = True
+                        logger.info(f"Notificación enviada a Telegram Chat ID {chat_id} ({alerts} alertas).")
+                        break
+                    except RetryAfter as e:
+                        retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                        logger.warning(f"Telegram pide esperar {retry_after:.0f}s (chat {chat_id}).")
+                        chat_bucket.pause(retry_after)
+                    except (BadRequest, Forbidden) as e:
+                        # Errores permanentes (formato, longitud, chat inválido o bot bloqueado):
+                        # `BadRequest` hereda de `NetworkError`, pero reintentarlo no sirve.
+                        logger.error(f"Telegram rechazó el mensaje para el chat {chat_id}: {e}. {alerts} alertas descartadas.")
+                        break
+                    except NetworkError as e:
+                        backoff = min(60.0, 2.0 ** attempt)
+                        logger.warning(f"Error de red al enviar a Telegram ({e}). Reintento en {backoff:.0f}s.")
+                        await asyncio.sleep(backoff)
+                    except TelegramError as e:
+                        logger.error(f"Error al enviar notificación a Telegram: {e}", exc_info=False)
+                        break
+                    with self._lock:
+                        self._stats["retries"] += 1
+                else:
+                    logger.error(f"Se agotaron los reintentos para el chat {chat_id}; {alerts} alertas descartadas.")
+        finally:
+            with self._idle:
+                self._outstanding -= alerts
+                self._stats["delivered_alerts" if delivered else "failed_alerts"] += alerts
+                self._stats["sent_messages"] += int(delivered)
+                self._idle.notify_all()
 
 # --- FUNCIÓN DE ESCAPE ELIMINADA ---
 # ya no necesitamos nuestra función `escape_markdown_v2`
 
 def format_recommendation_for_telegram(recommendation: Recommendation) -> str:
+    from telegram.helpers import escape_markdown
     metric = recommendation.metric
     position = metric.position
     
@@ -81,5 +264,14 @@ def format_recommendation_for_telegram(recommendation: Recommendation) -> str:
     )
     return message
 
-# Instancia global (se mantiene igual)
-notifier = Notifier(token=settings.TELEGRAM_BOT_TOKEN, chat_id=settings.TELEGRAM_CHAT_ID)
\ No newline at end of file
+# Instancia global, construida en el primer uso.
+_notifier: Optional[Notifier] = None
+_notifier_lock = threading.Lock()
+
+def get_notifier() -> Notifier:
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = Notifier(token=settings.TELEGRAM_BOT_TOKEN, chat_id=settings.TELEGRAM_CHAT_ID)
+    return _notifier
@@ -0,0 +1,176 @@
+# src/modules/pool_cache.py
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PoolMetadataCache:
+    """
+    Caché en memoria, con TTL, de los datos de pool que casi nunca cambian:
+    símbolos y decimales de los tokens y nivel de comisión. Se comparte entre
+    ciclos de escaneo, así que un pool popular se consulta una vez por TTL.
+    """
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.POOL_METADATA_TTL_SECONDS
+        self._entries: Dict[str, tuple] = {} # pool -> (caduca en, metadatos)
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def _fresh(self, pool_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                pool_id: entry[1] for pool_id in pool_ids
+                if (entry := self._entries.get(pool_id)) is not None and entry[0] > now
+            }
+
+    def get(self, subgraph_client, pool_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve `{pool_id: metadatos}`; los pools ausentes o caducados se piden en una consulta."""
+        ids = sorted({pool_id.lower() for pool_id in pool_ids})
+        found = self._fresh(ids)
+        if len(found) == len(ids):
+            return found
+        # Un solo hilo consulta a la vez: los demás suelen esperar los mismos pools.
+        with self._fetch_lock:
+            found = self._fresh(ids)
+            missing = [pool_id for pool_id in ids if pool_id not in found]
+            if missing:
+                fetched = subgraph_client.get_pools_metadata(missing)
+                expires_at = time.monotonic() + self.ttl_seconds
+                with self._lock:
+                    for pool_id, pool in fetched.items():
+                        self._entries[pool_id] = (expires_at, pool)
+                found.update(fetched)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class PoolStateCache:
+    """
+    Estado de los pools (precio, tick, crecimiento de comisiones y precio en ETH
+    de los tokens) en un bloque, compartido por todos los lotes de wallets de un
+    ciclo. Las consultas de posiciones solo piden `pool { id }` y `attach` completa
+    cada posición con el estado y los metadatos del pool, así que cada pool se
+    descarga una vez por ciclo aunque aparezca en miles de posiciones.
+
+    Si no se fija `block_number`, se adopta el bloque de la primera página que se
+    completa: el estado del pool y el de las posiciones deben ser del mismo bloque
+    para que el crecimiento de comisiones sea coherente.
+    """
+    def __init__(self, subgraph_client, block_number: Optional[int] = None, metadata_cache: Optional[PoolMetadataCache] = None):
+        self.subgraph_client = subgraph_client
+        self.block_number = block_number
+        self.metadata_cache = metadata_cache or get_pool_metadata_cache()
+        self._states: Dict[str, Optional[Dict[str, Any]]] = {} # None = el pool no existe en ese bloque.
+        self._pools: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._positions = 0
+
+    def _resolve_states(self, pool_ids: List[str]):
+        """Descarga el estado de los pools que faltan; si otro hilo ya los está pidiendo, lo espera."""
+        pending = set(pool_ids)
+        while pending:
+            with self._lock:
+                pending = {pool_id for pool_id in pending if pool_id not in self._states}
+                to_fetch = sorted(pool_id for pool_id in pending if pool_id not in self._inflight)
+                waits = [self._inflight[pool_id] for pool_id in pending if pool_id in self._inflight]
+                for pool_id in to_fetch:
+                    self._inflight[pool_id] = threading.Event()
+                if to_fetch:
+                    self._requests += 1
+            if to_fetch:
+                try:
+                    _, states = self.subgraph_client.get_pool_states(to_fetch, self.block_number)
+                    with self._lock:
+                        for pool_id in to_fetch:
+                            self._states[pool_id] = states.get(pool_id)
+                finally:
+                    with self._lock:
+                        events = [self._inflight.pop(pool_id) for pool_id in to_fetch]
+                    for event in events:
+                        event.set()
+            for event in waits:
+                event.wait()
+            if not to_fetch and not waits:
+                return
+
+    def get(self, pool_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve `{pool_id: pool}` con los mismos campos que traía antes cada posición."""
+        ids = sorted({pool_id.lower() for pool_id in pool_ids})
+        with self._lock:
+            pools = {pool_id: self._pools[pool_id] for pool_id in ids if pool_id in self._pools}
+        missing = [pool_id for pool_id in ids if pool_id not in pools]
+        if not missing:
+            return pools
+
+        self._resolve_states(missing)
+        metadata = self.metadata_cache.get(self.subgraph_client, missing)
+        with self._lock:
+            for pool_id in missing:
+                state, meta = self._states.get(pool_id), metadata.get(pool_id)
+                if state is None or meta is None:
+                    continue
+                if pool_id not in self._pools:
+                    self._pools[pool_id] = {
+                        **state,
+                        "feeTier": meta.get("feeTier"),
+                        "token0": {**meta["token0"], "derivedETH": state["token0"]["derivedETH"]},
+                        "token1": {**meta["token1"], "derivedETH": state["token1"]["derivedETH"]},
+                    }
+                pools[pool_id] = self._pools[pool_id]
+        return pools
+
+    def attach(self, positions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Sustituye el `pool { id }` de cada posición por el pool completo (un mismo
+        dict compartido entre las posiciones del pool) y devuelve las posiciones
+        completadas. Las de pools sin estado en el bloque se descartan con aviso.
+        """
+        if not positions:
+            return positions
+        if self.block_number is None:
+            self.block_number = positions[0].get("blockNumber")
+        pools = self.get(pos["pool"]["id"] for pos in positions)
+        attached, skipped = [], defaultdict(int)
+        for pos in positions:
+            pool = pools.get(pos["pool"]["id"].lower())
+            if pool is None:
+                skipped[pos["pool"]["id"]] += 1
+                continue
+            pos["pool"] = pool
+            attached.append(pos)
+        for pool_id, count in skipped.items():
+            logger.warning(f"Sin estado para el pool {pool_id} en el bloque {self.block_number}. Se omiten {count} posiciones.")
+        with self._lock:
+            self._positions += len(attached)
+        return attached
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "block_number": self.block_number,
+                "positions": self._positions,
+                "pools": sum(1 for state in self._states.values() if state is not None),
+                "requests": self._requests,
+            }
+
+# Instancia global, construida en el primer uso.
+_pool_metadata_cache: Optional[PoolMetadataCache] = None
+_pool_metadata_cache_lock = threading.Lock()
+
+def get_pool_metadata_cache() -> PoolMetadataCache:
+    global _pool_metadata_cache
+    if _pool_metadata_cache is None:
+        with _pool_metadata_cache_lock:
+            if _pool_metadata_cache is None:
+                _pool_metadata_cache = PoolMetadataCache()
+    return _pool_metadata_cache
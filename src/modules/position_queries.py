@@ -0,0 +1,104 @@
+# src/modules/position_queries.py
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from models import Position, PositionMetric, PositionMetricWeekly
+from modules.metric_rollups import rollups_fully_rebuilt
+
+DEFAULT_PAGE_SIZE = 100
+
+class Page(NamedTuple):
+    """Una página de resultados y el cursor para pedir la siguiente (None si no hay más)."""
+    items: List[Any]
+    next_cursor: Optional[Any]
+
+def _page(rows: list, limit: int, cursor_of) -> Page:
+    """Se piden `limit + 1` filas: la sobrante indica que hay otra página sin necesidad de un COUNT."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return Page(rows, cursor_of(rows[-1]))
+    return Page(rows, None)
+
+def latest_states(
+    db_session, wallet_id: Optional[int] = None, after_position_id: int = 0, limit: int = DEFAULT_PAGE_SIZE
+) -> Page:
+    """
+    Estado actual de las posiciones (de una wallet o de todas) como pares
+    `(Position, PositionMetric)`, paginado por id de posición. Lee la métrica a
+    través de `latest_metric_id`, así que el coste depende del número de
+    posiciones y no del histórico. Las posiciones sin métricas no aparecen.
+    El cursor es el último id de posición devuelto.
+    """
+    query = (
+        db_session.query(Position, PositionMetric)
+        .join(PositionMetric, PositionMetric.id == Position.latest_metric_id)
+        .filter(Position.id > after_position_id)
+    )
+    if wallet_id is not None:
+        query = query.filter(Position.wallet_id == wallet_id)
+    rows = query.order_by(Position.id).limit(limit + 1).all()
+    return _page(rows, limit, lambda row: row[0].id)
+
+def out_of_range_positions(
+    db_session, wallet_id: Optional[int] = None, after_position_id: int = 0, limit: int = DEFAULT_PAGE_SIZE
+) -> Page:
+    """Como `latest_states`, pero solo las posiciones cuya última métrica está fuera de rango."""
+    query = (
+        db_session.query(Position, PositionMetric)
+        .join(PositionMetric, PositionMetric.id == Position.latest_metric_id)
+        .filter(Position.id > after_position_id, PositionMetric.is_in_range.is_(False))
+    )
+    if wallet_id is not None:
+        query = query.filter(Position.wallet_id == wallet_id)
+    rows = query.order_by(Position.id).limit(limit + 1).all()
+    return _page(rows, limit, lambda row: row[0].id)
+
+def metric_history(
+    db_session, position_id: int,
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None, limit: int = DEFAULT_PAGE_SIZE
+) -> Page:
+    """
+    Métricas de una posición en la ventana `[since, until)`, en orden cronológico y
+    paginadas por `(snapshot_at, id)`, que es el índice compuesto de la tabla. El
+    cursor es la tupla `(snapshot_at, id)` de la última métrica devuelta.
+    Para series largas conviene leer los agregados de `metric_rollups`.
+    """
+    query = db_session.query(PositionMetric).filter(PositionMetric.position_id == position_id)
+    if since is not None:
+        query = query.filter(PositionMetric.snapshot_at >= since)
+    if until is not None:
+        query = query.filter(PositionMetric.snapshot_at < until)
+    if after is not None:
+        after_snapshot, after_id = after
+        query = query.filter(or_(
+            PositionMetric.snapshot_at > after_snapshot,
+            and_(PositionMetric.snapshot_at == after_snapshot, PositionMetric.id > after_id),
+        ))
+    rows = query.order_by(PositionMetric.snapshot_at, PositionMetric.id).limit(limit + 1).all()
+    return _page(rows, limit, lambda metric: (metric.snapshot_at, metric.id))
+
+def sample_counts(db_session, position_ids: List[int]) -> dict:
+    """
+    `{position_id: snapshots registrados}`, incluidos los ya compactados. Suma los
+    agregados semanales en lugar de contar `position_metrics`. Mientras no se haya
+    completado la reconstrucción de los agregados (una base de datos anterior a
+    ellos) cuenta las filas en bruto: hasta entonces la compactación no borra ninguna.
+    """
+    if not position_ids:
+        return {}
+    if not rollups_fully_rebuilt(db_session):
+        rows = (
+            db_session.query(PositionMetric.position_id, func.count(PositionMetric.id))
+            .filter(PositionMetric.position_id.in_(position_ids))
+            .group_by(PositionMetric.position_id)
+        )
+        return {position_id: int(samples) for position_id, samples in rows}
+    rows = (
+        db_session.query(PositionMetricWeekly.position_id, func.sum(PositionMetricWeekly.samples))
+        .filter(PositionMetricWeekly.position_id.in_(position_ids))
+        .group_by(PositionMetricWeekly.position_id)
+    )
+    return {position_id: int(samples or 0) for position_id, samples in rows}
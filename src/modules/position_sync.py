@@ -0,0 +1,395 @@
+# src/modules/position_sync.py
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from sqlalchemy import DateTime, bindparam, insert, or_, select, update
+from sqlalchemy.orm import joinedload
+
+from core.database import begin_write, insert_ignore
+from models import Wallet, Position, PositionMetric, Recommendation
+from modules.entry_prices import apply_entry_prices, lookup_entry_prices
+from modules.metric_rollups import update_rollups
+from modules.range_index import get_range_index
+from modules.calculations import (
+    batch_impermanent_loss,
+    batch_unclaimed_fees_usd,
+    batch_real_apr
+)
+from modules.uniswap_math import (
+    batch_amounts_for_liquidity,
+    batch_concentrated_impermanent_loss,
+    batch_sqrt_price_from_x96,
+    batch_tick_to_price,
+    batch_uncollected_fees
+)
+
+logger = logging.getLogger(__name__)
+
+# SQLite limita el número de parámetros por sentencia; las consultas `IN` se trocean.
+IN_QUERY_CHUNK_SIZE = 500
+
+def load_positions_by_token_id(db_session, token_ids: Iterable[int]) -> Dict[int, Position]:
+    """Precarga con consultas `IN` todas las posiciones conocidas, indexadas por `token_id`."""
+    ids = sorted(set(token_ids))
+    positions = {}
+    for i in range(0, len(ids), IN_QUERY_CHUNK_SIZE):
+        chunk = ids[i:i + IN_QUERY_CHUNK_SIZE]
+        for position in db_session.query(Position).filter(Position.token_id.in_(chunk)):
+            positions[position.token_id] = position
+    return positions
+
+def _creation_timestamp(api_position: Dict[str, Any]) -> int:
+    return int(api_position.get("transaction", {}).get("timestamp", 0))
+
+def _new_position_row(wallet: Wallet, api_position: Dict[str, Any]) -> Dict[str, Any]:
+    pool = api_position.get('pool', {})
+    creation_timestamp = _creation_timestamp(api_position)
+    return {
+        "token_id": int(api_position.get('id')),
+        "wallet_id": wallet.id,
+        "pool_address": pool.get('id'),
+        "token0_symbol": pool.get('token0', {}).get('symbol'),
+        "token1_symbol": pool.get('token1', {}).get('symbol'),
+        "tick_lower": api_position.get('tickLower', {}).get('tickIdx'),
+        "tick_upper": api_position.get('tickUpper', {}).get('tickIdx'),
+        "entry_timestamp": creation_timestamp or None,
+    }
+
+def upsert_positions(
+    db_session, wallets_by_owner: Dict[str, Wallet], api_positions: List[Dict[str, Any]],
+    known: Optional[Dict[int, Position]] = None
+) -> Dict[int, Position]:
+    """
+    Devuelve `{token_id: Position}` para todas las posiciones de la página. Las que
+    no existen se crean con un único INSERT masivo que ignora conflictos (otro hilo
+    de escaneo puede haberlas creado entretanto) y se recargan con una consulta `IN`.
+    `known` es la precarga de `load_positions_by_token_id`, si ya se hizo.
+    """
+    if known is None:
+        known = load_positions_by_token_id(db_session, (int(p.get('id')) for p in api_positions))
+    known = dict(known)
+
+    new_rows = []
+    for api_position in api_positions:
+        token_id = int(api_position.get('id'))
+        if token_id in known:
+            continue
+        wallet = wallets_by_owner[api_position.get("owner", "").lower()]
+        new_rows.append(_new_position_row(wallet, api_position))
+
+    if new_rows:
+        logger.info(f"{len(new_rows)} posiciones nuevas encontradas. Creándolas en la base de datos.")
+        db_session.execute(insert_ignore(Position, db_session.get_bind()), new_rows)
+        known.update(load_positions_by_token_id(db_session, (row["token_id"] for row in new_rows)))
+    return known
+
+def _missing_entry_prices(known: Dict[int, Position], api_positions: List[Dict[str, Any]]) -> List[tuple]:
+    """Pares `(pool, entry_timestamp)` de las posiciones de la página que aún no tienen precio de entrada."""
+    entries = []
+    for api_position in api_positions:
+        db_position = known.get(int(api_position.get('id')))
+        if db_position is None:
+            entries.append(((api_position.get('pool') or {}).get('id'), _creation_timestamp(api_position)))
+        elif db_position.entry_price is None:
+            entries.append((db_position.pool_address, db_position.entry_timestamp or _creation_timestamp(api_position)))
+    return entries
+
+def _has_exact_fields(api_position: Dict[str, Any]) -> bool:
+    """Indica si el resultado del Subgraph trae todo lo necesario para la matemática exacta."""
+    pool = api_position.get('pool') or {}
+    tick_lower, tick_upper = api_position.get('tickLower') or {}, api_position.get('tickUpper') or {}
+    values = [
+        api_position.get('liquidity'), api_position.get('feeGrowthInside0LastX128'), api_position.get('feeGrowthInside1LastX128'),
+        pool.get('sqrtPrice'), pool.get('tick'), pool.get('feeGrowthGlobal0X128'), pool.get('feeGrowthGlobal1X128'),
+        (pool.get('token0') or {}).get('decimals'), (pool.get('token1') or {}).get('decimals'),
+        tick_lower.get('feeGrowthOutside0X128'), tick_lower.get('feeGrowthOutside1X128'),
+        tick_upper.get('feeGrowthOutside0X128'), tick_upper.get('feeGrowthOutside1X128'),
+    ]
+    return all(value is not None for value in values) and int(pool['sqrtPrice']) > 0
+
+def compute_exact_position_values(api_positions: List[Dict[str, Any]], entry_prices: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Valores exactos de liquidez concentrada para posiciones con `_has_exact_fields`:
+    cantidades actuales a partir de `liquidity`, comisiones no reclamadas a partir del
+    crecimiento de comisiones en Q128, límites del rango con decimales e IL del rango.
+    Los precios se devuelven en la orientación de `token0Price` (token0 por token1),
+    la misma que `current_price` y `entry_price`.
+    """
+    pools = [p['pool'] for p in api_positions]
+    decimals0 = np.array([int(pool['token0']['decimals']) for pool in pools], dtype=float)
+    decimals1 = np.array([int(pool['token1']['decimals']) for pool in pools], dtype=float)
+    liquidity = [int(p['liquidity']) for p in api_positions]
+    pool_ticks = [int(pool['tick']) for pool in pools]
+    ticks_lower = [int(p['tickLower']['tickIdx']) for p in api_positions]
+    ticks_upper = [int(p['tickUpper']['tickIdx']) for p in api_positions]
+    scale0, scale1 = np.power(10.0, decimals0), np.power(10.0, decimals1)
+
+    # Precios token1/token0 ajustados por decimales, como en los contratos.
+    sqrt_price = batch_sqrt_price_from_x96(pool['sqrtPrice'] for pool in pools)
+    price = sqrt_price ** 2 * scale0 / scale1
+    range_low = batch_tick_to_price(ticks_lower, decimals0, decimals1)
+    range_high = batch_tick_to_price(ticks_upper, decimals0, decimals1)
+
+    amount0, amount1 = batch_amounts_for_liquidity(
+        sqrt_price, np.power(1.0001, np.array(ticks_lower) / 2), np.power(1.0001, np.array(ticks_upper) / 2), liquidity
+    )
+    fees = []
+    for token in ("0", "1"):
+        fees.append(batch_uncollected_fees(
+            liquidity, pool_ticks, ticks_lower, ticks_upper,
+            [pool[f'feeGrowthGlobal{token}X128'] for pool in pools],
+            [p['tickLower'][f'feeGrowthOutside{token}X128'] for p in api_positions],
+            [p['tickUpper'][f'feeGrowthOutside{token}X128'] for p in api_positions],
+            [p[f'feeGrowthInside{token}LastX128'] for p in api_positions],
+        ))
+
+    entry_price = np.divide(1.0, entry_prices, out=np.full_like(entry_prices, np.nan), where=entry_prices > 0)
+    return {
+        "price_lower": 1.0 / range_high,
+        "price_upper": 1.0 / range_low,
+        "is_in_range": (np.array(ticks_lower) <= np.array(pool_ticks)) & (np.array(pool_ticks) < np.array(ticks_upper)),
+        "amount0": amount0 / scale0,
+        "amount1": amount1 / scale1,
+        "fees0": fees[0] / scale0,
+        "fees1": fees[1] / scale1,
+        "il_percent": batch_concentrated_impermanent_loss(entry_price, price, range_low, range_high),
+    }
+
+def compute_position_metrics(
+    db_positions: List[Position], api_positions: List[Dict[str, Any]], current_timestamp: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Calcula las métricas financieras de un lote de posiciones a partir del resultado
+    del Subgraph y las devuelve como filas listas para insertar en `position_metrics`.
+    Los campos se extraen a columnas y los cálculos se hacen de una pasada con las
+    versiones vectorizadas de `calculations`, con un único instante de referencia.
+    Las posiciones con los campos de liquidez y crecimiento de comisiones usan la
+    matemática exacta de `uniswap_math`; el resto conserva las aproximaciones.
+    El precio de entrada debe haberse resuelto antes con `apply_entry_prices`.
+    """
+    if not api_positions:
+        return []
+
+    # --- 1. EXTRACCIÓN Y PREPARACIÓN DE DATOS ---
+    def column(extract) -> np.ndarray:
+        return np.array([float(extract(api_position)) for api_position in api_positions], dtype=float)
+
+    eth_price_usd = column(lambda p: p.get('ethPriceUSD', 0))
+    token0_price_usd = column(lambda p: p.get('pool', {}).get('token0', {}).get('derivedETH', 0)) * eth_price_usd
+    token1_price_usd = column(lambda p: p.get('pool', {}).get('token1', {}).get('derivedETH', 0)) * eth_price_usd
+
+    current_price_ratio = column(lambda p: p.get('pool', {}).get('token0Price', 0))
+    tick_lower_price = column(lambda p: p.get('tickLower', {}).get('price0'))
+    tick_upper_price = column(lambda p: p.get('tickUpper', {}).get('price0'))
+    price_lower = np.minimum(tick_lower_price, tick_upper_price)
+    price_upper = np.maximum(tick_lower_price, tick_upper_price)
+    creation_timestamps = column(lambda p: p.get("transaction", {}).get("timestamp", 0))
+    initial_price_ratio = np.array(
+        [np.nan if position.entry_price is None else position.entry_price for position in db_positions], dtype=float
+    )
+
+    # --- 2. CÁLCULOS FINANCIEROS AVANZADOS ---
+
+    # Cálculo de Pérdida Impermanente (IL); sin precio de entrada queda en 0.
+    il_percent = batch_impermanent_loss(initial_price_ratio, current_price_ratio)
+
+    # Cálculo de Fees no Reclamados en USD
+    unclaimed_fees_usd = batch_unclaimed_fees_usd(
+        column(lambda p: p.get('collectedFeesToken0', 0)), column(lambda p: p.get('collectedFeesToken1', 0)),
+        token0_price_usd, token1_price_usd
+    )
+
+    total_liquidity_usd = (
+        column(lambda p: p.get('depositedToken0', 0)) * token0_price_usd
+        + column(lambda p: p.get('depositedToken1', 0)) * token1_price_usd
+    )
+    is_in_range = (price_lower <= current_price_ratio) & (current_price_ratio <= price_upper)
+
+    # --- 3. MATEMÁTICA EXACTA DE LIQUIDEZ CONCENTRADA ---
+    # Sustituye la IL de rango completo, las fees ya cobradas y el valor depositado
+    # por la IL del rango, las fees pendientes y el valor actual de la liquidez.
+    exact = np.array([_has_exact_fields(p) for p in api_positions], dtype=bool)
+    if exact.any():
+        values = compute_exact_position_values(
+            [p for p, has_fields in zip(api_positions, exact) if has_fields], initial_price_ratio[exact]
+        )
+        price_lower[exact], price_upper[exact] = values["price_lower"], values["price_upper"]
+        is_in_range[exact] = values["is_in_range"]
+        il_percent[exact] = values["il_percent"]
+        unclaimed_fees_usd[exact] = values["fees0"] * token0_price_usd[exact] + values["fees1"] * token1_price_usd[exact]
+        total_liquidity_usd[exact] = values["amount0"] * token0_price_usd[exact] + values["amount1"] * token1_price_usd[exact]
+
+    # Cálculo de APR Real (Fees vs IL)
+    real_apr = batch_real_apr(unclaimed_fees_usd, total_liquidity_usd, creation_timestamps, il_percent, current_timestamp)
+
+    logger.info(
+        f"Métricas calculadas para {len(api_positions)} posiciones: IL media={il_percent.mean():.2f}%, "
+        f"Fees=${unclaimed_fees_usd.sum():.2f}, {int(is_in_range.sum())} en rango, {int(exact.sum())} con matemática exacta."
+    )
+
+    return [
+        {
+            "position_id": db_position.id,
+            "current_price": float(current_price_ratio[i]),
+            "price_lower": float(price_lower[i]),
+            "price_upper": float(price_upper[i]),
+            "is_in_range": bool(is_in_range[i]),
+            "impermanent_loss_percent": float(il_percent[i]),
+            "unclaimed_fees_usd": float(unclaimed_fees_usd[i]),
+            "real_apr_percent": float(real_apr[i]),
+        }
+        for i, db_position in enumerate(db_positions)
+    ]
+
+def sync_positions_bulk(
+    db_session, wallets_by_owner: Dict[str, Wallet], api_positions: List[Dict[str, Any]]
+) -> List[int]:
+    """
+    Ruta de persistencia masiva para una página de posiciones del Subgraph:
+    una precarga `IN`, los precios de entrada que falten resueltos en lote, un
+    INSERT masivo para las posiciones nuevas y todas las métricas escritas con un
+    único INSERT multi-fila. Los agregados por hora, día y semana se actualizan en
+    la misma transacción. Devuelve los ids de las métricas creadas; el llamador
+    decide cuándo confirmar.
+    """
+    api_positions = [p for p in api_positions if p.get("owner", "").lower() in wallets_by_owner]
+    if not api_positions:
+        return []
+
+    known = load_positions_by_token_id(db_session, (int(p.get('id')) for p in api_positions))
+    # Las consultas de red (bloques y precios de entrada) van antes de la primera escritura:
+    # nada espera a Etherscan ni al Subgraph con la transacción de escritura abierta.
+    entry_prices = lookup_entry_prices(_missing_entry_prices(known, api_positions))
+
+    begin_write(db_session)
+    positions = upsert_positions(db_session, wallets_by_owner, api_positions, known)
+    observe_pool_ticks(positions.values(), api_positions)
+
+    # Filas antiguas sin timestamp de entrada lo toman del resultado actual.
+    for api_position in api_positions:
+        db_position = positions[int(api_position.get('id'))]
+        creation_timestamp = _creation_timestamp(api_position)
+        if not db_position.entry_timestamp and creation_timestamp:
+            db_position.entry_timestamp = creation_timestamp
+    apply_entry_prices(positions.values(), entry_prices)
+    db_session.flush()
+
+    # Un único instante por ciclo: el APR y los agregados usan el mismo `snapshot_at`.
+    snapshot_at = datetime.now(timezone.utc)
+    metric_rows = compute_position_metrics(
+        [positions[int(api_position.get('id'))] for api_position in api_positions], api_positions,
+        current_timestamp=int(snapshot_at.timestamp())
+    )
+    for row in metric_rows:
+        row["snapshot_at"] = snapshot_at
+    result = db_session.execute(
+        insert(PositionMetric).returning(PositionMetric.id, PositionMetric.position_id),
+        metric_rows,
+    )
+    inserted = result.all()
+    update_latest_metrics(db_session, [(metric_id, position_id, snapshot_at) for metric_id, position_id in inserted])
+    update_rollups(db_session, metric_rows)
+    return [metric_id for metric_id, _ in inserted]
+
+def update_latest_metrics(db_session, metrics: Iterable[tuple]):
+    """
+    Mantiene `Position.latest_metric_id` a partir de métricas recién insertadas,
+    dadas como `(metric_id, position_id, snapshot_at)`. Un único UPDATE tipo
+    executemany que solo avanza el puntero si la métrica nueva no es más antigua
+    que la actual, así que el backfill de histórico no lo hace retroceder.
+    """
+    newest: Dict[int, tuple] = {}
+    for metric_id, position_id, snapshot_at in metrics:
+        current = newest.get(position_id)
+        if current is None or (snapshot_at, metric_id) > (current[1], current[0]):
+            newest[position_id] = (metric_id, snapshot_at)
+    if not newest:
+        return
+
+    positions = Position.__table__
+    current_snapshot = (
+        select(PositionMetric.snapshot_at).where(PositionMetric.id == positions.c.latest_metric_id).scalar_subquery()
+    )
+    statement = (
+        update(positions)
+        .where(
+            positions.c.id == bindparam("target_position_id"),
+            or_(
+                positions.c.latest_metric_id.is_(None),
+                current_snapshot.is_(None),
+                current_snapshot <= bindparam("target_snapshot_at", type_=DateTime(timezone=True)),
+            ),
+        )
+        .values(latest_metric_id=bindparam("target_metric_id"))
+    )
+    db_session.execute(statement, [
+        {"target_position_id": position_id, "target_metric_id": metric_id, "target_snapshot_at": snapshot_at}
+        for position_id, (metric_id, snapshot_at) in newest.items()
+    ])
+
+def observe_pool_ticks(positions: Iterable[Position], api_positions: List[Dict[str, Any]]):
+    """Mantiene el índice de rangos al día con las posiciones y los ticks de pool vistos en la página."""
+    range_index = get_range_index()
+    range_index.upsert(positions)
+    ticks = {}
+    for api_position in api_positions:
+        pool = api_position.get('pool') or {}
+        if pool.get('id') and pool.get('tick') is not None:
+            block_number = api_position.get('blockNumber')
+            ticks[pool['id']] = (int(pool['tick']), int(block_number) if block_number is not None else None)
+    flips = [
+        flip for pool, (tick, block_number) in ticks.items() for flip in range_index.observe_tick(pool, tick, block_number)
+    ]
+    if flips:
+        entered = sum(1 for flip in flips if flip.in_range)
+        logger.info(f"{len(flips)} posiciones cambiaron de estado de rango: {entered} entraron y {len(flips) - entered} salieron.")
+    return flips
+
+def untrack_closed_positions(db_session, wallet_ids: Iterable[int], seen_token_ids: Iterable[int]) -> List[int]:
+    """
+    Quita del índice de rangos las posiciones de esas wallets que el Subgraph ya no
+    devuelve: las consultas solo traen posiciones con liquidez, así que una ausente
+    se cerró (liquidez 0) o cambió de dueño. Solo debe llamarse con el escaneo
+    completo de las wallets. Devuelve los ids de las posiciones retiradas.
+    """
+    wallet_ids = list(wallet_ids)
+    if not wallet_ids:
+        return []
+    seen = set(seen_token_ids)
+    rows = db_session.query(Position.id, Position.token_id).filter(Position.wallet_id.in_(wallet_ids)).all()
+    removed = get_range_index().remove(position_id for position_id, token_id in rows if token_id not in seen)
+    if removed:
+        logger.info(f"{len(removed)} posiciones sin liquidez o transferidas dejan de seguirse en el índice de rangos.")
+    return removed
+
+def load_metrics(db_session, metric_ids: List[int]) -> List[PositionMetric]:
+    """Carga métricas junto con su posición con consultas `IN`, ordenadas por id."""
+    ids = sorted(metric_ids)
+    metrics = []
+    for i in range(0, len(ids), IN_QUERY_CHUNK_SIZE):
+        chunk = ids[i:i + IN_QUERY_CHUNK_SIZE]
+        query = db_session.query(PositionMetric).options(joinedload(PositionMetric.position))
+        metrics.extend(query.filter(PositionMetric.id.in_(chunk)).order_by(PositionMetric.id))
+    return metrics
+
+def insert_recommendations(db_session, recommendations: List[Recommendation]):
+    """Escribe un lote de recomendaciones con un único INSERT tipo executemany."""
+    if not recommendations:
+        return
+    rows = [
+        {
+            "metric_id": recommendation.metric.id,
+            "recommendation_action": recommendation.recommendation_action,
+            "justification": recommendation.justification,
+            "raw_model_output": recommendation.raw_model_output,
+            "state_fingerprint": recommendation.state_fingerprint,
+            "reused_from_id": recommendation.reused_from_id,
+            "decision_source": recommendation.decision_source,
+        }
+        for recommendation in recommendations
+    ]
+    begin_write(db_session)
+    db_session.execute(insert(Recommendation), rows)
@@ -1,24 +1,72 @@
 import os
 import sys
 import json
+import glob
+import pickle
+import hashlib
 import logging
 import re
-import requests
-from tqdm import tqdm
-from llama_cpp import Llama
+import threading
+from typing import Optional
 from core.config import settings
 from models.metric import PositionMetric
 
 logger = logging.getLogger(__name__)
 
+RECOMMENDATION_ACTIONS = ("MAINTAIN", "REBALANCE", "CLOSE")
+
+# Gramática GBNF de la respuesta final: la acción siempre es una del enum y la
+# justificación siempre es una cadena JSON.
+ANSWER_GRAMMAR = r'''
+root          ::= "{" ws "\"action\":" ws action ws "," ws "\"justification\":" ws string ws "}"
+action        ::= %s
+string        ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ["\\/bfnrt] )* "\""
+ws            ::= [ \t\n]*
+''' % " | ".join(f'"\\"{action}\\""' for action in RECOMMENDATION_ACTIONS)
+
+def _json_object_closed(text: str) -> bool:
+    """Indica si `text` ya contiene un objeto JSON completo (llaves equilibradas fuera de cadenas)."""
+    depth, in_string, escaped, started = 0, False, False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth, started = depth + 1, True
+        elif char == "}":
+            depth -= 1
+            if started and depth == 0:
+                return True
+    return False
+
+def build_prompt_context(metric: PositionMetric) -> dict:
+    """Extrae de una métrica los datos que necesita el prompt, como un dict serializable."""
+    position = metric.position
+    return {
+        "pool": f"{position.token0_symbol}/{position.token1_symbol}",
+        "price_lower": metric.price_lower,
+        "price_upper": metric.price_upper,
+        "current_price": metric.current_price,
+        "is_in_range": metric.is_in_range,
+        "impermanent_loss_percent": metric.impermanent_loss_percent,
+    }
+
 class QwenAgent:
-    def __init__(self, model_path: str, n_gpu_layers: int):
+    def __init__(self, model_path: str, n_gpu_layers: int, n_threads: Optional[int] = None):
         """
         Inicializa el agente. Comprueba si el modelo existe, si no, lo descarga.
         Luego, carga el modelo LLM.
         """
         self.model_path = model_path
         self.model_download_url = "https://huggingface.co/Qwen/Qwen3-4B-GGUF/resolve/main/Qwen3-4B-Q8_0.gguf"
+        # Una instancia de Llama no es segura entre hilos; el escaneo concurrente la comparte.
+        self._lock = threading.Lock()
         
         # Paso 1: Descargar el modelo si es necesario
         self._download_model_if_not_exists()
@@ -26,13 +74,20 @@ class QwenAgent:
         # Paso 2: Cargar el modelo
         logger.info(f"Cargando modelo LLM desde: {self.model_path}")
         try:
+            from llama_cpp import Llama # Importación diferida: carga la librería nativa.
             self.model = Llama(
                 model_path=self.model_path,
                 n_gpu_layers=n_gpu_layers,
                 n_ctx=4096,
+                n_threads=n_threads,
                 verbose=False
             )
             logger.info("Modelo LLM cargado exitosamente.")
+            self._prime_prefix_cache()
+            self._answer_grammar = None
+            if settings.LLM_GENERATION_MODE == "grammar":
+                from llama_cpp import LlamaGrammar
+                self._answer_grammar = LlamaGrammar.from_string(ANSWER_GRAMMAR, verbose=False)
         except Exception as e:
             logger.error(f"Error fatal al cargar el modelo LLM: {e}", exc_info=True)
             # Salir si el modelo no se puede cargar, ya que la aplicación no puede funcionar.
@@ -47,6 +102,8 @@ class QwenAgent:
         logger.warning(f"El modelo LLM no se encuentra en '{self.model_path}'.")
         logger.info(f"Iniciando descarga desde: {self.model_download_url}")
 
+        import requests
+        from tqdm import tqdm
         model_dir = os.path.dirname(self.model_path)
         os.makedirs(model_dir, exist_ok=True)
         
@@ -75,10 +132,9 @@ class QwenAgent:
             raise RuntimeError(f"No se pudo descargar el modelo desde {self.model_download_url}") from e
 
 
-    def _build_prompt(self, metric: PositionMetric) -> str:
-        position = metric.position
-        
-        prompt_template = f"""<|im_start|>system
+    def _build_prompt_prefix(self) -> str:
+        """Parte estática del prompt (sistema + ejemplo few-shot), idéntica en cada llamada."""
+        return """<|im_start|>system
         Eres un analista experto en DeFi. Tu proceso es:
         1.  Primero, razona de forma CONCISA sobre la posición dentro de las etiquetas <thinking>.
         2.  Después, proporciona tu recomendación final como un objeto JSON dentro de las etiquetas <final_answer>.
@@ -99,24 +155,92 @@ class QwenAgent:
         El precio actual está fuera del rango superior. La posición no genera comisiones y tiene una pérdida impermanente del 2.5%. Se necesita rebalancear para volver al rango activo.
         </thinking>
         <final_answer>
-        {{
+        {
         "action": "REBALANCE",
         "justification": "El precio actual ha superado el límite superior y la posición tiene una IL de -2.5%. Se recomienda rebalancear para volver a generar comisiones."
-        }}
+        }
         </final_answer><|im_end|>
         <|im_start|>user
         Perfecto. Ahora analiza esta nueva posición:
-        - Pool: {position.token0_symbol}/{position.token1_symbol}
-        - Rango de precios: {metric.price_lower:.4f} - {metric.price_upper:.4f}
-        - Precio actual: {metric.current_price:.4f}
-        - Estado: {'En Rango' if metric.is_in_range else 'Fuera de Rango'}
-        - Pérdida Impermanente (IL): {metric.impermanent_loss_percent:.2f}%
+"""
+
+    def _build_prompt_suffix(self, context: dict) -> str:
+        """Parte específica de la posición, que sigue al prefijo estático."""
+        return f"""        - Pool: {context['pool']}
+        - Rango de precios: {context['price_lower']:.4f} - {context['price_upper']:.4f}
+        - Precio actual: {context['current_price']:.4f}
+        - Estado: {'En Rango' if context['is_in_range'] else 'Fuera de Rango'}
+        - Pérdida Impermanente (IL): {context['impermanent_loss_percent']:.2f}%
 
         **Tu Tarea:**
         Responde con un objeto JSON que contenga "action" y "justification".<|im_end|>
         <|im_start|>assistant
         """
-        return prompt_template
+
+    def _build_prompt(self, context: dict) -> str:
+        return self._build_prompt_prefix() + self._build_prompt_suffix(context)
+
+    # --- Caché KV del prefijo estático ---
+
+    def _prefix_cache_key(self) -> str:
+        """Clave del estado del prefijo: cambia si cambia la plantilla o el fichero del modelo."""
+        stat = os.stat(self.model_path)
+        digest = hashlib.sha256(self._build_prompt_prefix().encode("utf-8"))
+        digest.update(f"{os.path.abspath(self.model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.model.n_ctx()}".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _prime_prefix_cache(self):
+        """
+        Evalúa una sola vez el prefijo estático y guarda su estado KV. Cada generación
+        parte de ese estado y solo procesa el sufijo de la posición. Con
+        `PROMPT_CACHE_DIR` el estado se persiste en disco y se comparte entre reinicios
+        y workers de inferencia.
+        """
+        self._prefix_tokens = self.model.tokenize(self._build_prompt_prefix().encode("utf-8"), add_bos=True, special=True)
+        self._prefix_state = None
+        key = self._prefix_cache_key()
+        cache_path = os.path.join(settings.PROMPT_CACHE_DIR, f"{key}.kvstate") if settings.PROMPT_CACHE_DIR else None
+
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    self._prefix_state = pickle.load(f)
+                self.model.load_state(self._prefix_state)
+                logger.info(f"Estado KV del prefijo cargado desde {cache_path}.")
+                return
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el estado KV de {cache_path}, se recalcula: {e}")
+                self._prefix_state = None
+
+        self.model.reset()
+        self.model.eval(self._prefix_tokens)
+        self._prefix_state = self.model.save_state()
+        logger.info(f"Prefijo del prompt evaluado y cacheado ({len(self._prefix_tokens)} tokens).")
+
+        if cache_path:
+            try:
+                os.makedirs(settings.PROMPT_CACHE_DIR, exist_ok=True)
+                # Los estados de otras plantillas o modelos ya no sirven.
+                for stale_path in glob.glob(os.path.join(settings.PROMPT_CACHE_DIR, "*.kvstate")):
+                    os.remove(stale_path)
+                tmp_path = f"{cache_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(self._prefix_state, f)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warning(f"No se pudo guardar el estado KV del prefijo en disco: {e}")
+
+    def _restore_prefix_state(self):
+        """
+        Deja el contexto con el prefijo ya evaluado. llama.cpp reutiliza por sí mismo el
+        prefijo común con la llamada anterior; el estado guardado solo se restaura
+        cuando el contexto ya no lo contiene (p. ej. tras un error).
+        """
+        n_prefix = len(self._prefix_tokens)
+        if self.model.n_tokens >= n_prefix and list(self.model.input_ids[:n_prefix]) == self._prefix_tokens:
+            return
+        if self._prefix_state is not None:
+            self.model.load_state(self._prefix_state)
 
     def _parse_output(self, raw_text: str) -> dict:
         # ... (Este método se mantiene igual) ...
@@ -133,23 +257,75 @@ class QwenAgent:
             return {"action": "PARSE_ERROR", "justification": "La IA generó un JSON inválido.", "raw_output": raw_text}
 
     def generate_recommendation(self, metric: PositionMetric) -> dict:
-        # ... (Este método se mantiene igual) ...
+        return self.generate_from_context(build_prompt_context(metric))
+
+    def generate_from_context(self, context: dict) -> dict:
+        """Genera la recomendación a partir de un contexto plano (serializable entre procesos)."""
         if not self.model:
             return {"action": "ERROR", "justification": "El modelo LLM no está cargado.", "raw_output": ""}
-        prompt = self._build_prompt(metric)
         try:
-            output = self.model(
-                prompt, 
-                max_tokens=2048, 
-                stop=["</final_answer>"],
-                temperature=0.2, 
-                echo=False
-            )
-            raw_text = output['choices'][0]['text'] + "</final_answer>"
+            suffix = self._build_prompt_suffix(context).encode("utf-8")
+            prompt_tokens = self._prefix_tokens + self.model.tokenize(suffix, add_bos=False, special=True)
+            with self._lock:
+                self._restore_prefix_state()
+                if self._answer_grammar is not None:
+                    raw_text = self._generate_constrained(prompt_tokens)
+                else:
+                    output = self.model(
+                        prompt_tokens, 
+                        max_tokens=2048, 
+                        stop=["</final_answer>"],
+                        temperature=0.2, 
+                        echo=False
+                    )
+                    raw_text = output['choices'][0]['text'] + "</final_answer>"
             return self._parse_output(raw_text)
         except Exception as e:
             logger.error(f"Error durante la generación de la IA: {e}", exc_info=True)
             return {"action": "GENERATION_ERROR", "justification": str(e), "raw_output": ""}
 
-# Instancia global
-qwen_agent = QwenAgent(model_path=settings.MODEL_PATH, n_gpu_layers=settings.N_GPU_LAYERS)
\ No newline at end of file
+    def _generate_constrained(self, prompt_tokens: list) -> str:
+        """
+        Generación en dos fases: un razonamiento limitado a `LLM_THINKING_TOKEN_BUDGET`
+        tokens y una respuesta final restringida por `ANSWER_GRAMMAR`, que se lee en
+        streaming y se corta en cuanto se cierra el objeto JSON. Devuelve el texto con
+        el mismo formato de etiquetas que el modo libre.
+        """
+        output = self.model(
+            prompt_tokens,
+            max_tokens=settings.LLM_THINKING_TOKEN_BUDGET,
+            stop=["</thinking>", "<final_answer>"],
+            temperature=0.2,
+            echo=False
+        )
+        thinking = output['choices'][0]['text'].rstrip()
+        if "<thinking>" not in thinking:
+            thinking = "<thinking>\n" + thinking.lstrip()
+        bridge = f"{thinking}\n</thinking>\n<final_answer>\n"
+
+        answer_tokens = prompt_tokens + self.model.tokenize(bridge.encode("utf-8"), add_bos=False, special=True)
+        answer = ""
+        for chunk in self.model(
+            answer_tokens,
+            max_tokens=settings.LLM_ANSWER_MAX_TOKENS,
+            grammar=self._answer_grammar,
+            temperature=0.2,
+            stream=True
+        ):
+            answer += chunk['choices'][0]['text']
+            if _json_object_closed(answer):
+                break
+        return f"{bridge}{answer.strip()}\n</final_answer>"
+
+# Instancia global, construida en el primer uso: cargar el modelo (y descargarlo si
+# falta) es caro y muchos comandos no lo necesitan nunca.
+_qwen_agent: Optional[QwenAgent] = None
+_qwen_agent_lock = threading.Lock()
+
+def get_qwen_agent() -> QwenAgent:
+    global _qwen_agent
+    if _qwen_agent is None:
+        with _qwen_agent_lock:
+            if _qwen_agent is None:
+                _qwen_agent = QwenAgent(model_path=settings.MODEL_PATH, n_gpu_layers=settings.N_GPU_LAYERS)
+    return _qwen_agent
@@ -0,0 +1,192 @@
+# src/modules/range_index.py
+import bisect
+import logging
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from models import Position, Wallet
+
+logger = logging.getLogger(__name__)
+
+class RangeFlip(NamedTuple):
+    """Posición cuyo estado de rango cambió entre dos ticks del pool."""
+    position_id: int
+    pool: str
+    in_range: bool # Estado con el tick nuevo.
+
+def _in_range(tick: int, tick_lower: int, tick_upper: int) -> bool:
+    # Misma convención que los contratos: el límite inferior es inclusivo y el superior no.
+    return tick_lower <= tick < tick_upper
+
+def _parse_tick(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class PoolRangeIndex:
+    """
+    Límites de rango de las posiciones de un pool en una lista ordenada por tick.
+    El estado de una posición solo cambia cuando el tick del pool cruza uno de sus
+    límites, y mover el tick de `a` a `b` cruza exactamente los límites del
+    intervalo `(min(a, b), max(a, b)]`: con dos búsquedas binarias se obtienen los
+    candidatos en O(log n + k).
+    """
+    def __init__(self):
+        self._ticks: List[int] = [] # Límites ordenados (inferiores y superiores juntos).
+        self._ids: List[int] = [] # Posición de cada límite, en paralelo a `_ticks`.
+        self._ranges: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def position_ids(self) -> List[int]:
+        return list(self._ranges)
+
+    def add(self, position_id: int, tick_lower: int, tick_upper: int):
+        if self._ranges.get(position_id) == (tick_lower, tick_upper):
+            return
+        self.remove(position_id)
+        for tick in (tick_lower, tick_upper):
+            index = bisect.bisect_right(self._ticks, tick)
+            self._ticks.insert(index, tick)
+            self._ids.insert(index, position_id)
+        self._ranges[position_id] = (tick_lower, tick_upper)
+
+    def remove(self, position_id: int):
+        bounds = self._ranges.pop(position_id, None)
+        if bounds is None:
+            return
+        for tick in bounds:
+            index = bisect.bisect_left(self._ticks, tick)
+            while self._ids[index] != position_id:
+                index += 1
+            del self._ticks[index]
+            del self._ids[index]
+
+    def crossed(self, old_tick: int, new_tick: int) -> List[Tuple[int, bool]]:
+        """`(position_id, en rango con new_tick)` de las posiciones cuyo estado cambia."""
+        if old_tick == new_tick:
+            return []
+        low, high = min(old_tick, new_tick), max(old_tick, new_tick)
+        start = bisect.bisect_right(self._ticks, low)
+        end = bisect.bisect_right(self._ticks, high)
+        flips, seen = [], set()
+        for position_id in self._ids[start:end]:
+            if position_id in seen:
+                continue
+            seen.add(position_id)
+            tick_lower, tick_upper = self._ranges[position_id]
+            now_in_range = _in_range(new_tick, tick_lower, tick_upper)
+            # Si cruza ambos límites (salto por encima del rango) el estado no cambia.
+            if now_in_range != _in_range(old_tick, tick_lower, tick_upper):
+                flips.append((position_id, now_in_range))
+        return flips
+
+class RangeIndex:
+    """
+    Índice en memoria `pool -> PoolRangeIndex` de las posiciones seguidas, junto con
+    el último tick observado de cada pool. Se reconstruye desde la base de datos al
+    arrancar y se actualiza de forma incremental al sincronizar posiciones.
+    """
+    def __init__(self):
+        self._pools: Dict[str, PoolRangeIndex] = {}
+        self._pool_of: Dict[int, str] = {}
+        self._last_ticks: Dict[str, int] = {}
+        self._last_blocks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, db_session) -> int:
+        """
+        Carga los rangos de las posiciones de las wallets activas. Las cerradas desde
+        el último escaneo salen en el siguiente. Los ticks observados se conservan.
+        """
+        pools: Dict[str, PoolRangeIndex] = {}
+        pool_of: Dict[int, str] = {}
+        rows = (
+            db_session.query(Position.id, Position.pool_address, Position.tick_lower, Position.tick_upper)
+            .join(Wallet, Position.wallet_id == Wallet.id)
+            .filter(Wallet.is_active == True)
+        )
+        for position_id, pool_address, tick_lower, tick_upper in rows.yield_per(1000):
+            tick_lower, tick_upper = _parse_tick(tick_lower), _parse_tick(tick_upper)
+            if not pool_address or tick_lower is None or tick_upper is None:
+                continue
+            pool = pool_address.lower()
+            pools.setdefault(pool, PoolRangeIndex()).add(position_id, tick_lower, tick_upper)
+            pool_of[position_id] = pool
+        with self._lock:
+            self._pools, self._pool_of = pools, pool_of
+        logger.info(f"Índice de rangos reconstruido: {len(pool_of)} posiciones en {len(pools)} pools.")
+        return len(pool_of)
+
+    def upsert(self, positions: Iterable[Position]):
+        """Añade o actualiza posiciones (p. ej. las creadas en un ciclo de escaneo)."""
+        with self._lock:
+            for position in positions:
+                tick_lower, tick_upper = _parse_tick(position.tick_lower), _parse_tick(position.tick_upper)
+                if not position.pool_address or tick_lower is None or tick_upper is None:
+                    continue
+                pool = position.pool_address.lower()
+                previous = self._pool_of.get(position.id)
+                if previous is not None and previous != pool:
+                    self._pools[previous].remove(position.id)
+                self._pools.setdefault(pool, PoolRangeIndex()).add(position.id, tick_lower, tick_upper)
+                self._pool_of[position.id] = pool
+
+    def remove(self, position_ids: Iterable[int]) -> List[int]:
+        """Deja de seguir las posiciones indicadas; devuelve las que estaban en el índice."""
+        removed = []
+        with self._lock:
+            for position_id in position_ids:
+                pool = self._pool_of.pop(position_id, None)
+                if pool is not None:
+                    self._pools[pool].remove(position_id)
+                    removed.append(position_id)
+        return removed
+
+    def observe_tick(self, pool: str, tick: int, block_number: Optional[int] = None) -> List[RangeFlip]:
+        """
+        Registra el tick actual de un pool y devuelve las posiciones cuyo estado de
+        rango cambió desde la observación anterior. La primera observación de un
+        pool solo fija la referencia. Con `block_number` se ignoran las
+        observaciones más antiguas que la última (p. ej. un Subgraph con retraso
+        respecto al nodo), que si no invertirían los cambios ya detectados.
+        """
+        pool = pool.lower()
+        with self._lock:
+            if block_number is not None:
+                if block_number < self._last_blocks.get(pool, block_number):
+                    return []
+                self._last_blocks[pool] = block_number
+            previous = self._last_ticks.get(pool)
+            self._last_ticks[pool] = tick
+            index = self._pools.get(pool)
+            if previous is None or index is None:
+                return []
+            return [RangeFlip(position_id, pool, in_range) for position_id, in_range in index.crossed(previous, tick)]
+
+    def last_tick(self, pool: str) -> Optional[int]:
+        with self._lock:
+            return self._last_ticks.get(pool.lower())
+
+    def pools(self) -> List[str]:
+        with self._lock:
+            return [pool for pool, index in self._pools.items() if len(index)]
+
+    def position_ids(self, pool: str) -> List[int]:
+        with self._lock:
+            index = self._pools.get(pool.lower())
+            return index.position_ids() if index is not None else []
+
+# Instancia global, construida en el primer uso.
+_range_index: Optional[RangeIndex] = None
+_range_index_lock = threading.Lock()
+
+def get_range_index() -> RangeIndex:
+    global _range_index
+    if _range_index is None:
+        with _range_index_lock:
+            if _range_index is None:
+                _range_index = RangeIndex()
+    return _range_index
@@ -0,0 +1,257 @@
+# src/modules/rate_limit.py
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Carriles de prioridad: con el proveedor saturado, el escaneo en vivo pasa antes que el backfill.
+LIVE = "live"
+BACKGROUND = "background"
+LANE_PRIORITY = {LIVE: 0, BACKGROUND: 1}
+
+_lane: ContextVar[str] = ContextVar("rate_limit_lane", default=LIVE)
+
+@contextmanager
+def request_lane(lane: str):
+    """
+    Ejecuta el bloque con las peticiones HTTP en el carril indicado. Es una
+    variable de contexto: los hilos de un `ThreadPoolExecutor` no la heredan y
+    deben fijarla en la propia tarea.
+    """
+    if lane not in LANE_PRIORITY:
+        raise ValueError(f"Carril de prioridad desconocido: {lane}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def current_lane() -> str:
+    return _lane.get()
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos indicados por una cabecera `Retry-After` (en segundos o como fecha HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _Bucket:
+    """Cubeta de tokens; la sincronización corre a cargo de `ProviderLimiter`."""
+    def __init__(self, rate: float, burst_seconds: float):
+        self.burst_seconds = burst_seconds
+        self.rate = rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate * self.burst_seconds)
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class ProviderLimiter:
+    """
+    Limitador adaptativo de un proveedor. Una cubeta de tokens fija el ritmo; al
+    recibir un 429 el ritmo se reduce a la mitad (sin bajar de
+    `RATE_LIMIT_MIN_FRACTION` del máximo) y, si hay `Retry-After`, todas las
+    peticiones del proveedor esperan ese tiempo. Los 429 de peticiones que ya
+    habían salido antes de la última reducción no la repiten: una ráfaga de
+    rechazos simultáneos cuenta como una sola señal. Después el ritmo se recupera de
+    forma lineal hasta el máximo en `RATE_LIMIT_RECOVERY_SECONDS`.
+
+    Las peticiones esperan en una cola por carril y orden de llegada, así que una
+    del carril en vivo adelanta a todas las de fondo. El carril de fondo tiene
+    además su propia cubeta con `RATE_LIMIT_BACKGROUND_SHARE` del ritmo, de modo
+    que un backfill nunca consume todo el cupo del proveedor.
+    """
+    def __init__(self, name: str, max_rate: float, burst_seconds: Optional[float] = None, background_share: Optional[float] = None):
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = max_rate * settings.RATE_LIMIT_MIN_FRACTION
+        self.recovery_seconds = settings.RATE_LIMIT_RECOVERY_SECONDS
+        self.background_share = background_share if background_share is not None else settings.RATE_LIMIT_BACKGROUND_SHARE
+        burst_seconds = burst_seconds if burst_seconds is not None else settings.RATE_LIMIT_BURST_SECONDS
+        self._bucket = _Bucket(max_rate, burst_seconds)
+        self._background = _Bucket(max_rate * self.background_share, burst_seconds)
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._metrics = self._empty_metrics()
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        lanes = {lane: {"requests": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for lane in LANE_PRIORITY}
+        return {"lanes": lanes, "throttled": 0}
+
+    @property
+    def rate(self) -> float:
+        with self._cond:
+            return self._bucket.rate
+
+    def _set_rate(self, rate: float):
+        self._bucket.rate = rate
+        self._background.rate = rate * self.background_share
+
+    def _refill(self, now: float):
+        # La recuperación empieza cuando termina la pausa de `Retry-After`.
+        if self._bucket.rate < self.max_rate and now > self._paused_until:
+            elapsed = now - max(self._bucket.updated, self._paused_until)
+            self._set_rate(min(self.max_rate, self._bucket.rate + self.max_rate * elapsed / self.recovery_seconds))
+        self._bucket.refill(now)
+        self._background.refill(now)
+
+    def acquire(self) -> float:
+        """
+        Bloquea hasta que la petición puede salir según su carril. Devuelve el
+        instante (`time.monotonic`) en que sale, que se pasa a `throttle` si la
+        respuesta es un 429.
+        """
+        lane = current_lane()
+        started_at = time.monotonic()
+        with self._cond:
+            ticket = (LANE_PRIORITY[lane], next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = None # Sin turno: se espera a que otra petición avise.
+                    if self._waiters[0] == ticket:
+                        wait = max(self._paused_until - now, self._bucket.wait_time())
+                        if lane == BACKGROUND:
+                            wait = max(wait, self._background.wait_time())
+                        if wait <= 0:
+                            self._bucket.tokens -= 1
+                            if lane == BACKGROUND:
+                                self._background.tokens -= 1
+                            break
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+            granted_at = time.monotonic()
+            waited = granted_at - started_at
+            metrics = self._metrics["lanes"][lane]
+            metrics["requests"] += 1
+            metrics["wait_seconds"] += waited
+            metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], waited)
+        return granted_at
+
+    def throttle(self, retry_after: Optional[float] = None, sent_at: Optional[float] = None):
+        """
+        Registra un 429 (o un `Retry-After`) de una petición que salió en `sent_at`:
+        reduce el ritmo y, si se indica, pausa el proveedor.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self._metrics["throttled"] += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if sent_at is not None and sent_at < self._last_decrease:
+                self._cond.notify_all()
+                return
+            self._last_decrease = now
+            self._set_rate(max(self.min_rate, self._bucket.rate / 2))
+            self._bucket.tokens = min(self._bucket.tokens, 0.0)
+            self._background.tokens = min(self._background.tokens, 0.0)
+            rate = self._bucket.rate
+            self._cond.notify_all()
+        logger.warning(
+            f"Límite de peticiones alcanzado en {self.name}: ritmo reducido a {rate:.2f} req/s"
+            + (f", en pausa {retry_after:.1f}s." if retry_after else ".")
+        )
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        """Peticiones y espera por carril, 429 recibidos, ritmo actual y peticiones en cola."""
+        with self._cond:
+            self._refill(time.monotonic())
+            lanes = {
+                lane: {
+                    "requests": metrics["requests"],
+                    "mean_wait_seconds": round(metrics["wait_seconds"] / metrics["requests"], 3) if metrics["requests"] else 0.0,
+                    "max_wait_seconds": round(metrics["max_wait_seconds"], 3),
+                }
+                for lane, metrics in self._metrics["lanes"].items()
+            }
+            snapshot = {
+                "rate": round(self._bucket.rate, 3),
+                "max_rate": self.max_rate,
+                "throttled": self._metrics["throttled"],
+                "queued": len(self._waiters),
+                "lanes": lanes,
+            }
+            if reset:
+                self._metrics = self._empty_metrics()
+        return snapshot
+
+class RateLimitManager:
+    """Limitadores por proveedor, localizados por el host de cada URL."""
+    def __init__(self):
+        self._limiters: Dict[str, ProviderLimiter] = {}
+        self._hosts: Dict[str, ProviderLimiter] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, max_rate: float, *urls: Optional[str]) -> Optional[ProviderLimiter]:
+        """Registra un proveedor con su ritmo máximo. Un ritmo <= 0 lo deja sin límite."""
+        if max_rate <= 0:
+            return None
+        limiter = ProviderLimiter(name, max_rate)
+        with self._lock:
+            self._limiters[name] = limiter
+            for url in urls:
+                if url:
+                    self._hosts[urlsplit(url).netloc] = limiter
+        return limiter
+
+    def limiter_for(self, url: str) -> Optional[ProviderLimiter]:
+        with self._lock:
+            return self._hosts.get(urlsplit(url).netloc)
+
+    def stats(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {name: limiter.stats(reset) for name, limiter in limiters.items()}
+
+# Instancia global, construida en el primer uso.
+_rate_limit_manager: Optional[RateLimitManager] = None
+_rate_limit_manager_lock = threading.Lock()
+
+def get_rate_limit_manager() -> RateLimitManager:
+    global _rate_limit_manager
+    if _rate_limit_manager is None:
+        with _rate_limit_manager_lock:
+            if _rate_limit_manager is None:
+                manager = RateLimitManager()
+                manager.register("thegraph", settings.THEGRAPH_MAX_REQUESTS_PER_SECOND, settings.THEGRAPH_PROJECT_QUERY_URL)
+                manager.register("etherscan", settings.ETHERSCAN_MAX_REQUESTS_PER_SECOND, settings.ETHERSCAN_API_URL)
+                manager.register("moralis", settings.MORALIS_MAX_REQUESTS_PER_SECOND, settings.MORALIS_API_URL)
+                manager.register("rpc", settings.ETH_RPC_MAX_REQUESTS_PER_SECOND, settings.ETH_RPC_URL)
+                _rate_limit_manager = manager
+    return _rate_limit_manager
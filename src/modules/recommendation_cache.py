@@ -0,0 +1,103 @@
+# src/modules/recommendation_cache.py
+import math
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+
+from core.config import settings
+from models import PositionMetric, Recommendation
+
+logger = logging.getLogger(__name__)
+
+# Acciones que indican que la inferencia falló; nunca se reutilizan.
+NON_REUSABLE_ACTIONS = {"ERROR", "FORMAT_ERROR", "PARSE_ERROR", "GENERATION_ERROR", "UNKNOWN"}
+
+IN_QUERY_CHUNK_SIZE = 500
+
+def _bucket(value: Optional[float], size: float) -> int:
+    if value is None or size <= 0 or not math.isfinite(value):
+        return 0
+    return math.floor(value / size)
+
+def compute_state_fingerprint(metric: PositionMetric) -> str:
+    """
+    Resume el estado de una métrica en una huella estable: estado del rango,
+    tramo de la posición del precio dentro del rango, tramo de IL y tramo de APR.
+    Dos métricas con la misma huella no justifican una nueva inferencia.
+    """
+    lower, upper, price = metric.price_lower or 0.0, metric.price_upper or 0.0, metric.current_price or 0.0
+    if price < lower:
+        range_status, price_bucket = "BELOW", 0
+    elif price > upper:
+        range_status, price_bucket = "ABOVE", 0
+    else:
+        range_status = "IN"
+        buckets = max(1, settings.RECOMMENDATION_PRICE_BUCKETS)
+        width = upper - lower
+        position_in_range = (price - lower) / width if width > 0 else 0.5
+        price_bucket = min(buckets - 1, int(position_in_range * buckets))
+
+    il_bucket = _bucket(abs(metric.impermanent_loss_percent or 0.0), settings.RECOMMENDATION_IL_BUCKET_PERCENT)
+    apr_bucket = _bucket(metric.real_apr_percent, settings.RECOMMENDATION_APR_BUCKET_PERCENT)
+    return f"{range_status}|p{price_bucket}|il{il_bucket}|apr{apr_bucket}"
+
+def load_last_recommendations(db_session, position_ids: Iterable[int]) -> Dict[int, Recommendation]:
+    """Devuelve `{position_id: última Recommendation}` con una consulta agregada por trozo."""
+    ids = sorted(set(position_ids))
+    last_by_position: Dict[int, Recommendation] = {}
+    for i in range(0, len(ids), IN_QUERY_CHUNK_SIZE):
+        chunk = ids[i:i + IN_QUERY_CHUNK_SIZE]
+        latest = (
+            db_session.query(PositionMetric.position_id, func.max(Recommendation.id).label("recommendation_id"))
+            .join(Recommendation, Recommendation.metric_id == PositionMetric.id)
+            .filter(PositionMetric.position_id.in_(chunk))
+            .group_by(PositionMetric.position_id)
+            .subquery()
+        )
+        rows = db_session.query(Recommendation, latest.c.position_id).join(
+            latest, Recommendation.id == latest.c.recommendation_id
+        )
+        for recommendation, position_id in rows:
+            last_by_position[position_id] = recommendation
+    return last_by_position
+
+def load_origin_times(db_session, recommendations: Iterable[Recommendation]) -> Dict[int, datetime]:
+    """Devuelve `{recommendation_id: generated_at}` de las recomendaciones originales (no reutilizadas)."""
+    origin_ids = {rec.reused_from_id or rec.id for rec in recommendations}
+    if not origin_ids:
+        return {}
+    rows = db_session.query(Recommendation.id, Recommendation.generated_at).filter(
+        Recommendation.id.in_(origin_ids)
+    )
+    return {recommendation_id: generated_at for recommendation_id, generated_at in rows}
+
+def _as_utc(moment: datetime) -> datetime:
+    # SQLite devuelve CURRENT_TIMESTAMP sin zona horaria, pero siempre en UTC.
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def find_reusable_recommendation(
+    last: Optional[Recommendation],
+    fingerprint: str,
+    origin_times: Dict[int, datetime],
+    now: Optional[datetime] = None,
+) -> Optional[Recommendation]:
+    """
+    Devuelve la última recomendación si puede reutilizarse para la huella dada:
+    misma huella, acción válida y la inferencia original no supera la antigüedad
+    máxima configurada (refresco forzado).
+    """
+    if last is None or last.state_fingerprint != fingerprint:
+        return None
+    if last.recommendation_action in NON_REUSABLE_ACTIONS:
+        return None
+
+    generated_at = origin_times.get(last.reused_from_id or last.id)
+    if generated_at is None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    age_seconds = (now - _as_utc(generated_at)).total_seconds()
+    if age_seconds > settings.RECOMMENDATION_MAX_AGE_SECONDS:
+        return None
+    return last
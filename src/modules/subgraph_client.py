@@ -1,13 +1,106 @@
 # src/modules/subgraph_client.py
 import logging
-import requests
-from typing import List, Dict, Any, Optional
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from core.config import settings
+from modules.block_cache import BlockTimestampCache
+from modules.http_transport import GraphQLClient, GraphQLDocument, get_http_transport, parse_graphql
+from modules.pool_cache import PoolStateCache
 
 logger = logging.getLogger(__name__)
 
+# Campos propios de cada posición. El pool solo se identifica: su estado y sus metadatos
+# se completan desde `PoolStateCache`, una vez por pool y ciclo en lugar de una por posición.
+POSITION_FIELDS = """
+    id
+    owner
+    transaction { timestamp }
+    pool { id }
+    tickLower { tickIdx, price0, feeGrowthOutside0X128, feeGrowthOutside1X128 }
+    tickUpper { tickIdx, price0, feeGrowthOutside0X128, feeGrowthOutside1X128 }
+
+    collectedFeesToken0 
+    collectedFeesToken1
+
+    depositedToken0
+    depositedToken1
+
+    # Campos para la matemática exacta de liquidez concentrada (modules/uniswap_math).
+    liquidity
+    feeGrowthInside0LastX128
+    feeGrowthInside1LastX128
+"""
+
+# Estado de un pool que cambia con cada bloque (los metadatos van aparte, en `PoolMetadataCache`).
+POOL_STATE_FIELDS = """
+    id
+    token0 { id, derivedETH }
+    token1 { id, derivedETH }
+    token0Price
+    sqrtPrice
+    tick
+    feeGrowthGlobal0X128
+    feeGrowthGlobal1X128
+"""
+
+def _block_arguments(block_number: Optional[int]) -> Tuple[str, str]:
+    """
+    Declaración de variable y argumento `block` para fijar una consulta a un bloque
+    (vacíos si no se fija). En GraphQL las comas entre argumentos son opcionales.
+    """
+    if block_number is None:
+        return "", ""
+    return ", $block: Int!", "block: {number: $block}"
+
+def _annotate_positions(positions: List[Dict[str, Any]], result: Dict[str, Any]):
+    """Copia en cada posición los datos comunes de la respuesta: precio de ETH y bloque indexado."""
+    eth_price_usd = float((result.get("bundle") or {}).get("ethPriceUSD", 0))
+    block_number = ((result.get("_meta") or {}).get("block") or {}).get("number")
+    for pos in positions:
+        pos["ethPriceUSD"] = eth_price_usd
+        pos["blockNumber"] = block_number
+
+# Documentos fijos; se compilan una vez al construir el cliente. Los que dependen de
+# parámetros (bloque fijado, alias, serie temporal) se compilan en su primer uso.
+INDEXED_BLOCK_QUERY = "query { _meta { block { number } } }"
+
+POOL_PRICE_AT_BLOCK_QUERY = """
+    query($pool_id: String!, $block: Int!) {
+        pool(id: $pool_id, block: {number: $block}) {
+            token0Price
+        }
+    }
+"""
+
+POSITIONS_CREATION_QUERY = """
+    query($ids: [ID!]!, $first: Int!) {
+        positions(first: $first, where: {id_in: $ids}) {
+            id
+            liquidity
+            transaction { timestamp }
+            pool { id }
+        }
+    }
+"""
+
+POOLS_METADATA_QUERY = """
+    query($ids: [ID!]!, $first: Int!) {
+        pools(first: $first, where: {id_in: $ids}) {
+            id
+            feeTier
+            token0 { id, symbol, decimals }
+            token1 { id, symbol, decimals }
+        }
+    }
+"""
+
+POOL_TICKS_QUERY = """
+    query($ids: [ID!]!, $first: Int!) {
+        _meta { block { number } }
+        pools(first: $first, where: {id_in: $ids}) { id, tick }
+    }
+"""
+
 class SubgraphClient:
     def __init__(self, chain: str, query_url: str | None):
         if chain != "eth":
@@ -15,24 +108,36 @@ class SubgraphClient:
         if not query_url:
             raise ValueError("Se requiere la URL de query del proyecto de The Graph Studio en el .env (THEGRAPH_PROJECT_QUERY_URL).")
 
-        transport = RequestsHTTPTransport(url=query_url, retries=3, timeout=30)
-        self.client = Client(transport=transport, fetch_schema_from_transport=False)
+        self.http = get_http_transport()
+        self.client = GraphQLClient(query_url, self.http)
+        self._documents: Dict[str, GraphQLDocument] = {}
+        self._documents_lock = threading.Lock()
+        for source in (INDEXED_BLOCK_QUERY, POOL_PRICE_AT_BLOCK_QUERY, POSITIONS_CREATION_QUERY, POOLS_METADATA_QUERY, POOL_TICKS_QUERY):
+            self._document(source)
+        self.block_cache = BlockTimestampCache(resolver=self._get_block_from_timestamp_etherscan)
         logger.info(f"SubgraphClient inicializado usando la URL del proyecto de The Graph Studio.")
 
+    def _document(self, source: str) -> GraphQLDocument:
+        """Documento compilado para `source`, analizado solo la primera vez que se usa."""
+        document = self._documents.get(source)
+        if document is None:
+            document = parse_graphql(source)
+            with self._documents_lock:
+                self._documents[source] = document
+        return document
+
     def _get_block_from_timestamp_etherscan(self, timestamp: int) -> Optional[int]:
         """Obtiene el número de bloque más cercano a un timestamp usando la API de Etherscan."""
         if not settings.ETHERSCAN_API_KEY:
             logger.error("Se requiere ETHERSCAN_API_KEY en el .env para obtener datos históricos.")
             return None
-        
-        url = (
-            f"https://api.etherscan.io/api?module=block&action=getblocknobytime"
-            f"×tamp={timestamp}&closest=before&apikey={settings.ETHERSCAN_API_KEY}"
-        )
+
+        params = {
+            "module": "block", "action": "getblocknobytime", "timestamp": timestamp,
+            "closest": "before", "apikey": settings.ETHERSCAN_API_KEY,
+        }
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.http.request("GET", settings.ETHERSCAN_API_URL, params=params).json()
             if data.get("status") == "1":
                 block_number = int(data["result"])
                 logger.info(f"Timestamp {timestamp} corresponde al bloque {block_number} (vía Etherscan).")
@@ -40,23 +145,13 @@ class SubgraphClient:
             else:
                 logger.error(f"Error de la API de Etherscan al buscar bloque: {data.get('message')}")
                 return None
-        except requests.exceptions.RequestException as e:
+        except Exception as e:
             logger.error(f"No se pudo obtener el bloque desde Etherscan: {e}")
             return None
 
-    def get_historical_pool_price(self, pool_id: str, timestamp: int) -> Optional[float]:
-        """Obtiene el precio token0/token1 de un pool en un punto específico del pasado."""
-        block_number = self._get_block_from_timestamp_etherscan(timestamp)
-        if not block_number:
-            return None
-
-        query = gql("""
-            query($pool_id: String!, $block: Int!) {
-                pool(id: $pool_id, block: {number: $block}) {
-                    token0Price
-                }
-            }
-        """)
+    def get_pool_price_at_block(self, pool_id: str, block_number: int) -> Optional[float]:
+        """Obtiene el precio token0/token1 de un pool en un bloque concreto."""
+        query = self._document(POOL_PRICE_AT_BLOCK_QUERY)
         params = {"pool_id": pool_id, "block": block_number}
         try:
             result = self.client.execute(query, variable_values=params)
@@ -71,51 +166,327 @@ class SubgraphClient:
             logger.error(f"No se pudo obtener el precio histórico del pool {pool_id}: {e}")
             return None
 
-    def get_positions_for_wallet(self, owner_address: str) -> List[Dict[str, Any]]:
+    def get_pool_prices_at_blocks(
+        self, pairs: Iterable[Tuple[str, int]], chunk_size: Optional[int] = None
+    ) -> Dict[Tuple[str, int], float]:
         """
-        Obtiene las posiciones activas para una wallet, incluyendo datos
-        para el cálculo de fees y APR.
+        Variante por lotes de `get_pool_price_at_block`: construye un único documento
+        GraphQL con selecciones `pool(...)` con alias para muchos pares (pool, bloque).
+        Los pares se agrupan en trozos de `chunk_size` para no superar el límite de
+        complejidad del servidor. Devuelve `{(pool_id, bloque): token0Price}`; los pares
+        sin datos no aparecen en el resultado.
         """
-        query = gql("""
-            query($owner: String!) {
-                bundle(id: "1") {
-                    ethPriceUSD
-                }
-                positions(where: {owner: $owner, liquidity_gt: 0}) {
-                    id
-                    transaction { timestamp }
-                    pool { 
-                        id
-                        token0 { id, symbol, derivedETH }
-                        token1 { id, symbol, derivedETH }
-                        token0Price
-                    }
-                    tickLower { tickIdx, price0 }
-                    tickUpper { tickIdx, price0 }
-                    
-                    # --- CORRECCIÓN DE LOS NOMBRES DE CAMPO ---
-                    collectedFeesToken0 
-                    collectedFeesToken1
-                    
-                    depositedToken0
-                    depositedToken1
+        unique_pairs = sorted({(pool_id, int(block)) for pool_id, block in pairs if pool_id and block})
+        chunk_size = chunk_size or settings.SUBGRAPH_HISTORICAL_BATCH_SIZE
+        prices: Dict[Tuple[str, int], float] = {}
+
+        for i in range(0, len(unique_pairs), chunk_size):
+            chunk = unique_pairs[i:i + chunk_size]
+            definitions, selections, params = [], [], {}
+            for n, (pool_id, block_number) in enumerate(chunk):
+                definitions.append(f"$pool{n}: ID!, $block{n}: Int!")
+                selections.append(f"p{n}: pool(id: $pool{n}, block: {{number: $block{n}}}) {{ token0Price }}")
+                params[f"pool{n}"] = pool_id
+                params[f"block{n}"] = block_number
+            query = self._document(f"query({', '.join(definitions)}) {{\n" + "\n".join(selections) + "\n}")
+
+            try:
+                result = self.client.execute(query, variable_values=params)
+            except Exception as e:
+                # Un solo bloque fuera del rango indexado invalida el documento entero;
+                # se recurre a consultas individuales para aislar el par problemático.
+                logger.warning(f"Falló la consulta histórica agrupada ({len(chunk)} pares): {e}. Reintentando uno a uno.")
+                for pool_id, block_number in chunk:
+                    price = self.get_pool_price_at_block(pool_id, block_number)
+                    if price is not None:
+                        prices[(pool_id, block_number)] = price
+                continue
+
+            for n, pair in enumerate(chunk):
+                pool = result.get(f"p{n}")
+                if pool and pool.get("token0Price"):
+                    prices[pair] = float(pool["token0Price"])
+
+        logger.info(f"Precios históricos resueltos: {len(prices)}/{len(unique_pairs)} pares.")
+        return prices
+
+    def get_historical_pool_price(self, pool_id: str, timestamp: int) -> Optional[float]:
+        """Obtiene el precio token0/token1 de un pool en un punto específico del pasado."""
+        block_number = self.block_cache.get(timestamp)
+        if not block_number:
+            return None
+        return self.get_pool_price_at_block(pool_id, block_number)
+
+    def get_positions_creation_data(self, token_ids: Iterable[int], chunk_size: int = 500) -> Dict[int, Dict[str, Any]]:
+        """
+        Devuelve `{token_id: {"pool_id", "timestamp", "liquidity"}}` con el pool, el
+        timestamp de creación y la liquidez actual de cada posición. Se usa para
+        completar filas antiguas sin datos de entrada y para el backfill histórico.
+        """
+        ids = sorted({str(token_id) for token_id in token_ids})
+        query = self._document(POSITIONS_CREATION_QUERY)
+        creation_data = {}
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            try:
+                result = self.client.execute(query, variable_values={"ids": chunk, "first": len(chunk)})
+            except Exception as e:
+                logger.error(f"Error al consultar los datos de creación de {len(chunk)} posiciones: {e}")
+                continue
+            for pos in result.get("positions", []):
+                creation_data[int(pos["id"])] = {
+                    "pool_id": pos.get("pool", {}).get("id"),
+                    "timestamp": int(pos.get("transaction", {}).get("timestamp", 0)),
+                    "liquidity": int(pos.get("liquidity") or 0),
                 }
-            }
+        return creation_data
+
+    def get_pools_metadata(self, pool_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve `{pool_id: pool}` con los tokens (id, símbolo, decimales) y el nivel de comisión."""
+        ids = sorted({pool_id.lower() for pool_id in pool_ids})
+        query = self._document(POOLS_METADATA_QUERY)
+        pools = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            result = self.client.execute(query, variable_values={"ids": chunk, "first": len(chunk)})
+            pools.update({pool["id"]: pool for pool in result.get("pools", [])})
+        return pools
+
+    def iter_time_series(
+        self, entity: str, parent_field: str, parent_id: str, fields: List[str],
+        start: int, end: int, page_size: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Recorre en páginas una serie temporal del Subgraph (`poolHourDatas`,
+        `poolDayDatas`, `tokenHourDatas`, `tokenDayDatas`) entre `start` (excluido) y
+        `end` (incluido), ordenada por tiempo y paginada por cursor sobre la propia
+        marca temporal. Cada página se devuelve según llega, así que la memoria no
+        depende de la longitud del histórico.
+        """
+        time_field = "date" if entity.endswith("DayDatas") else "periodStartUnix"
+        page_size = page_size or settings.SUBGRAPH_PAGE_SIZE
+        query = self._document(f"""
+            query($parent: String!, $first: Int!, $after: Int!, $end: Int!) {{
+                {entity}(
+                    first: $first,
+                    orderBy: {time_field},
+                    orderDirection: asc,
+                    where: {{{parent_field}: $parent, {time_field}_gt: $after, {time_field}_lte: $end}}
+                ) {{
+                    {time_field}
+                    {" ".join(fields)}
+                }}
+            }}
         """)
-        params = {"owner": owner_address.lower()}
-        
-        try:
+        after = int(start)
+        while True:
+            params = {"parent": parent_id, "first": page_size, "after": after, "end": int(end)}
+            rows = self.client.execute(query, variable_values=params).get(entity, [])
+            if not rows:
+                return
+            for row in rows:
+                row["periodStart"] = int(row.pop(time_field))
+            yield rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["periodStart"]
+
+    def iter_pool_history(
+        self, pool_id: str, start: int, end: int, granularity: str = "hour", page_size: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Histórico de un pool (precio, tick, liquidez activa y fees en USD por periodo)."""
+        entity = "poolHourDatas" if granularity == "hour" else "poolDayDatas"
+        fields = ["token0Price", "token1Price", "sqrtPrice", "tick", "liquidity", "feesUSD"]
+        return self.iter_time_series(entity, "pool", pool_id.lower(), fields, start, end, page_size)
+
+    def get_token_price_history(
+        self, token_id: str, start: int, end: int, granularity: str = "hour"
+    ) -> Dict[int, float]:
+        """Devuelve `{inicio del periodo: priceUSD}` de un token en el intervalo."""
+        entity = "tokenHourDatas" if granularity == "hour" else "tokenDayDatas"
+        prices = {}
+        for page in self.iter_time_series(entity, "token", token_id.lower(), ["priceUSD"], start, end):
+            prices.update({row["periodStart"]: float(row["priceUSD"]) for row in page})
+        return prices
+
+    def _pinned_pool_cache(self, pool_cache: Optional[PoolStateCache]) -> PoolStateCache:
+        """Caché de pools con bloque fijado, para leer posiciones y pools en el mismo bloque."""
+        pool_cache = pool_cache or PoolStateCache(self)
+        if pool_cache.block_number is None:
+            pool_cache.block_number = self.get_indexed_block()
+        return pool_cache
+
+    def iter_positions_for_owners(
+        self, owner_addresses: Iterable[str], page_size: Optional[int] = None,
+        pool_cache: Optional[PoolStateCache] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Obtiene las posiciones activas de varias wallets a la vez (`owner_in`) y
+        devuelve las páginas a medida que llegan. Sigue la paginación por cursor
+        `id_gt` hasta agotar el resultado, así que no hay truncado a 100 posiciones.
+        Lanza la excepción del transporte si una página falla, para que el
+        llamador no confunda un resultado parcial con uno completo.
+
+        Los pools se completan con `pool_cache`; compartiendo una caché entre los
+        lotes de un ciclo, cada pool se descarga una sola vez. Las posiciones se
+        consultan en el bloque de la caché (el último indexado si no tiene uno).
+        """
+        owners = sorted({address.lower() for address in owner_addresses})
+        if not owners:
+            return
+        page_size = page_size or settings.SUBGRAPH_PAGE_SIZE
+        pool_cache = self._pinned_pool_cache(pool_cache)
+        block_number = pool_cache.block_number
+        block_declaration, block_argument = _block_arguments(block_number)
+        meta_arguments = f"({block_argument})" if block_argument else ""
+
+        query = self._document(f"""
+            query($owners: [String!]!, $first: Int!, $last_id: String!{block_declaration}) {{
+                _meta{meta_arguments} {{ block {{ number }} }}
+                bundle(id: "1" {block_argument}) {{
+                    ethPriceUSD
+                }}
+                positions(
+                    {block_argument}
+                    first: $first,
+                    orderBy: id,
+                    orderDirection: asc,
+                    where: {{owner_in: $owners, liquidity_gt: 0, id_gt: $last_id}}
+                ) {{
+                    {POSITION_FIELDS}
+                }}
+            }}
+        """)
+
+        last_id = ""
+        while True:
+            params = {"owners": owners, "first": page_size, "last_id": last_id}
+            if block_number is not None:
+                params["block"] = block_number
+            result = self.client.execute(query, variable_values=params)
+            positions = result.get("positions", [])
+            if not positions:
+                return
+            _annotate_positions(positions, result)
+
+            logger.info(f"Subgraph: página de {len(positions)} posiciones para {len(owners)} wallets.")
+            yield pool_cache.attach(list(positions))
+
+            if len(positions) < page_size:
+                return
+            last_id = positions[-1]["id"]
+
+    def get_positions_by_ids(
+        self, token_ids: Iterable[int], chunk_size: Optional[int] = None, pool_cache: Optional[PoolStateCache] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtiene posiciones activas concretas por su token ID, con los mismos campos
+        que `iter_positions_for_owners`. Lo usa el modo de monitorización por bloques
+        para sincronizar solo las posiciones afectadas por un movimiento de precio.
+        """
+        ids = sorted({str(token_id) for token_id in token_ids}, key=int)
+        chunk_size = chunk_size or settings.SUBGRAPH_PAGE_SIZE
+        pool_cache = self._pinned_pool_cache(pool_cache)
+        block_number = pool_cache.block_number
+        block_declaration, block_argument = _block_arguments(block_number)
+        meta_arguments = f"({block_argument})" if block_argument else ""
+        query = self._document(f"""
+            query($ids: [ID!]!, $first: Int!{block_declaration}) {{
+                _meta{meta_arguments} {{ block {{ number }} }}
+                bundle(id: "1" {block_argument}) {{
+                    ethPriceUSD
+                }}
+                positions({block_argument} first: $first, where: {{id_in: $ids, liquidity_gt: 0}}) {{
+                    {POSITION_FIELDS}
+                }}
+            }}
+        """)
+        positions = []
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            params = {"ids": chunk, "first": len(chunk)}
+            if block_number is not None:
+                params["block"] = block_number
             result = self.client.execute(query, variable_values=params)
-            eth_price_usd = float(result.get("bundle", {}).get("ethPriceUSD", 0))
-            positions = result.get('positions', [])
-            
-            for pos in positions:
-                pos["ethPriceUSD"] = eth_price_usd
+            page = result.get("positions", [])
+            _annotate_positions(page, result)
+            positions.extend(pool_cache.attach(page))
+        return positions
 
+    def get_indexed_block(self) -> Optional[int]:
+        """Último bloque indexado por el Subgraph."""
+        result = self.client.execute(self._document(INDEXED_BLOCK_QUERY))
+        return ((result.get("_meta") or {}).get("block") or {}).get("number")
+
+    def get_pool_states(
+        self, pool_ids: Iterable[str], block_number: Optional[int] = None, chunk_size: Optional[int] = None
+    ) -> Tuple[Optional[int], Dict[str, Dict[str, Any]]]:
+        """
+        Devuelve el bloque consultado y `{pool_id: estado}` con `POOL_STATE_FIELDS`,
+        en `block_number` si se indica o en el último bloque indexado.
+        """
+        ids = sorted({pool_id.lower() for pool_id in pool_ids})
+        chunk_size = chunk_size or settings.SUBGRAPH_PAGE_SIZE
+        block_declaration, block_argument = _block_arguments(block_number)
+        meta_arguments = f"({block_argument})" if block_argument else ""
+        query = self._document(f"""
+            query($ids: [ID!]!, $first: Int!{block_declaration}) {{
+                _meta{meta_arguments} {{ block {{ number }} }}
+                pools({block_argument} first: $first, where: {{id_in: $ids}}) {{
+                    {POOL_STATE_FIELDS}
+                }}
+            }}
+        """)
+        states = {}
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            params = {"ids": chunk, "first": len(chunk)}
+            if block_number is not None:
+                params["block"] = block_number
+            result = self.client.execute(query, variable_values=params)
+            block_number = ((result.get("_meta") or {}).get("block") or {}).get("number", block_number)
+            states.update({pool["id"]: pool for pool in result.get("pools", [])})
+        logger.info(f"Subgraph: estado de {len(states)} pools en el bloque {block_number}.")
+        return block_number, states
+
+    def get_pool_ticks(self, pool_ids: Iterable[str], chunk_size: Optional[int] = None) -> Tuple[Optional[int], Dict[str, int]]:
+        """Último bloque indexado y tick actual de cada pool, con una consulta por trozo."""
+        ids = sorted({pool_id.lower() for pool_id in pool_ids})
+        chunk_size = chunk_size or settings.SUBGRAPH_PAGE_SIZE
+        query = self._document(POOL_TICKS_QUERY)
+        block_number, ticks = None, {}
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            result = self.client.execute(query, variable_values={"ids": chunk, "first": len(chunk)})
+            block_number = ((result.get("_meta") or {}).get("block") or {}).get("number")
+            for pool in result.get("pools", []):
+                if pool.get("tick") is not None:
+                    ticks[pool["id"]] = int(pool["tick"])
+        return block_number, ticks
+
+    def get_positions_for_wallet(self, owner_address: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene las posiciones activas para una wallet, incluyendo datos
+        para el cálculo de fees y APR.
+        """
+        try:
+            positions = [
+                pos for page in self.iter_positions_for_owners([owner_address]) for pos in page
+            ]
             logger.info(f"Subgraph query exitosa. Se encontraron {len(positions)} posiciones activas para la wallet {owner_address}")
             return positions
         except Exception as e:
             logger.error(f"Error al consultar el Subgraph: {e}", exc_info=True)
             return []
 
-subgraph_client = SubgraphClient(chain=settings.CHAIN, query_url=settings.THEGRAPH_PROJECT_QUERY_URL)
\ No newline at end of file
+# Instancia global, construida en el primer uso.
+_subgraph_client: Optional[SubgraphClient] = None
+_subgraph_client_lock = threading.Lock()
+
+def get_subgraph_client() -> SubgraphClient:
+    global _subgraph_client
+    if _subgraph_client is None:
+        with _subgraph_client_lock:
+            if _subgraph_client is None:
+                _subgraph_client = SubgraphClient(chain=settings.CHAIN, query_url=settings.THEGRAPH_PROJECT_QUERY_URL)
+    return _subgraph_client
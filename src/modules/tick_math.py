@@ -0,0 +1,118 @@
+# src/modules/tick_math.py
+import threading
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from modules.uniswap_math import MIN_TICK, MAX_TICK
+
+# Separación de ticks de cada nivel de comisión (en centésimas de punto básico).
+FEE_TIER_TICK_SPACING = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+# Tokens que, por orden de prioridad, se usan como moneda de cotización: el precio
+# de un par se expresa como unidades del token de cotización por unidad del otro.
+QUOTE_TOKEN_PRIORITY = ("USDC", "USDT", "DAI", "FRAX", "LUSD", "WETH", "ETH", "WBTC")
+
+_LOG_TICK_BASE = np.log(1.0001)
+
+class PoolTickInfo(NamedTuple):
+    """Metadatos de un pool necesarios para convertir ticks en precios legibles."""
+    decimals0: int
+    decimals1: int
+    invert: bool # True si token0 es el token de cotización: el precio se da como token0 por token1.
+    tick_spacing: Optional[int]
+
+def _quote_rank(symbol: Optional[str]) -> int:
+    symbol = (symbol or "").upper()
+    return QUOTE_TOKEN_PRIORITY.index(symbol) if symbol in QUOTE_TOKEN_PRIORITY else len(QUOTE_TOKEN_PRIORITY)
+
+def is_token0_quote(token0_symbol: Optional[str], token1_symbol: Optional[str]) -> bool:
+    """Orientación del par según `QUOTE_TOKEN_PRIORITY`; si ninguno es conocido se mantiene token1 como cotización."""
+    return _quote_rank(token0_symbol) < _quote_rank(token1_symbol)
+
+# --- Caché de metadatos por pool ---
+_pool_info_cache: Dict[str, PoolTickInfo] = {}
+_pool_info_lock = threading.Lock()
+
+def get_pool_tick_info(
+    pool_key: str, token0_symbol: Optional[str], token1_symbol: Optional[str],
+    decimals0: int, decimals1: int, fee: Optional[int] = None
+) -> PoolTickInfo:
+    """Devuelve (y cachea por pool) decimales, orientación y separación de ticks."""
+    with _pool_info_lock:
+        info = _pool_info_cache.get(pool_key)
+        if info is None:
+            info = PoolTickInfo(
+                decimals0=int(decimals0),
+                decimals1=int(decimals1),
+                invert=is_token0_quote(token0_symbol, token1_symbol),
+                tick_spacing=FEE_TIER_TICK_SPACING.get(int(fee)) if fee is not None else None,
+            )
+            _pool_info_cache[pool_key] = info
+        return info
+
+def get_cached_pool_tick_info(pool_key: str) -> Optional[PoolTickInfo]:
+    with _pool_info_lock:
+        return _pool_info_cache.get(pool_key)
+
+# --- Rejillas de precios por nivel de comisión ---
+
+@lru_cache(maxsize=None)
+def tick_price_grid(fee: int) -> Tuple[int, int, np.ndarray]:
+    """
+    Precios brutos 1.0001^tick para todos los ticks alineados con la separación del
+    nivel de comisión. Devuelve `(primer tick, separación, precios)`; los precios
+    están ordenados de forma creciente, así que sirven para búsquedas binarias.
+    """
+    spacing = FEE_TIER_TICK_SPACING[int(fee)]
+    first_tick = -(-MIN_TICK // spacing) * spacing
+    ticks = np.arange(first_tick, MAX_TICK + 1, spacing, dtype=np.int64)
+    grid = np.exp(ticks * _LOG_TICK_BASE)
+    grid.setflags(write=False)
+    return first_tick, spacing, grid
+
+def _raw_tick_prices(ticks: np.ndarray, fees) -> np.ndarray:
+    """1.0001^tick; los ticks alineados de niveles de comisión conocidos salen de su rejilla."""
+    prices = np.exp(ticks * _LOG_TICK_BASE)
+    if fees is None:
+        return prices
+    fees = np.broadcast_to(np.asarray(fees, dtype=np.int64), ticks.shape)
+    for fee in np.unique(fees):
+        if int(fee) not in FEE_TIER_TICK_SPACING:
+            continue
+        first_tick, spacing, grid = tick_price_grid(int(fee))
+        offsets = ticks - first_tick
+        rows = (fees == fee) & (offsets % spacing == 0) & (offsets >= 0) & (offsets // spacing < len(grid))
+        prices[rows] = grid[offsets[rows] // spacing]
+    return prices
+
+def ticks_to_prices(ticks, decimals0, decimals1, invert, fees=None) -> np.ndarray:
+    """
+    Convierte un array de ticks a precios legibles: ajusta por decimales y aplica la
+    orientación del pool. `decimals0`, `decimals1`, `invert` y `fees` pueden ser
+    escalares o arrays (una fila por posición de pools distintos).
+    """
+    ticks = np.atleast_1d(np.asarray(ticks, dtype=np.int64))
+    prices = _raw_tick_prices(ticks, fees) * np.power(10.0, np.asarray(decimals0, dtype=float) - np.asarray(decimals1, dtype=float))
+    return np.where(np.asarray(invert, dtype=bool), 1.0 / prices, prices)
+
+def range_to_prices(
+    ticks_lower, ticks_upper, decimals0, decimals1, invert, fees=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Límites `(inferior, superior)` del rango en precio; con orientación invertida se intercambian."""
+    prices_a = ticks_to_prices(ticks_lower, decimals0, decimals1, invert, fees)
+    prices_b = ticks_to_prices(ticks_upper, decimals0, decimals1, invert, fees)
+    return np.minimum(prices_a, prices_b), np.maximum(prices_a, prices_b)
+
+def prices_to_ticks(prices, decimals0: int, decimals1: int, invert: bool, fee: int) -> np.ndarray:
+    """
+    Tick alineado cuyo precio bruto es el mayor que no supera el de cada precio
+    legible, con búsqueda binaria sobre la rejilla del nivel de comisión. Útil para
+    buscar rangos candidatos.
+    """
+    prices = np.asarray(prices, dtype=float)
+    raw = (1.0 / prices if invert else prices) / 10.0 ** (decimals0 - decimals1)
+    first_tick, spacing, grid = tick_price_grid(fee)
+    index = np.clip(np.searchsorted(grid, raw, side="right") - 1, 0, len(grid) - 1)
+    return first_tick + index * spacing
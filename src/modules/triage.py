@@ -0,0 +1,135 @@
+# src/modules/triage.py
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from models import Wallet, PositionMetric
+
+logger = logging.getLogger(__name__)
+
+ESCALATE_TO_LLM = "ESCALATE_TO_LLM"
+
+IN_QUERY_CHUNK_SIZE = 500
+
+# --- Registro de reglas ---
+# Cada regla recibe el dict de arrays de `build_metric_arrays` y devuelve una máscara
+# booleana con las posiciones que decide. Se evalúan en orden de registro y la
+# primera que coincide gana; lo que ninguna decide se escala al LLM.
+_RULES: List[Tuple[str, str, str, Callable[[Dict[str, np.ndarray]], np.ndarray]]] = []
+
+def register_rule(name: str, action: str, justification: str):
+    """
+    Decorador para añadir una regla al motor de triaje. `justification` es una
+    plantilla que se formatea con los campos de la métrica.
+    """
+    def decorator(func: Callable[[Dict[str, np.ndarray]], np.ndarray]):
+        _RULES.append((name, action, justification, func))
+        return func
+    return decorator
+
+@register_rule(
+    "il_alert", ESCALATE_TO_LLM,
+    "La IL ({impermanent_loss_percent:.2f}%) supera el umbral de alerta de la wallet."
+)
+def _il_above_wallet_alert(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    # La wallet pidió revisar estas posiciones: siempre las analiza el modelo.
+    return arrays["abs_il"] > arrays["il_alert_threshold"]
+
+@register_rule(
+    "far_out_of_range", "REBALANCE",
+    "El precio actual ({current_price:.4f}) está lejos del rango {price_lower:.4f} - {price_upper:.4f}. "
+    "La posición no genera comisiones; se recomienda rebalancear."
+)
+def _far_out_of_range(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    margin = settings.TRIAGE_FAR_OUT_OF_RANGE_PERCENT / 100.0
+    price, lower, upper = arrays["current_price"], arrays["price_lower"], arrays["price_upper"]
+    return (price < lower * (1.0 - margin)) | (price > upper * (1.0 + margin))
+
+@register_rule(
+    "deep_in_range", "MAINTAIN",
+    "El precio actual ({current_price:.4f}) está bien dentro del rango {price_lower:.4f} - {price_upper:.4f} "
+    "y la IL ({impermanent_loss_percent:.2f}%) es despreciable."
+)
+def _deep_in_range(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    margin = settings.TRIAGE_IN_RANGE_MARGIN
+    position_in_range = arrays["position_in_range"]
+    return (
+        (position_in_range >= margin) & (position_in_range <= 1.0 - margin)
+        & (arrays["abs_il"] <= settings.TRIAGE_NEGLIGIBLE_IL_PERCENT)
+    )
+
+# --- Motor ---
+
+def load_wallet_il_thresholds(db_session, wallet_ids: Iterable[int]) -> Dict[int, float]:
+    """Devuelve `{wallet_id: umbral de alerta de IL}` solo para las wallets que lo definen."""
+    ids = sorted(set(wallet_ids))
+    thresholds = {}
+    for i in range(0, len(ids), IN_QUERY_CHUNK_SIZE):
+        chunk = ids[i:i + IN_QUERY_CHUNK_SIZE]
+        rows = db_session.query(Wallet.id, Wallet.il_alert_threshold_percent).filter(
+            Wallet.id.in_(chunk), Wallet.il_alert_threshold_percent.isnot(None)
+        )
+        thresholds.update({wallet_id: threshold for wallet_id, threshold in rows})
+    return thresholds
+
+def build_metric_arrays(metrics: List[PositionMetric], wallet_thresholds: Dict[int, float]) -> Dict[str, np.ndarray]:
+    """Pasa las métricas a arrays columnares; los valores ausentes quedan como NaN."""
+    def column(values) -> np.ndarray:
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+    price_lower = column(metric.price_lower for metric in metrics)
+    price_upper = column(metric.price_upper for metric in metrics)
+    current_price = column(metric.current_price for metric in metrics)
+    width = price_upper - price_lower
+    with np.errstate(divide="ignore", invalid="ignore"):
+        position_in_range = np.where(width > 0, (current_price - price_lower) / width, np.nan)
+
+    default_threshold = settings.TRIAGE_IL_ALERT_PERCENT
+    return {
+        "price_lower": price_lower,
+        "price_upper": price_upper,
+        "current_price": current_price,
+        "position_in_range": position_in_range,
+        "abs_il": np.abs(column(metric.impermanent_loss_percent for metric in metrics)),
+        "il_alert_threshold": column(
+            wallet_thresholds.get(metric.position.wallet_id, default_threshold) for metric in metrics
+        ),
+    }
+
+def triage_metrics(
+    metrics: List[PositionMetric], wallet_thresholds: Optional[Dict[int, float]] = None
+) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Clasifica cada métrica con las reglas registradas. Devuelve, en el mismo orden,
+    `(acción, nombre de la regla, justificación)`. Las posiciones que ninguna regla
+    decide, o con datos incompletos, se devuelven como `(ESCALATE_TO_LLM, None, None)`;
+    una regla también puede escalar de forma explícita.
+    """
+    if not metrics:
+        return []
+    arrays = build_metric_arrays(metrics, wallet_thresholds or {})
+    # Sin precios no hay decisión posible: esas filas siempre van al modelo.
+    pending = np.isfinite(arrays["current_price"]) & np.isfinite(arrays["price_lower"]) & np.isfinite(arrays["price_upper"])
+    rule_index = np.full(len(metrics), -1)
+    for index, (name, _, _, rule) in enumerate(_RULES):
+        with np.errstate(invalid="ignore"):
+            matched = pending & rule(arrays)
+        rule_index[matched] = index
+        pending &= ~matched
+
+    decisions = []
+    for metric, index in zip(metrics, rule_index):
+        if index < 0:
+            decisions.append((ESCALATE_TO_LLM, None, None))
+            continue
+        name, action, justification, _ = _RULES[index]
+        justification = justification.format(
+            current_price=metric.current_price,
+            price_lower=metric.price_lower,
+            price_upper=metric.price_upper,
+            impermanent_loss_percent=metric.impermanent_loss_percent or 0.0,
+        )
+        decisions.append((action, name, justification))
+    return decisions
@@ -0,0 +1,202 @@
+# src/modules/uniswap_math.py
+"""
+Matemática exacta de liquidez concentrada de Uniswap V3.
+
+Las funciones escalares replican la aritmética entera de los contratos
+(TickMath, LiquidityAmounts y el cálculo de `feeGrowthInside` módulo 2^256).
+Las versiones `batch_*` trabajan sobre columnas de NumPy para procesar una
+cartera completa de una pasada; las de precios y cantidades usan float64, y la
+de comisiones recorre enteros de Python porque Q128 necesita 256 bits.
+
+Convención de precios: `price` es token1 por token0 ajustado por decimales.
+"""
+from typing import Iterable, Tuple
+
+import numpy as np
+
+Q96 = 1 << 96
+Q128 = 1 << 128
+Q256 = 1 << 256
+MAX_UINT256 = Q256 - 1
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+# Constantes de TickMath.getSqrtRatioAtTick: sqrt(1.0001)^-(2^i) en Q128.
+_TICK_RATIO_FACTORS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+# --- Ticks y precios ---
+
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """sqrt(1.0001^tick) en Q64.96, con el mismo redondeo que TickMath."""
+    if not MIN_TICK <= tick <= MAX_TICK:
+        raise ValueError(f"Tick fuera de rango: {tick}")
+    abs_tick = abs(tick)
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else Q128
+    for mask, factor in _TICK_RATIO_FACTORS:
+        if abs_tick & mask:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96: int) -> int:
+    """Mayor tick cuyo sqrtRatio es <= `sqrt_price_x96` (inversa exacta de `get_sqrt_ratio_at_tick`)."""
+    if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+        raise ValueError(f"sqrtPriceX96 fuera de rango: {sqrt_price_x96}")
+    low, high = MIN_TICK, MAX_TICK
+    while low < high:
+        mid = (low + high + 1) // 2
+        if get_sqrt_ratio_at_tick(mid) <= sqrt_price_x96:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def sqrt_price_x96_to_price(sqrt_price_x96: int, decimals0: int, decimals1: int) -> float:
+    """Precio de token0 expresado en token1, ajustado por decimales."""
+    return (sqrt_price_x96 / Q96) ** 2 * 10 ** (decimals0 - decimals1)
+
+def tick_to_price(tick: int, decimals0: int, decimals1: int) -> float:
+    return 1.0001 ** tick * 10 ** (decimals0 - decimals1)
+
+def batch_tick_to_price(ticks, decimals0, decimals1) -> np.ndarray:
+    ticks = np.asarray(ticks, dtype=float)
+    return np.power(1.0001, ticks) * np.power(10.0, np.asarray(decimals0, dtype=float) - np.asarray(decimals1, dtype=float))
+
+# --- Cantidades a partir de la liquidez ---
+
+def get_amount0_for_liquidity(sqrt_ratio_a: int, sqrt_ratio_b: int, liquidity: int) -> int:
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    return ((liquidity << 96) * (sqrt_ratio_b - sqrt_ratio_a) // sqrt_ratio_b) // sqrt_ratio_a
+
+def get_amount1_for_liquidity(sqrt_ratio_a: int, sqrt_ratio_b: int, liquidity: int) -> int:
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    return liquidity * (sqrt_ratio_b - sqrt_ratio_a) // Q96
+
+def get_amounts_for_liquidity(
+    sqrt_price_x96: int, sqrt_ratio_a: int, sqrt_ratio_b: int, liquidity: int
+) -> Tuple[int, int]:
+    """Cantidades (en unidades mínimas) de token0 y token1 de una posición (LiquidityAmounts)."""
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    if sqrt_price_x96 <= sqrt_ratio_a:
+        return get_amount0_for_liquidity(sqrt_ratio_a, sqrt_ratio_b, liquidity), 0
+    if sqrt_price_x96 < sqrt_ratio_b:
+        return (
+            get_amount0_for_liquidity(sqrt_price_x96, sqrt_ratio_b, liquidity),
+            get_amount1_for_liquidity(sqrt_ratio_a, sqrt_price_x96, liquidity),
+        )
+    return 0, get_amount1_for_liquidity(sqrt_ratio_a, sqrt_ratio_b, liquidity)
+
+def batch_amounts_for_liquidity(sqrt_prices, sqrt_lower, sqrt_upper, liquidity) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Versión en float64 de `get_amounts_for_liquidity`. Los sqrt se pasan como
+    número real (sqrtPriceX96 / 2^96), no en Q96.
+    """
+    sqrt_prices = np.asarray(sqrt_prices, dtype=float)
+    sqrt_lower = np.asarray(sqrt_lower, dtype=float)
+    sqrt_upper = np.asarray(sqrt_upper, dtype=float)
+    liquidity = np.asarray(liquidity, dtype=float)
+    clamped = np.clip(sqrt_prices, sqrt_lower, sqrt_upper)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amount0 = liquidity * (sqrt_upper - clamped) / (clamped * sqrt_upper)
+    amount1 = liquidity * (clamped - sqrt_lower)
+    return np.nan_to_num(amount0), np.nan_to_num(amount1)
+
+# --- Comisiones no reclamadas (Q128) ---
+
+def get_fee_growth_inside(
+    tick_current: int, tick_lower: int, tick_upper: int,
+    fee_growth_global_x128: int, fee_growth_outside_lower_x128: int, fee_growth_outside_upper_x128: int
+) -> int:
+    """feeGrowthInside del rango, con el desbordamiento módulo 2^256 del contrato."""
+    if tick_current >= tick_lower:
+        fee_growth_below = fee_growth_outside_lower_x128
+    else:
+        fee_growth_below = fee_growth_global_x128 - fee_growth_outside_lower_x128
+    if tick_current < tick_upper:
+        fee_growth_above = fee_growth_outside_upper_x128
+    else:
+        fee_growth_above = fee_growth_global_x128 - fee_growth_outside_upper_x128
+    return (fee_growth_global_x128 - fee_growth_below - fee_growth_above) % Q256
+
+def get_uncollected_fees(liquidity: int, fee_growth_inside_x128: int, fee_growth_inside_last_x128: int) -> int:
+    """Comisiones acumuladas desde el último checkpoint de la posición, en unidades mínimas."""
+    return (liquidity * ((fee_growth_inside_x128 - fee_growth_inside_last_x128) % Q256)) >> 128
+
+def batch_uncollected_fees(
+    liquidity: Iterable[int], tick_current: Iterable[int], tick_lower: Iterable[int], tick_upper: Iterable[int],
+    fee_growth_global_x128: Iterable[int], fee_growth_outside_lower_x128: Iterable[int],
+    fee_growth_outside_upper_x128: Iterable[int], fee_growth_inside_last_x128: Iterable[int]
+) -> np.ndarray:
+    """`get_uncollected_fees` para un lote; el resultado se devuelve como float64."""
+    return np.array([
+        float(get_uncollected_fees(
+            int(l), get_fee_growth_inside(int(tc), int(tl), int(tu), int(fg), int(fl), int(fu)), int(last)
+        ))
+        for l, tc, tl, tu, fg, fl, fu, last in zip(
+            liquidity, tick_current, tick_lower, tick_upper,
+            fee_growth_global_x128, fee_growth_outside_lower_x128, fee_growth_outside_upper_x128,
+            fee_growth_inside_last_x128,
+        )
+    ], dtype=float)
+
+# --- Pérdida impermanente en rango concentrado ---
+
+def concentrated_impermanent_loss(entry_price: float, current_price: float, price_lower: float, price_upper: float) -> float:
+    """
+    IL porcentual de una posición de rango [price_lower, price_upper] frente a
+    mantener los tokens depositados al precio de entrada. No depende de la
+    liquidez. Devuelve 0.0 si los datos no son válidos.
+    """
+    return float(batch_concentrated_impermanent_loss([entry_price], [current_price], [price_lower], [price_upper])[0])
+
+def batch_concentrated_impermanent_loss(entry_prices, current_prices, price_lower, price_upper) -> np.ndarray:
+    entry = np.asarray(entry_prices, dtype=float)
+    current = np.asarray(current_prices, dtype=float)
+    lower = np.asarray(price_lower, dtype=float)
+    upper = np.asarray(price_upper, dtype=float)
+    valid = (
+        np.isfinite(entry) & np.isfinite(current) & np.isfinite(lower) & np.isfinite(upper)
+        & (entry > 0) & (current > 0) & (lower > 0) & (upper > lower)
+    )
+    # Con datos inválidos se usa un rango ficticio y el resultado se descarta con la máscara.
+    entry, current = np.where(valid, entry, 1.0), np.where(valid, current, 1.0)
+    sqrt_lower, sqrt_upper = np.sqrt(np.where(valid, lower, 0.5)), np.sqrt(np.where(valid, upper, 2.0))
+
+    entry_amount0, entry_amount1 = batch_amounts_for_liquidity(np.sqrt(entry), sqrt_lower, sqrt_upper, 1.0)
+    amount0, amount1 = batch_amounts_for_liquidity(np.sqrt(current), sqrt_lower, sqrt_upper, 1.0)
+    hold_value = entry_amount0 * current + entry_amount1
+    lp_value = amount0 * current + amount1
+    valid &= hold_value > 0
+    il = np.divide(lp_value, hold_value, out=np.ones_like(lp_value), where=valid) - 1
+    return np.where(valid, il * 100, 0.0)
+
+def batch_sqrt_price_from_x96(sqrt_prices_x96: Iterable) -> np.ndarray:
+    """sqrtPriceX96 (entero o cadena del Subgraph) como sqrt del precio bruto en float64."""
+    return np.array([int(value) / Q96 for value in sqrt_prices_x96], dtype=float)
@@ -1,9 +1,7 @@
 # verify_db.py
 from core.database import SessionLocal
 from models.wallet import Wallet
-from models.position import Position
-from models.metric import PositionMetric
-from sqlalchemy.orm import joinedload
+from modules.position_queries import latest_states, sample_counts
 
 def inspect_database():
     db = SessionLocal()
@@ -14,17 +12,24 @@ def inspect_database():
     for wallet in wallets:
         print(f"  - ID: {wallet.id}, Dirección: {wallet.address}")
 
-    # Usamos joinedload para cargar eficientemente las métricas relacionadas
-    positions = db.query(Position).options(joinedload(Position.metrics)).all()
-    print(f"\n[+] Posiciones encontradas: {len(positions)}")
-    for pos in positions:
-        print(f"  - Posición Token ID: {pos.token_id} (Wallet: {pos.wallet.address})")
-        print(f"    Pool: {pos.token0_symbol}/{pos.token1_symbol}")
-        print(f"    Métricas guardadas: {len(pos.metrics)}")
-        for metric in pos.metrics:
-            print(f"      -> Snapshot a las {metric.snapshot_at.strftime('%Y-%m-%d %H:%M:%S')}: En rango? {metric.is_in_range}, Precio: {metric.current_price}")
+    # Solo el estado actual de cada posición (vía `latest_metric_id`), por páginas:
+    # el coste depende del número de posiciones, no del histórico de métricas.
+    wallet_addresses = {wallet.id: wallet.address for wallet in wallets}
+    total, cursor = 0, 0
+    print("\n[+] Posiciones con métricas:")
+    while cursor is not None:
+        page = latest_states(db, after_position_id=cursor)
+        counts = sample_counts(db, [pos.id for pos, _ in page.items])
+        for pos, metric in page.items:
+            print(f"  - Posición Token ID: {pos.token_id} (Wallet: {wallet_addresses.get(pos.wallet_id)})")
+            print(f"    Pool: {pos.token0_symbol}/{pos.token1_symbol}")
+            print(f"    Snapshots registrados: {counts.get(pos.id, 0)}")
+            print(f"      -> Último snapshot a las {metric.snapshot_at.strftime('%Y-%m-%d %H:%M:%S')}: En rango? {metric.is_in_range}, Precio: {metric.current_price}")
+        total += len(page.items)
+        cursor = page.next_cursor
+    print(f"\n[+] Posiciones encontradas: {total}")
 
     db.close()
 
 if __name__ == "__main__":
-    inspect_database()
\ No newline at end of file
+    inspect_database()
@@ -0,0 +1,28 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, SRC_DIR)
+
+# `core.config` lee el entorno al importarse: base de datos temporal y sin servicios reales.
+_DATA_DIR = tempfile.mkdtemp(prefix="uniswap-agent-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DATA_DIR, 'test.db')}"
+os.environ.setdefault("DEV_MODE_MOCK_API", "true")
+
+import pytest
+
+@pytest.fixture
+def db_session():
+    """Sesión sobre un esquema recién creado en la base de datos temporal; se borra al terminar."""
+    from core.database import SessionLocal, engine
+    from models import Base
+
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
@@ -0,0 +1,81 @@
+# tests/test_block_stream.py
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import SRC_DIR
+from modules.block_stream import SWAP_TOPIC, FixtureLogSource
+from modules.range_index import RangeIndex, _in_range
+
+FIXTURE_PATH = os.path.join(SRC_DIR, "data", "mock_swap_logs.json")
+POOL = "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"
+RANGES = {1: (198150, 198200), 2: (198200, 198300), 3: (190000, 210000)}
+
+def _replay(source, pools):
+    """Consulta la fuente hasta agotar el fixture y devuelve los ticks observados en orden."""
+    updates = []
+    while True:
+        updates.extend(source.poll(pools))
+        if source._last_block == source._end:
+            return updates
+
+def test_fixture_replay_detects_range_flips():
+    range_index = RangeIndex()
+    range_index.upsert([
+        SimpleNamespace(id=position_id, pool_address=POOL, tick_lower=str(lower), tick_upper=str(upper))
+        for position_id, (lower, upper) in RANGES.items()
+    ])
+
+    flips, expected, in_range = [], [], {}
+    for update in _replay(FixtureLogSource(FIXTURE_PATH), [POOL]):
+        flips.extend((update.block_number, flip.position_id, flip.in_range)
+                     for flip in range_index.observe_tick(update.pool, update.tick, update.block_number))
+        # Referencia por fuerza bruta: el estado de cada posición con cada tick observado.
+        for position_id, (lower, upper) in RANGES.items():
+            now = _in_range(update.tick, lower, upper)
+            if position_id in in_range and in_range[position_id] != now:
+                expected.append((update.block_number, position_id, now))
+            in_range[position_id] = now
+
+    assert flips == expected
+    # El swap del bloque 19000007 (tick 198223) saca a la posición 1 del rango y mete a la 2.
+    assert (19000007, 1, False) in flips and (19000007, 2, True) in flips
+    assert not any(position_id == 3 for _, position_id, _ in flips)
+
+def _swap_log(pool, block_number, log_index, tick):
+    words = [0, 0, 1 << 96, 10 ** 18, tick % (1 << 256)]
+    return {
+        "address": pool, "topics": [SWAP_TOPIC], "blockNumber": hex(block_number), "logIndex": hex(log_index),
+        "data": "0x" + "".join(f"{word:064x}" for word in words), "removed": False,
+    }
+
+def test_failed_chunk_keeps_swaps_from_earlier_chunks(tmp_path):
+    other_pool = "0x4e68ccd3e89f51c3074ca5072bbac773960dfa36"
+    path = tmp_path / "logs.json"
+    path.write_text(json.dumps({"logs": [
+        _swap_log(POOL, 100, 0, 10), _swap_log(POOL, 102, 0, 20), _swap_log(other_pool, 105, 0, -30),
+    ]}))
+    source = FixtureLogSource(str(path), max_block_range=3)
+    pools = [POOL, other_pool]
+    assert source.poll(pools) == [] # Fija el bloque de partida (100).
+
+    # El nodo avanza de golpe hasta el 105 y falla el segundo tramo (104-105).
+    source._head = 104
+    rpc, calls = source._rpc, []
+    def flaky_rpc(method, params):
+        if method == "eth_getLogs":
+            calls.append(params[0]["fromBlock"])
+            if len(calls) == 2:
+                raise RuntimeError("timeout")
+        return rpc(method, params)
+    source._rpc = flaky_rpc
+    with pytest.raises(RuntimeError):
+        source.poll(pools)
+
+    # La siguiente consulta solo repite el tramo fallido y devuelve también el swap del primero.
+    updates = {update.pool: (update.block_number, update.tick) for update in source.poll(pools)}
+    assert updates == {POOL: (102, 20), other_pool: (105, -30)}
+    assert calls[2] == hex(104)
+    assert source.poll(pools) == []
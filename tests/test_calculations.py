@@ -0,0 +1,82 @@
+# tests/test_calculations.py
+import math
+
+import numpy as np
+import pytest
+
+from modules.calculations import (
+    batch_impermanent_loss,
+    batch_real_apr,
+    batch_unclaimed_fees_usd,
+    calculate_impermanent_loss_simplified,
+    calculate_real_apr,
+    calculate_unclaimed_fees_usd,
+)
+
+NOW = 1_700_000_000
+NAN, INF = math.nan, math.inf
+
+IL_CASES = [
+    (2000.0, 2000.0),
+    (2000.0, 2500.0),
+    (2000.0, 0.0),
+    (0.0, 2000.0),     # sin precio de entrada
+    (NAN, 2000.0),     # precio de entrada sin resolver
+    (2000.0, NAN),
+    (-2000.0, 2000.0), # razón negativa
+    (2000.0, -5.0),
+    (-2000.0, -1000.0),
+    (INF, 2000.0),
+    (2000.0, INF),
+    (1e-300, 1e300),   # la razón desborda a infinito
+]
+
+FEES_CASES = [
+    (10.0, 0.01, 1.0, 2000.0),
+    (0.0, 0.0, 1.0, 2000.0),
+    (-1.0, 2.0, 3.0, 4.0),
+    (NAN, 1.0, 1.0, 1.0),
+]
+
+APR_CASES = [
+    (100.0, 10_000.0, NOW - 30 * 86400, -2.5),
+    (100.0, 0.0, NOW - 30 * 86400, -2.5),      # sin liquidez
+    (100.0, 10_000.0, NOW, -2.5),              # antigüedad 0
+    (100.0, 10_000.0, NOW + 3600, -2.5),       # creada "en el futuro"
+    (0.0, 10_000.0, NOW - 86400, 0.0),
+    (-50.0, -10_000.0, NOW - 7 * 86400, 1.0),  # valores negativos
+    (100.0, 10_000.0, NOW - 1, NAN),
+    (100.0, NAN, NOW - 86400, -1.0),
+    (100.0, 10_000.0, NAN, -1.0),              # antigüedad NaN
+]
+
+def _assert_same(batch, scalar):
+    np.testing.assert_allclose(batch, np.array(scalar, dtype=float), rtol=1e-12, atol=0, equal_nan=True)
+
+@pytest.mark.parametrize("initial, current", IL_CASES)
+def test_batch_impermanent_loss_matches_scalar(initial, current):
+    _assert_same(batch_impermanent_loss([initial], [current]), [calculate_impermanent_loss_simplified(initial, current)])
+
+@pytest.mark.parametrize("fees0, fees1, price0, price1", FEES_CASES)
+def test_batch_unclaimed_fees_matches_scalar(fees0, fees1, price0, price1):
+    _assert_same(
+        batch_unclaimed_fees_usd([fees0], [fees1], [price0], [price1]),
+        [calculate_unclaimed_fees_usd(fees0, fees1, price0, price1)],
+    )
+
+@pytest.mark.parametrize("fees, liquidity, created_at, il", APR_CASES)
+def test_batch_real_apr_matches_scalar(fees, liquidity, created_at, il):
+    _assert_same(
+        batch_real_apr([fees], [liquidity], [created_at], [il], NOW),
+        [calculate_real_apr(fees, liquidity, created_at, il, NOW)],
+    )
+
+def test_batch_functions_match_scalar_over_whole_columns():
+    # Todas las filas juntas: las máscaras de una fila no deben afectar a las demás.
+    initial, current = zip(*IL_CASES)
+    _assert_same(batch_impermanent_loss(initial, current), [calculate_impermanent_loss_simplified(*case) for case in IL_CASES])
+    fees, liquidity, created_at, il = zip(*APR_CASES)
+    _assert_same(
+        batch_real_apr(fees, liquidity, created_at, il, NOW),
+        [calculate_real_apr(*case, current_timestamp=NOW) for case in APR_CASES],
+    )
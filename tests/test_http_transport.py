@@ -0,0 +1,124 @@
+# tests/test_http_transport.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from core.config import settings
+from modules.http_transport import CircuitOpenError, HttpTransport
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """Responde con los códigos de `server.script` en orden (200 cuando se agota)."""
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            status = self.server.script.pop(0) if self.server.script else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ScriptedHandler)
+        self.lock = threading.Lock()
+        self.script, self.requests, self.connections = [], 0, 0
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+@pytest.fixture
+def server():
+    server = _StandInServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def transport(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "HTTP_CIRCUIT_RESET_SECONDS", 0.2)
+    transport = HttpTransport(max_retries=2, backoff_base_seconds=0.01, backoff_max_seconds=0.01, timeout=(1, 2))
+    yield transport
+    transport.session.close()
+
+def _url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_retries_transient_errors(server, transport, status):
+    server.script = [status, status]
+
+    response = transport.request("GET", _url(server))
+
+    assert response.json() == {"ok": True}
+    assert server.requests == 3
+    stats = transport.stats()[f"127.0.0.1:{server.server_address[1]}"]
+    assert stats["retries"] == 2 and stats["circuit"] == "closed"
+
+def test_client_errors_are_not_retried(server, transport):
+    server.script = [404]
+
+    with pytest.raises(requests.HTTPError):
+        transport.request("GET", _url(server))
+    assert server.requests == 1
+
+def test_circuit_opens_and_closes_after_a_successful_probe(server, transport):
+    host = f"127.0.0.1:{server.server_address[1]}"
+    server.script = [503] * 3
+
+    with pytest.raises(requests.HTTPError):
+        transport.request("GET", _url(server))
+    assert transport.breaker(host).state == "open"
+
+    # Con el circuito abierto se falla sin tocar la red.
+    with pytest.raises(CircuitOpenError):
+        transport.request("GET", _url(server))
+    assert server.requests == 3
+
+    time.sleep(0.25)
+    assert transport.breaker(host).state == "half_open"
+    assert transport.request("GET", _url(server)).json() == {"ok": True}
+    assert transport.breaker(host).state == "closed"
+    assert server.requests == 4
+
+def test_failed_probe_reopens_the_circuit(server, transport):
+    host = f"127.0.0.1:{server.server_address[1]}"
+    server.script = [503] * 4
+    with pytest.raises(requests.HTTPError):
+        transport.request("GET", _url(server))
+
+    time.sleep(0.25)
+    # La petición de prueba falla y el circuito vuelve a abrirse sin más intentos.
+    with pytest.raises(CircuitOpenError):
+        transport.request("GET", _url(server))
+    assert server.requests == 4
+    assert transport.breaker(host).state == "open"
+
+def test_reuses_the_connection_across_requests_and_retries(server, transport):
+    server.script = [503]
+
+    for _ in range(5):
+        transport.request("GET", _url(server))
+
+    assert server.requests == 6
+    assert server.connections == 1
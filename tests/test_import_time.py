@@ -0,0 +1,30 @@
+# tests/test_import_time.py
+import json
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+# Presupuesto de `import daemon`: los comandos de utilidad deben arrancar sin cargar el modelo.
+IMPORT_TIME_BUDGET_SECONDS = 3.0
+HEAVY_MODULES = ("llama_cpp", "telegram", "moralis")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started_at = time.perf_counter()
+import daemon
+elapsed = time.perf_counter() - started_at
+loaded = sorted({{name.split('.')[0] for name in sys.modules}} & set({HEAVY_MODULES!r}))
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+def test_daemon_import_skips_heavy_modules_and_fits_budget():
+    # En un proceso nuevo: en este ya pueden estar importados por otras pruebas.
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=SRC_DIR, env=os.environ.copy(),
+        capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["loaded"] == []
+    assert report["seconds"] < IMPORT_TIME_BUDGET_SECONDS, f"import daemon tardó {report['seconds']:.2f}s"
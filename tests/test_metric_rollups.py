@@ -0,0 +1,65 @@
+# tests/test_metric_rollups.py
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert
+
+from models import Wallet, Position, PositionMetric, PositionMetricDaily
+from modules.metric_rollups import compact_metrics, rollups_fully_rebuilt, update_rollups
+from modules.position_queries import sample_counts
+
+def _metric_row(position_id, snapshot_at, fees=0.0):
+    return {
+        "position_id": position_id, "snapshot_at": snapshot_at, "current_price": 1.0, "price_lower": 0.5,
+        "price_upper": 2.0, "is_in_range": True, "impermanent_loss_percent": 0.0,
+        "unclaimed_fees_usd": fees, "real_apr_percent": 0.0,
+    }
+
+def test_compaction_rolls_up_history_even_after_a_scan_wrote_rollups(db_session):
+    # Base de datos anterior a los agregados: histórico en bruto más antiguo que la retención.
+    wallet = Wallet(address="0xwallet")
+    db_session.add(wallet)
+    db_session.flush()
+    position = Position(
+        token_id=1, wallet_id=wallet.id, pool_address="0xpool", token0_symbol="USDC", token1_symbol="WETH",
+        tick_lower="-200000", tick_upper="-190000",
+    )
+    db_session.add(position)
+    db_session.flush()
+    now = datetime.now(timezone.utc)
+    db_session.execute(insert(PositionMetric), [_metric_row(position.id, now - timedelta(days=40 + i), i) for i in range(48)])
+
+    # El escaneo de arranque del daemon escribe la métrica y los agregados del ciclo actual.
+    current = _metric_row(position.id, now)
+    (metric_id,) = db_session.execute(insert(PositionMetric).returning(PositionMetric.id), [current]).scalars().all()
+    position.latest_metric_id = metric_id
+    update_rollups(db_session, [current])
+    db_session.commit()
+
+    deleted = compact_metrics(db_session)
+
+    assert deleted["metrics"] == 48
+    assert db_session.query(func.sum(PositionMetricDaily.samples)).scalar() == 49
+    assert rollups_fully_rebuilt(db_session)
+    # La segunda compactación no vuelve a reconstruir ni duplica muestras.
+    compact_metrics(db_session)
+    assert db_session.query(func.sum(PositionMetricDaily.samples)).scalar() == 49
+
+def test_sample_counts_on_a_database_upgraded_before_the_rollups(db_session):
+    # Histórico anterior a los agregados: las tablas de agregados siguen vacías.
+    wallet = Wallet(address="0xwallet")
+    db_session.add(wallet)
+    db_session.flush()
+    position = Position(
+        token_id=1, wallet_id=wallet.id, pool_address="0xpool", token0_symbol="USDC", token1_symbol="WETH",
+    )
+    db_session.add(position)
+    db_session.flush()
+    now = datetime.now(timezone.utc)
+    db_session.execute(insert(PositionMetric), [_metric_row(position.id, now - timedelta(days=40 + i)) for i in range(5)])
+    db_session.commit()
+
+    assert sample_counts(db_session, [position.id]) == {position.id: 5}
+    # Tras la compactación las filas en bruto desaparecen, pero el recuento sigue siendo el mismo.
+    compact_metrics(db_session)
+    assert db_session.query(PositionMetric).count() == 0
+    assert sample_counts(db_session, [position.id]) == {position.id: 5}
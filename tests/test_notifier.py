@@ -0,0 +1,76 @@
+# tests/test_notifier.py
+import asyncio
+from unittest.mock import AsyncMock
+
+from telegram.error import BadRequest, TimedOut
+
+from core.config import settings
+from modules.notifier import DIGEST_SEPARATOR, TRUNCATION_MARKER, Notifier, build_digests
+
+LIMIT = 300
+
+def _header(alerts: int) -> str:
+    return f"📬 *Resumen: {alerts} alertas*" + DIGEST_SEPARATOR
+
+def test_single_alert_is_sent_as_is():
+    assert build_digests(["*hola*"], LIMIT) == [("*hola*", 1)]
+    assert build_digests([], LIMIT) == []
+
+def test_grouping_fills_each_digest_up_to_the_limit():
+    first = "a" * 100
+    # Las dos primeras alertas ocupan exactamente el límite con la cabecera del resumen.
+    second = "b" * (LIMIT - len(_header(2)) - len(first) - len(DIGEST_SEPARATOR))
+    third = "c" * 10
+
+    digests = build_digests([first, second, third], LIMIT)
+
+    assert digests == [(_header(2) + first + DIGEST_SEPARATOR + second, 2), (third, 1)]
+    assert len(digests[0][0]) == LIMIT
+
+def test_oversized_alert_is_truncated_to_fit():
+    long_alert = "*Alerta*\n```" + "\n".join(f"línea {i} con texto" for i in range(100)) + "```\n\\[fin\\]"
+
+    digests = build_digests(["corta", long_alert], LIMIT)
+
+    # Recortada ocupa casi todo el límite, así que va sola en su mensaje.
+    assert digests[0] == ("corta", 1) and digests[1][1] == 1
+    text = digests[1][0]
+    assert len(text) <= LIMIT
+    assert text.endswith(TRUNCATION_MARKER)
+    # El bloque de código recortado queda cerrado.
+    assert text.count("```") % 2 == 0
+    assert all(len(text) <= LIMIT for text, _ in build_digests([long_alert] * 3, LIMIT))
+
+class _FakeBot:
+    def __init__(self, errors):
+        self.errors, self.calls = list(errors), 0
+
+    async def send_message(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+def _deliver(bot) -> Notifier:
+    notifier = Notifier(token=None, chat_id=None)
+    notifier.bot, notifier._outstanding = bot, 1
+    asyncio.run(notifier._deliver("1", "texto", 1))
+    return notifier
+
+def test_bad_request_is_not_retried(monkeypatch):
+    monkeypatch.setattr(settings, "TELEGRAM_CHAT_MESSAGES_PER_SECOND", 1000.0)
+    bot = _FakeBot([BadRequest("Message is too long")])
+
+    notifier = _deliver(bot)
+
+    assert bot.calls == 1
+    assert notifier.stats()["failed_alerts"] == 1 and notifier.stats()["retries"] == 0
+
+def test_transport_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(settings, "TELEGRAM_CHAT_MESSAGES_PER_SECOND", 1000.0)
+    monkeypatch.setattr(asyncio, "sleep", AsyncMock())
+    bot = _FakeBot([TimedOut()])
+
+    notifier = _deliver(bot)
+
+    assert bot.calls == 2
+    assert notifier.stats()["delivered_alerts"] == 1 and notifier.stats()["retries"] == 1
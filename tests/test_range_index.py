@@ -0,0 +1,31 @@
+# tests/test_range_index.py
+from models import Wallet, Position
+from modules.position_sync import untrack_closed_positions
+from modules.range_index import get_range_index
+
+def _position(wallet_id, token_id):
+    return Position(
+        token_id=token_id, wallet_id=wallet_id, pool_address="0xPool", token0_symbol="USDC", token1_symbol="WETH",
+        tick_lower="-100", tick_upper="100",
+    )
+
+def test_positions_missing_from_a_full_scan_leave_the_index(db_session):
+    wallet = Wallet(address="0xwallet", is_active=True)
+    db_session.add(wallet)
+    db_session.flush()
+    open_position, closed_position = _position(wallet.id, 1), _position(wallet.id, 2)
+    db_session.add_all([open_position, closed_position])
+    db_session.commit()
+
+    range_index = get_range_index()
+    assert range_index.rebuild(db_session) == 2
+    range_index.observe_tick("0xpool", 0)
+
+    # El Subgraph solo devolvió la posición 1: la 2 se cerró (liquidez 0).
+    removed = untrack_closed_positions(db_session, [wallet.id], [1])
+
+    assert removed == [closed_position.id]
+    assert range_index.position_ids("0xpool") == [open_position.id]
+    # Un cruce de los límites de la posición retirada ya no produce cambios de rango.
+    assert [flip.position_id for flip in range_index.observe_tick("0xpool", 200)] == [open_position.id]
+    assert untrack_closed_positions(db_session, [wallet.id], [1]) == []